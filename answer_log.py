@@ -0,0 +1,293 @@
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from storage import MAX_LATENCY_MS
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerLog:
+    """Буфер журнала ответов перед таблицей answers.
+
+    record только добавляет строку в память, поэтому обработчик ответа не
+    ждет БД. Фоновый поток записывает накопленные строки одной операцией
+    (writer = Storage.log_answers: COPY в PostgreSQL, executemany в SQLite),
+    когда их набралось batch_size или прошло flush_interval секунд с
+    последней записи. Раз в rollup_interval секунд тот же поток обновляет
+    сводки по пользователям и словам (rollup = Storage.rollup_answers).
+
+    Если запись не удалась, строки остаются в буфере и пишутся в следующий
+    раз; в буфере хранится не больше max_pending строк, самые старые сверх
+    этого отбрасываются. После max_failures неудач подряд пачка пишется
+    половинами до отдельных строк: строки, которые не записываются даже
+    по одной, отбрасываются с ошибкой в логе (счетчик poisoned), остальные
+    записываются. Если не записалась ни одна часть (БД недоступна), пачка
+    возвращается в буфер целиком. При падении процесса теряются строки не
+    старше flush_interval.
+    """
+
+    def __init__(self, writer, rollup=None, batch_size=500, flush_interval=0.5,
+                 rollup_interval=60.0, max_pending=100000, max_failures=3):
+        # writer(rows) -> True/False, rows = [(user_id, word_id, correct, latency_ms, answered_at), ...]
+        self._writer = writer
+        # rollup() -> число учтенных ответов
+        self._rollup = rollup
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.max_pending = max_pending
+        self.max_failures = max_failures
+
+        self._lock = threading.Lock()
+        # Сериализует записи, чтобы строки не уходили в БД не по порядку
+        self._flush_lock = threading.Lock()
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._stopped = False
+        self._next_rollup = time.monotonic() + rollup_interval
+        self._failures = 0  # неудачных записей подряд
+
+        self._counters = {'recorded': 0, 'dropped': 0, 'poisoned': 0, 'flushes': 0, 'flushed_rows': 0,
+                          'flush_errors': 0, 'rollups': 0, 'rolled_up_rows': 0}
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def record(self, user_id, word_id, correct, latency_ms=None):
+        """Добавляет ответ в буфер; в БД он попадет при следующей записи.
+
+        Время ответа вне 0..MAX_LATENCY_MS (пользователь отвлекся, часы
+        сдвинулись) не пишется: в среднее оно все равно не входит, а
+        столбец latency_ms INTEGER переполнился бы через 24 дня.
+        """
+        if latency_ms is not None and not 0 <= latency_ms <= MAX_LATENCY_MS:
+            latency_ms = None
+        row = (user_id, word_id, bool(correct), latency_ms, time.time())
+        with self._lock:
+            self._pending.append(row)
+            self._counters['recorded'] += 1
+            if len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self._counters['dropped'] += 1
+            pending = len(self._pending)
+
+        self._ensure_flusher()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='answer-log-flusher', daemon=True)
+                self._flusher.start()
+                atexit.register(self.stop)
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            if self._rollup is not None and time.monotonic() >= self._next_rollup:
+                self.rollup()
+
+    def flush(self):
+        """Записывает буфер в БД пачками по batch_size. Возвращает False при ошибке записи."""
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if batch is None:
+                    return True
+
+                started = time.monotonic()
+                written = len(batch) if self._write(batch) else 0
+                poisoned = []
+                if self._should_split(written):
+                    written, poisoned = self._write_split(batch)
+                if not self._finish_batch(batch, written, poisoned, started):
+                    return False
+
+    def _take_batch(self):
+        """Следующая пачка из начала буфера или None, если буфер пуст."""
+        with self._lock:
+            if not self._pending:
+                return None
+            count = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    def _should_split(self, written):
+        """Учитывает результат записи пачки. True - после max_failures неудач подряд пора писать ее частями."""
+        if written:
+            self._failures = 0
+            return False
+        self._failures += 1
+        if self._failures < self.max_failures:
+            return False
+        self._failures = 0
+        return True
+
+    def _finish_batch(self, batch, written, poisoned, started):
+        """Обновляет счетчики после записи пачки; незаписанная пачка возвращается в буфер."""
+        elapsed_ms = (time.monotonic() - started) * 1000
+        if not written:
+            # Не записалась ни одна часть: похоже, БД недоступна, а не плохие строки
+            poisoned = []
+        if poisoned:
+            logger.error("Строки журнала ответов не записываются и отброшены: %s", len(poisoned))
+        with self._lock:
+            if not written:
+                self._counters['flush_errors'] += 1
+                # Пачка возвращается в начало буфера, лишнее сверх max_pending отбрасывается
+                self._pending.extendleft(reversed(batch))
+                while len(self._pending) > self.max_pending:
+                    self._pending.popleft()
+                    self._counters['dropped'] += 1
+                return False
+            self._counters['poisoned'] += len(poisoned)
+            self._counters['flushes'] += 1
+            self._counters['flushed_rows'] += written
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+        return True
+
+    def _write(self, rows):
+        try:
+            return self._writer(rows)
+        except Exception as e:
+            logger.error("Ошибка при записи журнала ответов: %s", e)
+            return False
+
+    def _write_split(self, rows):
+        """Пишет rows половинами. Возвращает (записано строк, строки, не записанные и по одной)."""
+        if len(rows) == 1:
+            return 0, list(rows)
+        middle = len(rows) // 2
+        written, poisoned = 0, []
+        for part in (rows[:middle], rows[middle:]):
+            if self._write(part):
+                written += len(part)
+            else:
+                part_written, part_poisoned = self._write_split(part)
+                written += part_written
+                poisoned += part_poisoned
+        return written, poisoned
+
+    def rollup(self):
+        """Обновляет сводки по журналу. Возвращает число учтенных ответов."""
+        self._next_rollup = time.monotonic() + self.rollup_interval
+        try:
+            count = self._rollup()
+        except Exception as e:
+            logger.error("Ошибка при обновлении сводок ответов: %s", e)
+            count = 0
+        return self._rolled_up(count)
+
+    def _rolled_up(self, count):
+        with self._lock:
+            self._counters['rollups'] += 1
+            self._counters['rolled_up_rows'] += count
+        return count
+
+    def stop(self):
+        """Останавливает фоновую запись и записывает оставшиеся строки."""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self):
+        """Возвращает метрики буфера."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._pending)
+            stats['last_flush_ms'] = self._last_flush_ms
+            stats['max_flush_ms'] = self._max_flush_ms
+        return stats
+
+
+class AsyncAnswerLog(AnswerLog):
+    """AnswerLog для asyncio (async_main.py).
+
+    writer и rollup - корутины (AsyncPostgreSQLDatabase); буфер пишет
+    задача цикла событий, а не поток. Пачки, повторы и отбрасывание
+    строк - как в AnswerLog.
+    """
+
+    def __init__(self, writer, rollup=None, **kwargs):
+        super().__init__(writer, rollup, **kwargs)
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while not self._stopped:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._rollup is not None and time.monotonic() >= self._next_rollup:
+                await self.rollup()
+
+    async def flush(self):
+        """Записывает буфер в БД пачками по batch_size. Возвращает False при ошибке записи."""
+        async with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if batch is None:
+                    return True
+
+                started = time.monotonic()
+                written = len(batch) if await self._write(batch) else 0
+                poisoned = []
+                if self._should_split(written):
+                    written, poisoned = await self._write_split(batch)
+                if not self._finish_batch(batch, written, poisoned, started):
+                    return False
+
+    async def _write(self, rows):
+        try:
+            return await self._writer(rows)
+        except Exception as e:
+            logger.error("Ошибка при записи журнала ответов: %s", e)
+            return False
+
+    async def _write_split(self, rows):
+        if len(rows) == 1:
+            return 0, list(rows)
+        middle = len(rows) // 2
+        written, poisoned = 0, []
+        for part in (rows[:middle], rows[middle:]):
+            if await self._write(part):
+                written += len(part)
+            else:
+                part_written, part_poisoned = await self._write_split(part)
+                written += part_written
+                poisoned += part_poisoned
+        return written, poisoned
+
+    async def rollup(self):
+        """Обновляет сводки по журналу. Возвращает число учтенных ответов."""
+        self._next_rollup = time.monotonic() + self.rollup_interval
+        try:
+            count = await self._rollup()
+        except Exception as e:
+            logger.error("Ошибка при обновлении сводок ответов: %s", e)
+            count = 0
+        return self._rolled_up(count)
+
+    async def stop(self):
+        """Останавливает фоновую запись и записывает оставшиеся строки."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            await self._flusher
+        await self.flush()
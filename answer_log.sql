@@ -0,0 +1,109 @@
+-- Миграция 6: журнал ответов и сводки по нему.
+-- answers пишется пачками из AnswerLog (answer_log.py) через COPY. Функция
+-- rollup_answers периодически переносит новые строки журнала в сводки
+-- user_answer_stats и word_answer_stats, из которых читают /stats и выбор
+-- слабых слов; сам журнал при этом не просматривается.
+
+CREATE TABLE IF NOT EXISTS answers (
+    answer_id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    word_id INTEGER NOT NULL,
+    correct BOOLEAN NOT NULL,
+    latency_ms INTEGER,
+    answered_at TIMESTAMPTZ NOT NULL,
+    -- Время вставки: rollup_answers не берет слишком свежие строки, чтобы
+    -- не пропустить пачку, которая получила меньшие answer_id, но еще не
+    -- зафиксирована
+    logged_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE TABLE IF NOT EXISTS user_answer_stats (
+    user_id BIGINT PRIMARY KEY,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    latency_ms_total BIGINT NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    last_answered_at TIMESTAMPTZ
+);
+
+CREATE TABLE IF NOT EXISTS word_answer_stats (
+    user_id BIGINT NOT NULL,
+    word_id INTEGER NOT NULL,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    latency_ms_total BIGINT NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    last_answered_at TIMESTAMPTZ,
+    PRIMARY KEY (user_id, word_id)
+);
+
+-- Последний answer_id, учтенный в сводках (одна строка)
+CREATE TABLE IF NOT EXISTS answer_rollup_state (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    last_answer_id BIGINT NOT NULL DEFAULT 0,
+    rolled_up_at TIMESTAMPTZ
+);
+INSERT INTO answer_rollup_state DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- Учитывает в сводках строки answers после последней учтенной, вставленные
+-- раньше p_lag_seconds секунд назад, но не больше p_max_rows. Блокировка
+-- строки answer_rollup_state не дает процессам учесть строки дважды.
+-- Время ответа дольше 5 минут в среднее не входит (storage.MAX_LATENCY_MS)
+CREATE OR REPLACE FUNCTION rollup_answers(p_lag_seconds INTEGER, p_max_rows INTEGER)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_from BIGINT;
+    v_to BIGINT;
+    v_count INTEGER;
+BEGIN
+    SELECT last_answer_id INTO v_from FROM answer_rollup_state FOR UPDATE;
+
+    SELECT MAX(answer_id), COUNT(*) INTO v_to, v_count
+    FROM (
+        SELECT answer_id
+        FROM answers
+        WHERE answer_id > v_from AND logged_at < clock_timestamp() - make_interval(secs => p_lag_seconds)
+        ORDER BY answer_id
+        LIMIT p_max_rows
+    ) batch;
+    IF v_to IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO word_answer_stats AS s (user_id, word_id, answers, correct, latency_ms_total, latency_count,
+                                        last_answered_at)
+    SELECT user_id, word_id, COUNT(*), COUNT(*) FILTER (WHERE correct),
+           COALESCE(SUM(latency_ms) FILTER (WHERE latency_ms <= 300000), 0),
+           COUNT(latency_ms) FILTER (WHERE latency_ms <= 300000),
+           MAX(answered_at)
+    FROM answers
+    WHERE answer_id > v_from AND answer_id <= v_to
+    GROUP BY user_id, word_id
+    ON CONFLICT (user_id, word_id) DO UPDATE
+    SET answers = s.answers + EXCLUDED.answers,
+        correct = s.correct + EXCLUDED.correct,
+        latency_ms_total = s.latency_ms_total + EXCLUDED.latency_ms_total,
+        latency_count = s.latency_count + EXCLUDED.latency_count,
+        last_answered_at = GREATEST(s.last_answered_at, EXCLUDED.last_answered_at);
+
+    INSERT INTO user_answer_stats AS s (user_id, answers, correct, latency_ms_total, latency_count,
+                                        last_answered_at)
+    SELECT user_id, COUNT(*), COUNT(*) FILTER (WHERE correct),
+           COALESCE(SUM(latency_ms) FILTER (WHERE latency_ms <= 300000), 0),
+           COUNT(latency_ms) FILTER (WHERE latency_ms <= 300000),
+           MAX(answered_at)
+    FROM answers
+    WHERE answer_id > v_from AND answer_id <= v_to
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET answers = s.answers + EXCLUDED.answers,
+        correct = s.correct + EXCLUDED.correct,
+        latency_ms_total = s.latency_ms_total + EXCLUDED.latency_ms_total,
+        latency_count = s.latency_count + EXCLUDED.latency_count,
+        last_answered_at = GREATEST(s.last_answered_at, EXCLUDED.last_answered_at);
+
+    UPDATE answer_rollup_state SET last_answer_id = v_to, rolled_up_at = CURRENT_TIMESTAMP;
+    RETURN v_count;
+END;
+$$;
@@ -0,0 +1,79 @@
+-- Миграция 7: число ответов только в сводке user_answer_stats.
+-- Ответы считались дважды: счетчиками users.answers_total/answers_correct
+-- (record_answer) и сводкой по журналу answers (rollup_answers). /stats
+-- теперь читает сводку, а ответы до появления журнала (миграция 6), которые
+-- есть только в счетчиках, переносятся в нее; счетчики удаляются.
+
+-- Разница между счетчиками и всеми строками журнала (учтенными в сводке или
+-- еще нет) - ответы, данные до журнала
+INSERT INTO user_answer_stats AS s (user_id, answers, correct)
+SELECT u.user_id,
+       u.answers_total - COALESCE(j.answers, 0),
+       GREATEST(u.answers_correct - COALESCE(j.correct, 0), 0)
+FROM users u
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS answers, COUNT(*) FILTER (WHERE correct) AS correct
+    FROM answers
+    GROUP BY user_id
+) j ON j.user_id = u.user_id
+WHERE u.answers_total > COALESCE(j.answers, 0)
+ON CONFLICT (user_id) DO UPDATE
+SET answers = s.answers + EXCLUDED.answers,
+    correct = s.correct + EXCLUDED.correct;
+
+CREATE OR REPLACE FUNCTION record_answer(p_user_id BIGINT, p_word_id INTEGER, p_correct BOOLEAN)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_quality INTEGER := CASE WHEN p_correct THEN 4 ELSE 1 END;
+BEGIN
+    UPDATE users
+    SET streak_days = s.streak_days,
+        best_streak_days = GREATEST(best_streak_days, s.streak_days),
+        last_studied_on = CURRENT_DATE
+    FROM (
+        SELECT CASE
+                   WHEN last_studied_on = CURRENT_DATE THEN streak_days
+                   WHEN last_studied_on = CURRENT_DATE - 1 THEN streak_days + 1
+                   ELSE 1
+               END AS streak_days
+        FROM users WHERE user_id = p_user_id
+    ) s
+    WHERE users.user_id = p_user_id;
+
+    IF p_word_id IS NULL
+       OR NOT EXISTS (SELECT 1 FROM user_deck d WHERE d.user_id = p_user_id AND d.word_id = p_word_id) THEN
+        RETURN;
+    END IF;
+
+    -- Базовое слово получает собственную строку при первом ответе
+    INSERT INTO user_words (user_id, word_id) VALUES (p_user_id, p_word_id)
+    ON CONFLICT (user_id, word_id) DO NOTHING;
+
+    UPDATE user_words uw
+    SET correct_count = uw.correct_count + p_correct::INTEGER,
+        wrong_count = uw.wrong_count + (NOT p_correct)::INTEGER,
+        ease = r.ease,
+        interval_days = r.interval_days,
+        repetitions = r.repetitions,
+        due_at = CURRENT_TIMESTAMP + CASE
+            WHEN p_correct THEN r.interval_days * INTERVAL '1 day'
+            ELSE INTERVAL '10 minutes'
+        END
+    FROM (
+        SELECT GREATEST(1.3, ease + 0.1 - (5 - v_quality) * (0.08 + (5 - v_quality) * 0.02)) AS ease,
+               CASE
+                   WHEN NOT p_correct THEN 0
+                   WHEN repetitions = 0 THEN 1
+                   WHEN repetitions = 1 THEN 6
+                   ELSE interval_days * GREATEST(1.3, ease + 0.1 - (5 - v_quality) * (0.08 + (5 - v_quality) * 0.02))
+               END AS interval_days,
+               CASE WHEN p_correct THEN repetitions + 1 ELSE 0 END AS repetitions
+        FROM user_words
+        WHERE user_id = p_user_id AND word_id = p_word_id
+    ) r
+    WHERE uw.user_id = p_user_id AND uw.word_id = p_word_id;
+END;
+$$;
+
+ALTER TABLE users DROP COLUMN IF EXISTS answers_total, DROP COLUMN IF EXISTS answers_correct;
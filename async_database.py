@@ -0,0 +1,636 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+import asyncpg
+import psycopg2.extensions
+
+import migrations
+from config import DATABASE_URL
+from database import (ANSWER_ROLLUP_LAG, DB_POOL_MAX_SIZE, DB_POOL_MIN_SIZE, DB_POOL_TIMEOUT, DISTRACTOR_NEIGHBORS,
+                      SAMPLER_MAX_USERS, SAMPLER_TTL, WORD_COUNT_CACHE_SIZE, WORD_COUNT_CACHE_TTL, statements)
+from distractors import DistractorIndex
+from observability import DB_LATENCY, timed
+from storage import build_questions
+from ttl_cache import TTLCache
+from user_state import UserState
+from word_sampler import WordSampler
+
+logger = logging.getLogger(__name__)
+
+
+def pool_connect_args(dsn):
+    """Параметры подключения asyncpg.create_pool для DATABASE_URL.
+
+    URL (postgresql://...) передается как есть; строку libpq вида
+    "host=... dbname=...", которую принимает psycopg2, asyncpg не
+    разбирает, поэтому она раскладывается на параметры.
+    """
+    if '://' in dsn:
+        return {'dsn': dsn}
+    params = psycopg2.extensions.parse_dsn(dsn)
+    if 'dbname' in params:
+        params['database'] = params.pop('dbname')
+    if 'port' in params:
+        params['port'] = int(params['port'])
+    return {key: params[key] for key in ('host', 'port', 'user', 'password', 'database') if key in params}
+
+
+def _row_count(status):
+    """Число строк из статуса команды asyncpg ('INSERT 0 5', 'COPY 5')."""
+    return int(status.split()[-1])
+
+
+class AsyncPostgreSQLDatabase:
+    """Асинхронный аналог PostgreSQLDatabase на пуле asyncpg (для async_main.py).
+
+    Методы совпадают с PostgreSQLDatabase, но являются корутинами; SQL тот
+    же (statements.sql), asyncpg сам готовит частые выражения на каждом
+    соединении. Кэши словарей, счетчиков слов и индекс неверных вариантов
+    свои: словарь для WordSampler загружается запросом в этом же
+    соединении (begin_load/finish_load), а индекс строится в фоне при
+    check_and_init_database из слов, прочитанных через asyncpg.
+    """
+    _pool = None
+    _pool_lock = None
+    _sampler = None
+    _distractors = None
+    _schema_ready = False
+    _word_counts = TTLCache(max_size=WORD_COUNT_CACHE_SIZE, ttl=WORD_COUNT_CACHE_TTL)
+    # Функции вида f(user_id), вызываемые при изменении словаря пользователя
+    word_change_listeners = []
+
+    # Метрики ожидания соединения
+    _checkouts = 0
+    _waits = 0
+    _wait_total = 0.0
+    _wait_max = 0.0
+    _timeouts = 0
+
+    @classmethod
+    async def _init_connection(cls, conn):
+        # Аналог set_client_encoding('UTF8') в синхронном пуле
+        await conn.execute("SET client_encoding TO 'UTF8'")
+
+    @classmethod
+    async def get_pool(cls):
+        """Возвращает пул соединений, создавая его при первом обращении"""
+        if cls._pool is None:
+            if cls._pool_lock is None:
+                cls._pool_lock = asyncio.Lock()
+            async with cls._pool_lock:
+                if cls._pool is None:
+                    cls._pool = await asyncpg.create_pool(
+                        min_size=DB_POOL_MIN_SIZE,
+                        max_size=DB_POOL_MAX_SIZE,
+                        init=cls._init_connection,
+                        **pool_connect_args(DATABASE_URL),
+                    )
+        return cls._pool
+
+    @classmethod
+    async def acquire(cls):
+        """Берет соединение из пула с учетом времени ожидания"""
+        pool = await cls.get_pool()
+        started = time.monotonic()
+        try:
+            conn = await pool.acquire(timeout=DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            cls._timeouts += 1
+            logger.error("Нет свободного соединения с базой данных за %s с", DB_POOL_TIMEOUT)
+            raise
+        except Exception as e:
+            logger.error("Ошибка подключения к базе данных: %s", e)
+            raise
+        wait_time = time.monotonic() - started
+        cls._checkouts += 1
+        if wait_time > 0.001:
+            cls._waits += 1
+        cls._wait_total += wait_time
+        cls._wait_max = max(cls._wait_max, wait_time)
+        return conn
+
+    @classmethod
+    async def release(cls, conn):
+        """Возвращает соединение в пул"""
+        await cls._pool.release(conn)
+
+    @classmethod
+    def pool_stats(cls):
+        """Возвращает метрики пула соединений (ключи как у db_pool.ConnectionPool.stats)"""
+        pool = cls._pool
+        size = pool.get_size() if pool else 0
+        idle = pool.get_idle_size() if pool else 0
+        return {
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'checkouts': cls._checkouts,
+            'waits': cls._waits,
+            'wait_avg_ms': (cls._wait_total / cls._checkouts * 1000) if cls._checkouts else 0.0,
+            'wait_max_ms': cls._wait_max * 1000,
+            'timeouts': cls._timeouts,
+        }
+
+    @classmethod
+    async def close_pool(cls):
+        """Закрывает все соединения пула (при остановке бота)"""
+        if cls._pool is not None:
+            await cls._pool.close()
+            cls._pool = None
+
+    @classmethod
+    def get_sampler(cls):
+        """Возвращает движок выбора случайных слов (словарь загружает _deck)"""
+        if cls._sampler is None:
+            cls._sampler = WordSampler(None, max_users=SAMPLER_MAX_USERS, ttl=SAMPLER_TTL)
+        return cls._sampler
+
+    @classmethod
+    async def _deck(cls, conn, user_id):
+        """Массив word_id словаря пользователя и его множество (из кэша или одним запросом)"""
+        sampler = cls.get_sampler()
+        word_ids = sampler.peek(user_id)
+        if word_ids is None:
+            seq = sampler.begin_load(user_id)
+            rows = await conn.fetch(statements.sql('deck_word_ids'), user_id)
+            word_ids = sampler.finish_load(user_id, seq, [row[0] for row in rows])
+        return word_ids, sampler.get_word_set(user_id, word_ids)
+
+    @classmethod
+    def get_distractors(cls):
+        """Возвращает индекс похожих слов для неверных вариантов ответа"""
+        if cls._distractors is None:
+            cls._distractors = DistractorIndex(neighbors=DISTRACTOR_NEIGHBORS)
+        return cls._distractors
+
+    @classmethod
+    async def _build_distractors(cls):
+        """Читает все слова и строит DistractorIndex в фоновом потоке индекса"""
+        conn = await cls.acquire()
+        try:
+            rows = [tuple(row) for row in await conn.fetch("SELECT word_id, english_word, added_by IS NULL FROM words")]
+        finally:
+            await cls.release(conn)
+        cls.get_distractors().refresh(lambda: rows)
+
+    @classmethod
+    def _words_changed(cls, user_id):
+        """Сбрасывает кэши, зависящие от словаря пользователя"""
+        cls.get_sampler().invalidate(user_id)
+        cls._word_counts.invalidate(user_id)
+        for listener in cls.word_change_listeners:
+            listener(user_id)
+
+    @classmethod
+    async def execute_sql_file(cls, filename):
+        """Выполняет SQL файл в одной транзакции"""
+        conn = await cls.acquire()
+        try:
+            async with conn.transaction():
+                await conn.execute(migrations.read_sql(filename))
+            logger.info("SQL файл %s выполнен успешно", filename)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при выполнении SQL файла %s: %s", filename, e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def check_and_init_database(cls):
+        """Применяет недостающие миграции (см. PostgreSQLDatabase.check_and_init_database) и строит индекс вариантов"""
+        if cls._schema_ready:
+            return
+
+        started = time.perf_counter()
+        conn = await cls.acquire()
+        try:
+            applied = await migrations.migrate_async(conn)
+        except Exception as e:
+            logger.error("Ошибка при проверке базы данных: %s", e)
+            raise
+        finally:
+            await cls.release(conn)
+
+        cls._schema_ready = True
+        logger.info("Схема БД: версия %s (применено миграций: %s), проверка за %.1f мс",
+                    migrations.LATEST_VERSION, len(applied), (time.perf_counter() - started) * 1000)
+        try:
+            await cls._build_distractors()
+        except Exception as e:
+            logger.error("Ошибка при построении индекса неверных вариантов: %s", e)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def register_user(cls, user_id, username, first_name):
+        """Регистрирует нового пользователя в базе данных."""
+        conn = await cls.acquire()
+        try:
+            await conn.execute(statements.sql('register_user'), user_id, username, first_name)
+            # Базовые слова не копируются: они видны пользователю через user_deck
+            return True
+        except Exception as e:
+            logger.error("Ошибка при регистрации пользователя: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def prefetch_questions(cls, user_id, count, exclude=()):
+        """Следующие count вопросов пользователя одним запросом (см. Storage.prefetch_questions)."""
+        conn = await cls.acquire()
+        try:
+            # Случайные слова и неверные варианты выбираются в памяти по массиву word_id
+            word_ids, deck = await cls._deck(conn, user_id)
+            sample = cls.get_sampler().sample_from(word_ids, count * 4)
+            rows = await conn.fetch(statements.sql('prefetch_questions'), user_id, count, list(exclude), sample)
+
+            due_rows = [tuple(row[:3]) for row in rows if row[3] == 0]
+            weak_rows = [tuple(row[:3]) for row in rows if row[3] == 1]
+            sampled = {row[0]: tuple(row[:3]) for row in rows if row[3] == 2}
+            if len(sampled) < len(sample):
+                # В кэше есть удаленные слова
+                cls.get_sampler().invalidate(user_id)
+            sampled_rows = [sampled[word_id] for word_id in sample if word_id in sampled]
+            return build_questions(due_rows, sampled_rows, count, exclude, cls.get_distractors().chooser(deck),
+                                   weak_rows)
+        except Exception as e:
+            logger.error("Ошибка при выборе следующих вопросов: %s", e)
+            return []
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def record_answer(cls, user_id, word_id, was_correct):
+        """Записывает ответ пользователя (SQL-функция record_answer)."""
+        conn = await cls.acquire()
+        try:
+            await conn.execute(statements.sql('record_answer'), user_id, word_id, was_correct)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при записи ответа: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def log_answers(cls, rows):
+        """Добавляет пачку ответов в журнал answers одним COPY (см. Storage.log_answers)."""
+        if not rows:
+            return True
+        conn = await cls.acquire()
+        try:
+            await conn.copy_records_to_table(
+                'answers',
+                records=[(user_id, word_id, correct, latency_ms, datetime.fromtimestamp(answered_at, timezone.utc))
+                         for user_id, word_id, correct, latency_ms, answered_at in rows],
+                columns=['user_id', 'word_id', 'correct', 'latency_ms', 'answered_at']
+            )
+            return True
+        except Exception as e:
+            logger.error("Ошибка при записи журнала ответов: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def rollup_answers(cls, max_rows=50000):
+        """Переносит новые строки журнала в сводки (SQL-функция rollup_answers)."""
+        conn = await cls.acquire()
+        try:
+            return await conn.fetchval(statements.sql('rollup_answers'), ANSWER_ROLLUP_LAG, max_rows)
+        except Exception as e:
+            logger.error("Ошибка при обновлении сводок ответов: %s", e)
+            return 0
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def get_weak_words(cls, user_id, limit=3):
+        """Слабые слова пользователя по word_answer_stats (см. Storage.get_weak_words)."""
+        conn = await cls.acquire()
+        try:
+            return [tuple(row) for row in await conn.fetch(statements.sql('weak_words'), user_id, limit)]
+        except Exception as e:
+            logger.error("Ошибка при выборе слабых слов: %s", e)
+            return []
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def reschedule_deck(cls, user_id, per_day=50):
+        """Распределяет просроченные слова пользователя по дням (см. PostgreSQLDatabase.reschedule_deck)."""
+        import numpy as np
+        import srs
+
+        conn = await cls.acquire()
+        try:
+            rows = await conn.fetch('''
+                SELECT word_id, EXTRACT(EPOCH FROM due_at), EXTRACT(EPOCH FROM LOCALTIMESTAMP)
+                FROM user_words
+                WHERE user_id = $1
+            ''', user_id)
+            if not rows:
+                return 0
+
+            word_ids = np.array([row[0] for row in rows])
+            due_at = np.array([float(row[1]) for row in rows])
+            new_due_at = srs.spread_overdue(due_at, float(rows[0][2]), per_day)
+            changed = np.flatnonzero(new_due_at != due_at)
+            if not changed.size:
+                return 0
+
+            # due_at хранится без часового пояса, поэтому эпоха считается в UTC в обе стороны
+            await conn.execute('''
+                UPDATE user_words SET due_at = to_timestamp(v.due_at) AT TIME ZONE 'UTC'
+                FROM unnest($2::integer[], $3::double precision[]) AS v(word_id, due_at)
+                WHERE user_words.user_id = $1 AND user_words.word_id = v.word_id
+            ''', user_id, word_ids[changed].tolist(), new_due_at[changed].tolist())
+            return len(changed)
+        except Exception as e:
+            logger.error("Ошибка при пересчете расписания повторений: %s", e)
+            return 0
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def get_user_words(cls, user_id):
+        """Получает список слов для конкретного пользователя."""
+        conn = await cls.acquire()
+        try:
+            rows = await conn.fetch('''
+                SELECT w.word_id, w.english_word, w.russian_translation
+                FROM words w
+                INNER JOIN user_deck d ON w.word_id = d.word_id
+                WHERE d.user_id = $1
+                ORDER BY w.english_word
+            ''', user_id)
+            return [(row[0], row[1], row[2]) for row in rows]
+        except Exception as e:
+            logger.error("Ошибка при получении слов пользователя: %s", e)
+            return []
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def get_user_words_page(cls, user_id, after_word=None, limit=10):
+        """Получает страницу слов пользователя по алфавиту, начиная после after_word."""
+        conn = await cls.acquire()
+        try:
+            rows = await conn.fetch(statements.sql('user_words_page'), user_id, after_word or '', limit)
+            return [(row[0], row[1], row[2]) for row in rows]
+        except Exception as e:
+            logger.error("Ошибка при получении страницы слов пользователя: %s", e)
+            return []
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def add_word_to_db(cls, user_id, english_word, russian_translation):
+        """Добавляет новое слово в БД и связывает с пользователем."""
+        conn = await cls.acquire()
+        try:
+            async with conn.transaction():
+                word_id = created_id = await conn.fetchval(statements.sql('insert_word'),
+                                                           english_word, russian_translation, user_id)
+                if word_id is None:
+                    # Если слово уже существует, получаем его ID
+                    word_id = await conn.fetchval(statements.sql('word_id_by_english'), english_word)
+                    if word_id is not None:
+                        # Базовое слово могло быть скрыто пользователем раньше
+                        await conn.execute(statements.sql('unhide_word'), user_id, word_id)
+                if word_id is not None:
+                    # Связываем слово с пользователем
+                    await conn.execute(statements.sql('link_word'), user_id, word_id)
+                await conn.execute(statements.sql('refresh_word_count'), user_id)
+            if created_id is not None:
+                cls.get_distractors().add(created_id, english_word)
+            cls._words_changed(user_id)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при добавлении слова: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def import_words(cls, user_id, rows):
+        """Массово добавляет слова пользователю (см. PostgreSQLDatabase.import_words).
+
+        rows - итератор пар (english_word, russian_translation); строки
+        уходят в COPY по мере чтения. Возвращает (staged, inserted) или None.
+        """
+        conn = await cls.acquire()
+        try:
+            async with conn.transaction():
+                await conn.execute('''
+                    CREATE TEMP TABLE import_staging (
+                        line_no INTEGER NOT NULL,
+                        english_word TEXT NOT NULL,
+                        russian_translation TEXT NOT NULL
+                    ) ON COMMIT DROP
+                ''')
+                staged = _row_count(await conn.copy_records_to_table(
+                    'import_staging',
+                    records=((line_no, english_word, russian_translation)
+                             for line_no, (english_word, russian_translation) in enumerate(rows, 1)),
+                    columns=['line_no', 'english_word', 'russian_translation']
+                ))
+
+                # Новые слова; при повторе слова в файле берется первый перевод
+                created_words = await conn.fetch('''
+                    INSERT INTO words (english_word, russian_translation, added_by)
+                    SELECT DISTINCT ON (english_word) english_word, russian_translation, $1::bigint
+                    FROM import_staging
+                    ORDER BY english_word, line_no
+                    ON CONFLICT (english_word) DO NOTHING
+                    RETURNING word_id, english_word
+                ''', user_id)
+
+                # Связываем с пользователем слова файла, которых еще нет в его словаре,
+                # включая уже существовавшие в words и скрытые базовые
+                inserted = _row_count(await conn.execute('''
+                    INSERT INTO user_words (user_id, word_id)
+                    SELECT $1, w.word_id
+                    FROM (SELECT DISTINCT english_word FROM import_staging) s
+                    INNER JOIN words w ON w.english_word = s.english_word
+                    WHERE NOT EXISTS (SELECT 1 FROM user_deck d WHERE d.user_id = $1 AND d.word_id = w.word_id)
+                    ON CONFLICT (user_id, word_id) DO NOTHING
+                ''', user_id))
+
+                # Базовые слова из файла снова видны пользователю
+                await conn.execute('''
+                    DELETE FROM user_hidden_words h
+                    USING import_staging s, words w
+                    WHERE h.user_id = $1 AND w.english_word = s.english_word AND h.word_id = w.word_id
+                ''', user_id)
+
+                await conn.execute(statements.sql('refresh_word_count'), user_id)
+            cls.get_distractors().add_many(
+                (word_id, english_word, False) for word_id, english_word in created_words)
+            cls._words_changed(user_id)
+            return staged, inserted
+        except Exception as e:
+            logger.error("Ошибка при импорте слов: %s", e)
+            return None
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def delete_word_from_user(cls, user_id, word_id):
+        """Удаляет связь пользователь-слово."""
+        conn = await cls.acquire()
+        try:
+            async with conn.transaction():
+                word = await conn.fetchrow(statements.sql('word_added_by'), word_id)
+                added_by = word[0] if word else None
+                await conn.execute(statements.sql('unlink_word'), user_id, word_id)
+
+                affected_users = []
+                if added_by == user_id:
+                    # Слово пропадет и у других пользователей, которые его добавили:
+                    # их счетчики будут пересчитаны при следующем чтении
+                    affected_users = [row[0] for row in await conn.fetch(statements.sql('reset_word_counts'), word_id)]
+                    await conn.execute(statements.sql('delete_word'), word_id)
+                elif added_by is None and word:
+                    # Общее базовое слово не удаляется, а скрывается для пользователя
+                    await conn.execute(statements.sql('hide_word'), user_id, word_id)
+
+                await conn.execute(statements.sql('refresh_word_count'), user_id)
+            if added_by == user_id:
+                cls.get_distractors().remove(word_id)
+            cls._words_changed(user_id)
+            for other_user_id in affected_users:
+                cls._words_changed(other_user_id)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при удалении слова: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def get_word_count(cls, user_id):
+        """Возвращает количество слов у пользователя (из кэша или users.word_count)."""
+        count = cls._word_counts.get(user_id)
+        if count is not None:
+            return count
+
+        conn = await cls.acquire()
+        try:
+            row = await conn.fetchrow(statements.sql('word_count'), user_id)
+            if row is None:
+                return 0
+            count = row[0]
+            if count is None:
+                count = await conn.fetchval(statements.sql('refresh_word_count'), user_id)
+            cls._word_counts.set(user_id, count)
+            return count
+        except Exception as e:
+            logger.error("Ошибка при получении количества слов: %s", e)
+            return 0
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def get_stats(cls, user_id):
+        """Возвращает статистику пользователя (словарь как у PostgreSQLDatabase.get_stats) или None."""
+        conn = await cls.acquire()
+        try:
+            row = await conn.fetchrow(statements.sql('user_stats'), user_id)
+            if row is None:
+                return None
+
+            word_count, answers_total, answers_correct, streak_days, best_streak_days, due_count, avg_latency_ms = row
+            if word_count is None:
+                word_count = await conn.fetchval(statements.sql('refresh_word_count'), user_id)
+            cls._word_counts.set(user_id, word_count)
+
+            return {
+                'word_count': word_count,
+                'answers_total': answers_total,
+                'answers_correct': answers_correct,
+                'accuracy': answers_correct / answers_total if answers_total else None,
+                'streak_days': streak_days,
+                'best_streak_days': best_streak_days,
+                'due_count': due_count,
+                'avg_latency_ms': avg_latency_ms,
+            }
+        except Exception as e:
+            logger.error("Ошибка при получении статистики: %s", e)
+            return None
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def set_user_state(cls, user_id, state):
+        """Устанавливает состояние пользователя (UserState) в БД."""
+        conn = await cls.acquire()
+        try:
+            await conn.execute(statements.sql('set_user_state'), user_id, int(state.mode), state.encode_data())
+            return True
+        except Exception as e:
+            logger.error("Ошибка при установке состояния: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def set_user_states(cls, states):
+        """Устанавливает состояния нескольких пользователей одним запросом."""
+        if not states:
+            return True
+        conn = await cls.acquire()
+        try:
+            await conn.execute('''
+                UPDATE users SET state_mode = v.state_mode, state_data = COALESCE(v.state_data, users.state_data)
+                FROM unnest($1::bigint[], $2::smallint[], $3::bytea[]) AS v(user_id, state_mode, state_data)
+                WHERE users.user_id = v.user_id
+            ''', list(states.keys()), [int(state.mode) for state in states.values()],
+                [state.encode_data() for state in states.values()])
+            return True
+        except Exception as e:
+            logger.error("Ошибка при пакетной установке состояний: %s", e)
+            return False
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def get_user_state(cls, user_id):
+        """Получает состояние пользователя (UserState) из БД."""
+        conn = await cls.acquire()
+        try:
+            row = await conn.fetchrow(statements.sql('get_user_state'), user_id)
+            return UserState.decode(*row) if row else UserState()
+        except Exception as e:
+            logger.error("Ошибка при получении состояния: %s", e)
+            return UserState()
+        finally:
+            await cls.release(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    async def clear_user_state(cls, user_id):
+        """Очищает состояние пользователя в БД."""
+        return await cls.set_user_state(user_id, UserState())
@@ -0,0 +1,423 @@
+"""Обработчики бота для asyncio (async_main.py).
+
+Те же сценарии, что в bot_handlers.py, но обработчики - корутины и ждут
+AsyncPostgreSQLDatabase (asyncpg) напрямую, без пула потоков: пока один
+обработчик ждет БД, цикл событий обслуживает другие обновления. Фоновая
+работа (пополнение очереди вопросов, запись ответов и журнала, показ
+следующего слова, пересчет расписания) - задачи того же цикла событий.
+Тексты и клавиатуры - общие, из templates.py.
+"""
+import asyncio
+import io
+import logging
+import tempfile
+import time
+
+import aiohttp
+
+import config
+import templates
+from answer_log import AsyncAnswerLog
+from async_database import AsyncPostgreSQLDatabase
+from scheduler import AsyncDelayedTaskScheduler
+from state_cache import AsyncUserStateCache
+from study_queue import AsyncStudyQueue
+from ttl_cache import TTLCache
+from user_state import Mode, UserState
+from word_import import ImportStats, is_valid_english_word, iter_word_rows
+from word_pages import AsyncWordPageCache
+
+logger = logging.getLogger(__name__)
+
+# Асинхронный режим работает только с PostgreSQL (DATABASE_URL)
+database = AsyncPostgreSQLDatabase
+
+# Кэш состояний пользователей; запись сразу в БД (write_through)
+state_cache = AsyncUserStateCache(
+    database,
+    max_size=getattr(config, 'STATE_CACHE_SIZE', 10000),
+    ttl=getattr(config, 'STATE_CACHE_TTL', 600.0),
+)
+
+# Очередь исходящих вызовов Bot API (OutboundSender) и AsyncTeleBot
+# (для ссылок на файлы): задаются в async_main.py
+outbox = None
+bot = None
+
+# Пауза перед следующим словом при изучении (в секундах)
+STUDY_NEXT_DELAY = getattr(config, 'STUDY_NEXT_DELAY', 2.0)
+
+# Отложенный показ следующего слова, ключ задачи - user_id
+study_scheduler = AsyncDelayedTaskScheduler(name='study-next')
+
+# Следующие вопросы каждого изучающего пользователя загружаются заранее,
+# ответы записываются в БД в фоне
+study_queue = AsyncStudyQueue(
+    database.prefetch_questions,
+    database.record_answer,
+    size=getattr(config, 'STUDY_PREFETCH_SIZE', 5),
+    low_water=getattr(config, 'STUDY_PREFETCH_LOW', 2),
+    max_users=getattr(config, 'STUDY_PREFETCH_USERS', 1000),
+)
+database.word_change_listeners.append(study_queue.invalidate)
+
+# Пересчет расписания повторений - как в bot_handlers.py
+RESCHEDULE_DECK_PER_DAY = getattr(config, 'RESCHEDULE_DECK_PER_DAY', 50)
+deck_scheduler = AsyncDelayedTaskScheduler(name='deck-reschedule')
+rescheduled_decks = TTLCache(max_size=getattr(config, 'STUDY_PREFETCH_USERS', 1000),
+                             ttl=getattr(config, 'RESCHEDULE_DECK_INTERVAL', 6 * 3600.0))
+
+# Журнал ответов: пишется в БД пачками в фоне, там же периодически
+# обновляются сводки для /stats и выбора слабых слов
+answer_log = AsyncAnswerLog(
+    database.log_answers,
+    database.rollup_answers,
+    batch_size=getattr(config, 'ANSWER_LOG_BATCH', 500),
+    flush_interval=getattr(config, 'ANSWER_LOG_FLUSH_MS', 500) / 1000,
+    rollup_interval=getattr(config, 'ANSWER_ROLLUP_INTERVAL', 60.0),
+)
+
+# Страницы списка слов для /delete_word, сбрасываются при изменении словаря
+word_pages = AsyncWordPageCache(
+    database.get_user_words_page,
+    page_size=getattr(config, 'DELETE_PAGE_SIZE', 10),
+    max_users=getattr(config, 'DELETE_PAGE_CACHE_USERS', 1000),
+)
+database.word_change_listeners.append(word_pages.invalidate)
+
+# Файл импорта скачивается во временный файл: до IMPORT_SPOOL_SIZE байт в памяти, больше - на диске
+IMPORT_SPOOL_SIZE = getattr(config, 'IMPORT_SPOOL_SIZE', 1024 * 1024)
+
+
+async def get_user_state(user_id):
+    """Возвращает состояние пользователя"""
+    return await state_cache.get(user_id)
+
+
+async def set_user_state(user_id, state):
+    """Устанавливает состояние пользователя"""
+    return await state_cache.set(user_id, state)
+
+
+async def clear_user_state(user_id):
+    """Очищает состояние пользователя"""
+    return await state_cache.clear(user_id)
+
+
+async def send_welcome(message):
+    """Обработчик команды /start."""
+    user_id = message.from_user.id
+
+    study_scheduler.cancel(user_id)
+    await database.register_user(user_id, message.from_user.username, message.from_user.first_name)
+    await clear_user_state(user_id)
+
+    outbox.send_message(message.chat.id, templates.WELCOME_TEXT, parse_mode='HTML')
+
+
+async def start_study(message):
+    """Начинает урок с выбором слова."""
+    user_id = message.from_user.id
+
+    # Следующее слово показывается сейчас, отложенный показ больше не нужен
+    study_scheduler.cancel(user_id)
+    schedule_deck_reschedule(user_id)
+
+    # Вопрос из очереди в памяти; к БД - только если очередь пуста
+    question = await study_queue.pop(user_id)
+    if question is None:
+        await clear_user_state(user_id)
+        outbox.send_message(message.chat.id, templates.EMPTY_DECK_TEXT, parse_mode='HTML')
+        return
+
+    await ask_question(message.chat.id, user_id, question)
+
+
+def schedule_deck_reschedule(user_id):
+    """Ставит пересчет расписания повторений пользователя в фон, если его давно не было."""
+    if rescheduled_decks.get(user_id) is None:
+        rescheduled_decks.set(user_id, True)
+        deck_scheduler.schedule(0, user_id, reschedule_deck, user_id)
+
+
+async def reschedule_deck(user_id):
+    """Распределяет просроченные слова по дням; очередь вопросов загружается заново."""
+    if await database.reschedule_deck(user_id, RESCHEDULE_DECK_PER_DAY):
+        study_queue.invalidate(user_id)
+
+
+async def ask_question(chat_id, user_id, question):
+    """Запоминает загаданное слово и отправляет вопрос."""
+    word_id, text, answer, options = question
+    await set_user_state(user_id, UserState(Mode.STUDY, word_id=word_id, question=text, correct_answer=answer))
+    sent = send_study_question(chat_id, text, options)
+    # Future отправки завершается в потоке outbox; asked_at записывается в цикле событий
+    loop = asyncio.get_running_loop()
+    sent.add_done_callback(
+        lambda future: asyncio.run_coroutine_threadsafe(mark_question_sent(user_id, word_id, future), loop))
+
+
+async def mark_question_sent(user_id, word_id, future):
+    """Записывает asked_at, когда Bot API принял вопрос; если вопрос не ушел, время ответа не считается."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    user_state = await get_user_state(user_id)
+    if user_state.mode == Mode.STUDY and user_state.word_id == word_id and not user_state.asked_at:
+        user_state.asked_at = int(time.time() * 1000)
+        await set_user_state(user_id, user_state)
+
+
+def send_study_question(chat_id, question, options):
+    """Отправляет вопрос с вариантами ответа. Возвращает Future отправки."""
+    return outbox.send_message(chat_id,
+                               templates.question_text(question),
+                               reply_markup=templates.study_keyboard(tuple(options)),
+                               parse_mode='HTML')
+
+
+async def handle_text_message(message):
+    """Обрабатывает все текстовые сообщения."""
+    user_id = message.from_user.id
+    text = message.text.strip()
+
+    current_mode = (await get_user_state(user_id)).mode
+
+    # Обработка команды отмены
+    if text.lower() in templates.CANCEL_TEXTS:
+        await handle_cancel(message)
+        return
+
+    # Обработка в зависимости от режима
+    if current_mode == Mode.IMPORT:
+        outbox.send_message(message.chat.id, templates.IMPORT_WAITING_TEXT, parse_mode='HTML')
+    elif current_mode == Mode.STUDY:
+        await handle_study_answer(message)
+    elif current_mode == Mode.ADD_WORD_STEP1:
+        await handle_add_word_step1(message)
+    elif current_mode == Mode.ADD_WORD_STEP2:
+        await handle_add_word_step2(message)
+    else:
+        # Если не в активном режиме, предлагаем команды
+        outbox.send_message(message.chat.id, templates.NOT_UNDERSTOOD_TEXT, parse_mode='HTML')
+
+
+async def handle_cancel(message):
+    """Обрабатывает отмену операции."""
+    user_id = message.from_user.id
+
+    study_scheduler.cancel(user_id)
+    await clear_user_state(user_id)
+
+    outbox.send_message(message.chat.id,
+                        templates.CANCELLED_TEXT,
+                        reply_markup=templates.MAIN_MENU_KEYBOARD,
+                        parse_mode='HTML')
+
+
+async def handle_study_answer(message):
+    """Обрабатывает ответ во время изучения."""
+    user_id = message.from_user.id
+    user_answer = message.text.strip()
+
+    # Ответ на это слово уже принят, следующее слово еще не показано
+    if study_scheduler.is_pending(user_id):
+        return
+
+    # Ответ проверяется по состоянию в памяти, запись в БД - в фоне
+    user_state = await get_user_state(user_id)
+    correct_answer = user_state.correct_answer
+    was_correct = user_answer == correct_answer
+    study_queue.record_answer(user_id, user_state.word_id, was_correct)
+    if user_state.word_id is not None:
+        latency_ms = int(time.time() * 1000) - user_state.asked_at if user_state.asked_at else None
+        answer_log.record(user_id, user_state.word_id, was_correct, latency_ms)
+
+    if was_correct:
+        response_text = templates.CORRECT_ANSWER_TEXT
+    else:
+        response_text = templates.wrong_answer_text(correct_answer)
+
+    outbox.send_message(message.chat.id, response_text, parse_mode='HTML')
+
+    # Следующее слово показывается после паузы отдельной задачей
+    question = await study_queue.pop(user_id)
+    if question:
+        study_scheduler.schedule(STUDY_NEXT_DELAY, user_id, ask_question, message.chat.id, user_id, question)
+    else:
+        study_scheduler.schedule(STUDY_NEXT_DELAY, user_id, start_study, message)
+
+
+async def add_word_step_1(message):
+    """Начинает процесс добавления слова."""
+    user_id = message.from_user.id
+
+    study_scheduler.cancel(user_id)
+    await set_user_state(user_id, UserState(Mode.ADD_WORD_STEP1))
+
+    outbox.send_message(message.chat.id,
+                        templates.ADD_WORD_PROMPT_TEXT,
+                        reply_markup=templates.CANCEL_KEYBOARD,
+                        parse_mode='HTML')
+
+
+async def handle_add_word_step1(message):
+    """Обрабатывает первый шаг добавления слова."""
+    user_id = message.from_user.id
+    english_word = message.text.strip().lower()
+
+    if not is_valid_english_word(english_word):
+        outbox.send_message(message.chat.id, templates.INVALID_WORD_TEXT, parse_mode='HTML')
+        return
+
+    await set_user_state(user_id, UserState(Mode.ADD_WORD_STEP2, english_word=english_word))
+
+    outbox.send_message(message.chat.id, templates.translation_prompt_text(english_word), parse_mode='HTML')
+
+
+async def handle_add_word_step2(message):
+    """Обрабатывает второй шаг добавления слова."""
+    user_id = message.from_user.id
+    russian_translation = message.text.strip()
+
+    english_word = (await get_user_state(user_id)).english_word
+
+    if not english_word:
+        outbox.send_message(message.chat.id, templates.ADD_WORD_LOST_TEXT, parse_mode='HTML')
+        await clear_user_state(user_id)
+        return
+
+    markup = templates.MAIN_MENU_KEYBOARD
+    if await database.add_word_to_db(user_id, english_word, russian_translation):
+        words_count = await database.get_word_count(user_id)
+        outbox.send_message(message.chat.id,
+                            templates.word_added_text(english_word, words_count),
+                            reply_markup=markup,
+                            parse_mode='HTML')
+    else:
+        outbox.send_message(message.chat.id, templates.ADD_WORD_FAILED_TEXT, reply_markup=markup, parse_mode='HTML')
+
+    await clear_user_state(user_id)
+
+
+async def import_words_start(message):
+    """Начинает импорт слов из файла."""
+    user_id = message.from_user.id
+
+    study_scheduler.cancel(user_id)
+    await set_user_state(user_id, UserState(Mode.IMPORT))
+
+    outbox.send_message(message.chat.id,
+                        templates.IMPORT_PROMPT_TEXT,
+                        reply_markup=templates.CANCEL_KEYBOARD,
+                        parse_mode='HTML')
+
+
+async def download_document(document, target):
+    """Скачивает файл Telegram в target (файловый объект) через aiohttp."""
+    url = await bot.get_file_url(document.file_id)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+        async with session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                target.write(chunk)
+    target.seek(0)
+
+
+async def handle_document(message):
+    """Импортирует слова из присланного CSV/TSV файла."""
+    user_id = message.from_user.id
+
+    if (await get_user_state(user_id)).mode != Mode.IMPORT:
+        outbox.send_message(message.chat.id, templates.IMPORT_NOT_STARTED_TEXT, parse_mode='HTML')
+        return
+
+    document = message.document
+    stats = ImportStats()
+    result = None
+    try:
+        # Сеть не читается из COPY: файл сначала скачивается целиком, строки разбираются из локальной копии
+        with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE) as spool:
+            await download_document(document, spool)
+            text_stream = io.TextIOWrapper(spool, encoding='utf-8-sig', errors='replace', newline='')
+            result = await database.import_words(user_id, iter_word_rows(text_stream, stats, document.file_name or ''))
+    except Exception as e:
+        logger.error("Ошибка при загрузке файла импорта: %s", e, extra={'user_id': user_id})
+
+    await clear_user_state(user_id)
+
+    markup = templates.MAIN_MENU_KEYBOARD
+    if result is None:
+        outbox.send_message(message.chat.id, templates.IMPORT_FAILED_TEXT, reply_markup=markup, parse_mode='HTML')
+        return
+
+    staged, inserted = result
+    words_count = await database.get_word_count(user_id)
+    outbox.send_message(message.chat.id,
+                        templates.import_done_text(staged, inserted, stats.rejected, words_count),
+                        reply_markup=markup,
+                        parse_mode='HTML')
+
+
+async def delete_word_list(message):
+    """Показывает первую страницу слов пользователя для удаления."""
+    page, words, has_next = await word_pages.get_page(message.from_user.id, 0)
+
+    if not words:
+        outbox.send_message(message.chat.id, templates.EMPTY_LIST_TEXT, parse_mode='HTML')
+        return
+
+    outbox.send_message(message.chat.id,
+                        templates.DELETE_PROMPT_TEXT,
+                        reply_markup=templates.delete_keyboard(page, words, has_next),
+                        parse_mode='HTML')
+
+
+async def handle_delete_page(call):
+    """Обрабатывает переход между страницами списка слов."""
+    page, words, has_next = await word_pages.get_page(call.from_user.id, int(call.data.split('_')[1]))
+
+    outbox.answer_callback_query(call.id, chat_id=call.message.chat.id)
+    if not words:
+        outbox.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text=templates.EMPTY_LIST_TEXT,
+            parse_mode='HTML'
+        )
+        return
+
+    outbox.edit_message_reply_markup(
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        reply_markup=templates.delete_keyboard(page, words, has_next)
+    )
+
+
+async def handle_delete_query(call):
+    """Обрабатывает нажатие на кнопку удаления."""
+    word_id = int(call.data.split('_')[1])
+
+    if await database.delete_word_from_user(call.from_user.id, word_id):
+        outbox.answer_callback_query(call.id, templates.WORD_DELETED_ALERT, chat_id=call.message.chat.id)
+        outbox.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text=templates.WORD_DELETED_TEXT,
+            parse_mode='HTML'
+        )
+    else:
+        outbox.answer_callback_query(call.id, templates.WORD_NOT_DELETED_ALERT, chat_id=call.message.chat.id)
+
+
+async def show_stats(message):
+    """Показывает статистику пользователя: слова, точность ответов, серию дней."""
+    user_id = message.from_user.id
+    stats = await database.get_stats(user_id)
+    words_count = stats['word_count'] if stats else 0
+
+    if words_count == 0:
+        outbox.send_message(message.chat.id, templates.EMPTY_STATS_TEXT, parse_mode='HTML')
+        return
+
+    weak_words = await database.get_weak_words(user_id)
+    outbox.send_message(message.chat.id, templates.stats_text(stats, weak_words), parse_mode='HTML')
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+
+# Время запуска процесса: от него считается время старта бота
+STARTED_AT = time.perf_counter()
+
+# Установка UTF-8 кодировки для Windows
+if sys.platform == "win32":
+    os.system('chcp 65001 > nul')
+
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+import config
+from config import BOT_TOKEN
+import async_handlers as handlers
+from observability import HANDLER_LATENCY, metrics, setup_logging, start_metrics_server, timed
+from outbound import OutboundSender
+from storage import storage_scheme
+from update_filter import UpdateFilter, make_async_middleware
+
+logger = logging.getLogger(__name__)
+
+database = handlers.database
+
+# Вариант запуска на asyncio: AsyncTeleBot принимает обновления, обработчики
+# async_handlers ждут AsyncPostgreSQLDatabase (asyncpg) напрямую, поэтому
+# число одновременно обрабатываемых обновлений не ограничено пулом потоков -
+# только пулом соединений с БД (DB_POOL_MAX_SIZE). Нужен PostgreSQL:
+# sqlite:// и memory:// работают только в main.py.
+# Запуск: python async_main.py
+bot = handlers.bot = AsyncTeleBot(BOT_TOKEN)
+
+# Сообщения отправляются через ту же очередь с лимитами Telegram, что и в
+# main.py (вызовы выполняет синхронный TeleBot в потоках OutboundSender)
+outbox = handlers.outbox = OutboundSender(telebot.TeleBot(BOT_TOKEN))
+
+# Повторы и лишние обновления отбрасываются до обработчиков (и запросов к БД)
+update_filter = UpdateFilter()
+bot.setup_middleware(make_async_middleware(update_filter, outbox))
+
+# Блокировки по user_id: сообщения одного пользователя обрабатываются по порядку
+_user_locks = {}
+
+
+async def run_handler(user_id, handler, *args):
+    """Выполняет обработчик из async_handlers по очереди с другими сообщениями пользователя."""
+    entry = _user_locks.get(user_id)
+    if entry is None:
+        entry = _user_locks[user_id] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            await handler(*args)
+    except Exception as e:
+        logger.exception("Ошибка в обработчике %s: %s", handler.__name__, e)
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _user_locks[user_id]
+
+
+# Регистрация обработчиков команд
+@bot.message_handler(commands=['start', 'начать'])
+@timed(HANDLER_LATENCY)
+async def handle_start(message):
+    logger.debug("Команда /start", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.send_welcome, message)
+
+
+@bot.message_handler(commands=['study', 'учить', 'обучение'])
+@timed(HANDLER_LATENCY)
+async def handle_study(message):
+    logger.debug("Команда /study", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.start_study, message)
+
+
+@bot.message_handler(commands=['add_word', 'добавить', 'новое слово'])
+@timed(HANDLER_LATENCY)
+async def handle_add_word(message):
+    logger.debug("Команда /add_word", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.add_word_step_1, message)
+
+
+@bot.message_handler(commands=['delete_word', 'удалить', 'удалить слово'])
+@timed(HANDLER_LATENCY)
+async def handle_delete_word(message):
+    logger.debug("Команда /delete_word", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.delete_word_list, message)
+
+
+@bot.message_handler(commands=['import', 'импорт'])
+@timed(HANDLER_LATENCY)
+async def handle_import(message):
+    logger.debug("Команда /import", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.import_words_start, message)
+
+
+@bot.message_handler(content_types=['document'])
+@timed(HANDLER_LATENCY)
+async def handle_document(message):
+    logger.debug("Документ", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.handle_document, message)
+
+
+@bot.message_handler(commands=['stats', 'статистика', 'слова'])
+@timed(HANDLER_LATENCY)
+async def handle_stats(message):
+    logger.debug("Команда /stats", extra={'user_id': message.from_user.id})
+    await run_handler(message.from_user.id, handlers.show_stats, message)
+
+
+@bot.callback_query_handler(func=lambda call: True)
+@timed(HANDLER_LATENCY)
+async def handle_callback(call):
+    logger.debug("Callback", extra={'user_id': call.from_user.id, 'data': call.data})
+    if call.data.startswith('delete_'):
+        await run_handler(call.from_user.id, handlers.handle_delete_query, call)
+    elif call.data.startswith('delpage_'):
+        await run_handler(call.from_user.id, handlers.handle_delete_page, call)
+    else:
+        outbox.answer_callback_query(call.id, "Неизвестная команда", chat_id=call.message.chat.id)
+
+
+# Обработчик текстовых сообщений (для изучения слов)
+@bot.message_handler(content_types=['text'])
+@timed(HANDLER_LATENCY)
+async def handle_text(message):
+    # Текст сообщения не логируется: это ответы пользователя
+    logger.debug("Текстовое сообщение", extra={'user_id': message.from_user.id, 'length': len(message.text)})
+    if message.text.startswith('/'):
+        await handle_unknown(message)
+    else:
+        await run_handler(message.from_user.id, handlers.handle_text_message, message)
+
+
+# Обработчик неизвестных команд
+@bot.message_handler(func=lambda message: True)
+@timed(HANDLER_LATENCY)
+async def handle_unknown(message):
+    if message.text.startswith('/'):
+        logger.debug("Неизвестная команда", extra={'user_id': message.from_user.id, 'command': message.text.split()[0][:64]})
+        outbox.reply_to(message, "Неизвестная команда. Используйте /start для просмотра доступных команд.")
+
+
+async def initialize_database():
+    # Инициализирует базу данных при запуске бота
+    logger.info("Проверка и инициализация базы данных")
+    started = time.perf_counter()
+    try:
+        await database.check_and_init_database()
+        logger.info("База данных готова к работе за %.1f мс", (time.perf_counter() - started) * 1000)
+        return True
+    except Exception as e:
+        logger.error("Ошибка при инициализации базы данных: %s", e)
+        return False
+
+
+def setup_observability():
+    # Логи через очередь и метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics
+    setup_logging(getattr(config, 'LOG_LEVEL', 'INFO'), getattr(config, 'LOG_FORMAT', 'text'))
+    metrics.register_gauges('db_pool', database.pool_stats)
+    metrics.register_gauges('state_cache', handlers.state_cache.stats)
+    metrics.register_gauges('study_queue', handlers.study_queue.stats)
+    metrics.register_gauges('answer_log', handlers.answer_log.stats)
+    metrics.register_gauges('distractors', database.get_distractors().stats)
+    metrics.register_gauges('update_filter', update_filter.stats)
+    metrics.register_gauges('outbound', outbox.stats)
+
+    port = getattr(config, 'METRICS_PORT', 9108)
+    if port:
+        server = start_metrics_server(getattr(config, 'METRICS_HOST', '127.0.0.1'), port)
+        logger.info("Метрики: http://%s:%s/metrics", *server.server_address[:2])
+
+
+async def main():
+    setup_observability()
+    logger.info("Запуск English Learning Bot (asyncio)")
+
+    if storage_scheme(config.DATABASE_URL) in ('sqlite', 'memory'):
+        logger.error("async_main.py работает только с PostgreSQL, для %s:// запустите main.py",
+                     storage_scheme(config.DATABASE_URL))
+        return 1
+
+    # Инициализация базы данных
+    if not await initialize_database():
+        logger.error("Не удалось инициализировать базу данных. Завершение работы.")
+        return 1
+
+    logger.info("Бот запущен за %.2f с, ожидание сообщений", time.perf_counter() - STARTED_AT)
+
+    try:
+        await bot.infinity_polling()
+    except Exception as e:
+        logger.exception("Ошибка в работе бота: %s", e)
+    finally:
+        await handlers.study_scheduler.stop()
+        await handlers.deck_scheduler.stop()
+        await handlers.study_queue.stop()
+        await handlers.answer_log.stop()
+        outbox.stop()
+        await database.close_pool()
+    return 0
+
+
+# Запуск бота
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,127 @@
+"""Журнал ответов: запись по одному ответу против AnswerLog, сводки против журнала.
+
+На временной базе SQLite (или --url) --users пользователей дают --answers
+ответов на случайные слова базового словаря. Замеряются:
+
+    direct   - log_answers с одной строкой на каждый ответ (INSERT и
+               COMMIT в потоке обработчика);
+    buffered - AnswerLog.record в потоке обработчика; строки пишутся в
+               фоне пачками по --batch, время до записи всех строк - stop().
+
+Затем rollup_answers учитывает журнал в сводках, и сравнивается выбор
+слабых слов пользователя: get_weak_words по word_answer_stats против
+агрегата по сырому журналу answers (только для SQLite).
+
+Запуск (PostgreSQL не нужен):
+    python benchmarks/bench_answer_log.py --users 100 --answers 20000
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from answer_log import AnswerLog  # noqa: E402
+from storage import WEAK_ACCURACY, WEAK_MIN_ANSWERS, open_storage  # noqa: E402
+
+RAW_WEAK_WORDS_SQL = f'''
+    SELECT w.english_word, w.russian_translation, COUNT(*), SUM(a.correct)
+    FROM answers a
+    INNER JOIN words w ON w.word_id = a.word_id
+    WHERE a.user_id = ?
+    GROUP BY a.word_id
+    HAVING COUNT(*) >= {WEAK_MIN_ANSWERS} AND SUM(a.correct) < COUNT(*) * {WEAK_ACCURACY}
+    ORDER BY CAST(SUM(a.correct) AS REAL) / COUNT(*), MAX(a.answered_at)
+    LIMIT 3
+'''
+
+
+def make_answers(users, words, count, seed):
+    rng = random.Random(seed)
+    # У каждого пользователя есть слова, на которые он чаще ошибается
+    hard = {user_id: set(rng.sample(words, 10)) for user_id in users}
+    answers = []
+    for _ in range(count):
+        user_id = rng.choice(users)
+        word_id = rng.choice(words)
+        correct = rng.random() < (0.3 if word_id in hard[user_id] else 0.85)
+        answers.append((user_id, word_id, correct, rng.randint(800, 8000)))
+    return answers
+
+
+def per_call_us(function, rows):
+    started = time.perf_counter()
+    for row in rows:
+        function(*row)
+    return (time.perf_counter() - started) / len(rows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='DATABASE_URL (по умолчанию - временный файл SQLite)')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--answers', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=500, help='строк в одной записи AnswerLog')
+    parser.add_argument('--lookups', type=int, default=500, help='запросов слабых слов')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = None
+    if args.url is None:
+        path = os.path.join(tempfile.mkdtemp(prefix='bench_answer_log_'), 'bench.db')
+        args.url = f'sqlite:///{path}'
+    database = open_storage(args.url)
+    database.check_and_init_database()
+
+    users = list(range(1, args.users + 1))
+    for user_id in users:
+        database.register_user(user_id, None, f'user{user_id}')
+    words = [row[0] for row in database.get_user_words(users[0])]
+    answers = make_answers(users, words, args.answers, args.seed)
+    half = len(answers) // 2
+
+    now = time.time()
+    direct_us = per_call_us(lambda user_id, word_id, correct, latency_ms:
+                            database.log_answers([(user_id, word_id, correct, latency_ms, now)]), answers[:half])
+
+    answer_log = AnswerLog(database.log_answers, batch_size=args.batch)
+    started = time.perf_counter()
+    buffered_us = per_call_us(answer_log.record, answers[half:])
+    answer_log.stop()
+    drained_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rolled_up = database.rollup_answers(max_rows=len(answers))
+    rollup_s = time.perf_counter() - started
+
+    rng = random.Random(args.seed)
+    lookups = [(rng.choice(users),) for _ in range(args.lookups)]
+    rollup_lookup_us = per_call_us(database.get_weak_words, lookups)
+
+    print(f"Пользователей: {args.users}, ответов: {len(answers)}, слов: {len(words)}")
+    print(f"{'запись':>9} {'мкс на ответ в обработчике':>27}")
+    print(f"{'direct':>9} {direct_us:>27.1f}")
+    print(f"{'buffered':>9} {buffered_us:>27.1f}   (все {len(answers) - half} строк записаны за "
+          f"{drained_s * 1000:.0f} мс)")
+    print(answer_log.stats())
+    print(f"сводки: {rolled_up} ответов за {rollup_s * 1000:.0f} мс")
+    print(f"слабые слова по сводкам: {rollup_lookup_us:.1f} мкс на запрос")
+
+    if path is not None:
+        conn = sqlite3.connect(path)
+        raw_lookup_us = per_call_us(lambda user_id: conn.execute(RAW_WEAK_WORDS_SQL, (user_id,)).fetchall(), lookups)
+        conn.close()
+        print(f"слабые слова по журналу: {raw_lookup_us:.1f} мкс на запрос")
+    database.close_pool()
+    if path is not None:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Масштабирование обработки по процессам: cluster.ProcessDispatcher.
+
+Для каждого числа процессов из --processes запускается ProcessDispatcher
+с настоящими обработчиками main.py, фейковым Bot API в каждом процессе
+(apihelper.CUSTOM_REQUEST_SENDER) и хранилищем --database. Затем процесс
+приема раскладывает обновления --users пользователей (/start, /study,
+--answers ответов, /stats, /delete_word) и ждет, пока все они будут
+обработаны. Печатаются пропускная способность и ускорение относительно
+первого варианта.
+
+По умолчанию используется memory://: пользователь закреплен за одним
+процессом, поэтому его данные в памяти этого процесса согласованы, а
+замер не упирается в одну запись SQLite. Обновления отправляются после
+прогрева (по одному /start на пользователя).
+
+Запуск:
+    python benchmarks/bench_cluster.py --processes 1 2 4 --users 400 --answers 10
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cluster import ProcessDispatcher  # noqa: E402
+from load_harness import FIRST_USER_ID, UpdateFactory  # noqa: E402
+
+DATABASE_URL = 'memory://'
+
+
+def setup_worker():
+    """Настройка процесса-обработчика до импорта main."""
+    import config
+    from telebot import apihelper
+    from load_harness import FakeTelegramAPI
+
+    config.DATABASE_URL = os.environ.get('BENCH_CLUSTER_DATABASE', DATABASE_URL)
+    config.METRICS_PORT = 0
+    config.LOG_LEVEL = 'WARNING'
+    config.STUDY_NEXT_DELAY = 0.0
+    # Нагрузка идет от немногих пользователей подряд: лимиты не применяются
+    config.RATE_LIMIT_BURST = float('inf')
+    config.OUTBOUND_CHAT_RATE = config.OUTBOUND_GLOBAL_RATE = 1e9
+    apihelper.CUSTOM_REQUEST_SENDER = FakeTelegramAPI(0)
+
+
+def workload(users, answers):
+    """(прогрев, замер): обновления пользователей вперемешку, каждого - по порядку."""
+    updates = UpdateFactory()
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + users)
+    texts = ['/study'] + [f'ответ {index}' for index in range(answers)] + ['/stats', '/delete_word']
+    warmup = [updates.message(user_id, '/start') for user_id in user_ids]
+    batch = [updates.message(user_id, text) for text in texts for user_id in user_ids]
+    return warmup, batch
+
+
+def run(processes, threads, warmup, batch):
+    dispatcher = ProcessDispatcher(processes, threads, queue_size=len(batch) + len(warmup), setup=setup_worker)
+    dispatcher.start()
+    try:
+        for update in warmup:
+            dispatcher.submit(update)
+        if not dispatcher.join(timeout=120):
+            raise RuntimeError(f"Прогрев не завершился: {dispatcher.stats()}")
+
+        started = time.perf_counter()
+        for update in batch:
+            dispatcher.submit(update)
+        if not dispatcher.join(timeout=600):
+            raise RuntimeError(f"Обработка не завершилась: {dispatcher.stats()}")
+        return time.perf_counter() - started
+    finally:
+        dispatcher.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4, help='потоков в процессе-обработчике')
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--answers', type=int, default=10, help='ответов в /study на пользователя')
+    parser.add_argument('--database', default=DATABASE_URL, help='DATABASE_URL процессов-обработчиков')
+    args = parser.parse_args()
+
+    os.environ['BENCH_CLUSTER_DATABASE'] = args.database
+    warmup, batch = workload(args.users, args.answers)
+    print(f"Пользователей: {args.users}, обновлений: {len(batch)}, потоков в процессе: {args.threads}, "
+          f"хранилище: {args.database}, ядер: {os.cpu_count()}")
+    print(f"{'процессов':>10} {'время с':>8} {'обн./с':>8} {'ускорение':>10}")
+    baseline = None
+    for processes in args.processes:
+        elapsed = run(processes, args.threads, warmup, batch)
+        rate = len(batch) / elapsed
+        baseline = baseline or rate
+        print(f"{processes:>10} {elapsed:>8.2f} {rate:>8.0f} {rate / baseline:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
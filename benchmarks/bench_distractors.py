@@ -0,0 +1,109 @@
+"""Неверные варианты ответа: случайные слова словаря против DistractorIndex.
+
+На --words синтетических словах (из слогов, как английские) замеряются:
+
+    построение      - build одним векторным проходом NumPy;
+    добавление      - add_many пачками по --batch слов после построения;
+    pick            - выбор трех похожих слов для одного вопроса.
+
+Качество вариантов оценивается средним сходством по Левенштейну
+(1 - расстояние / длина большего слова) между правильным ответом и тремя
+неверными вариантами: для случайных слов словаря, как раньше, и для
+индекса. Словарь пользователя - случайные --deck слов и базовый словарь
+(первая 1000 слов).
+
+Запуск (БД не нужна):
+    python benchmarks/bench_distractors.py --words 20000 --deck 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from distractors import DistractorIndex  # noqa: E402
+
+SYLLABLES = ['ba', 'be', 'con', 'de', 'di', 'er', 'for', 'ga', 'in', 'ing', 'ka', 'la', 'le', 'ly',
+             'ma', 'mo', 'na', 'ne', 'or', 'per', 'ra', 're', 'sa', 'ser', 'st', 'ta', 'ter', 'tion',
+             'to', 'un', 've', 'wa']
+
+
+def make_words(count, seed):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def similarity(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return 1 - previous[-1] / max(len(a), len(b))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--words', type=int, default=20000)
+    parser.add_argument('--added', type=int, default=2000, help='слов, добавляемых после построения')
+    parser.add_argument('--batch', type=int, default=100, help='слов в одном add_many')
+    parser.add_argument('--deck', type=int, default=500, help='слов в словаре пользователя')
+    parser.add_argument('--questions', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    words = make_words(args.words + args.added, args.seed)
+    random.Random(args.seed).shuffle(words)
+    rows = [(word_id, word, word_id <= 1000) for word_id, word in enumerate(words[:args.words], 1)]
+    added = [(word_id, word, False) for word_id, word in enumerate(words[args.words:], args.words + 1)]
+
+    index = DistractorIndex()
+    started = time.perf_counter()
+    index.build(rows)
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for start in range(0, len(added), args.batch):
+        index.add_many(added[start:start + args.batch])
+    add_us = (time.perf_counter() - started) / max(1, len(added)) * 1e6
+
+    all_rows = rows + added
+    rng = random.Random(args.seed)
+    deck_rows = rng.sample(all_rows, args.deck)
+    # Как user_deck: свои слова и базовый словарь
+    deck = {row[0] for row in deck_rows} | {row[0] for row in rows if row[2]}
+    targets = [rng.choice(deck_rows) for _ in range(args.questions)]
+
+    started = time.perf_counter()
+    picked = [index.pick(word_id, word, deck) for word_id, word, _ in targets]
+    pick_us = (time.perf_counter() - started) / len(targets) * 1e6
+
+    random_quality = []
+    index_quality = []
+    for (word_id, word, _), options in zip(targets, picked):
+        others = [row[1] for row in rng.sample(deck_rows, 4) if row[0] != word_id][:3]
+        random_quality.extend(similarity(word, other) for other in others)
+        index_quality.extend(similarity(word, other) for other in options)
+
+    print(f"Слов: {args.words} + {len(added)} добавлено, словарь пользователя: {args.deck}, "
+          f"вопросов: {args.questions}")
+    print(f"построение:  {build_s * 1000:.0f} мс ({build_s / args.words * 1e6:.1f} мкс на слово)")
+    print(f"добавление:  {add_us:.1f} мкс на слово (пачки по {args.batch})")
+    print(f"pick:        {pick_us:.1f} мкс на вопрос")
+    print(f"{'варианты':>10} {'сходство':>9} {'вариантов на вопрос':>20}")
+    print(f"{'случайные':>10} {sum(random_quality) / len(random_quality):>9.3f} "
+          f"{len(random_quality) / len(targets):>20.2f}")
+    print(f"{'индекс':>10} {sum(index_quality) / max(1, len(index_quality)):>9.3f} "
+          f"{len(index_quality) / len(targets):>20.2f}")
+    print(index.stats())
+
+
+if __name__ == '__main__':
+    main()
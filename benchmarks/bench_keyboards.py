@@ -0,0 +1,114 @@
+"""Построение и сериализация клавиатур: объекты telebot против templates.py.
+
+Для каждого вида клавиатуры сравниваются время на сообщение и пиковый
+объем памяти, выделяемой при построении (tracemalloc). Заодно проверяется,
+что JSON из templates.py совпадает с to_json() объектов telebot.
+
+Запуск (БД не нужна):
+    python benchmarks/bench_keyboards.py --calls 20000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup  # noqa: E402
+
+import templates  # noqa: E402
+from templates import delete_keyboard  # noqa: E402
+
+
+def old_main_menu():
+    markup = ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.row(KeyboardButton("/study"), KeyboardButton("/add_word"))
+    markup.row(KeyboardButton("/stats"), KeyboardButton("/delete_word"))
+    return markup.to_json()
+
+
+def new_main_menu():
+    return templates.MAIN_MENU_KEYBOARD
+
+
+def old_study(options):
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    buttons = [KeyboardButton(option) for option in options]
+    for i in range(0, len(buttons), 2):
+        markup.row(*buttons[i:i + 2])
+    markup.row(KeyboardButton(templates.CANCEL_STUDY_BUTTON))
+    return markup.to_json()
+
+
+def new_study(options):
+    return templates.study_keyboard(tuple(options))
+
+
+def old_delete_page(page, words, has_next):
+    markup = InlineKeyboardMarkup()
+    for word_id, en_word, ru_translation in words:
+        button_text = f"❌ {en_word} - {ru_translation}"
+        if len(button_text) > 40:
+            button_text = f"❌ {en_word} - {ru_translation[:15]}..."
+        markup.add(InlineKeyboardButton(button_text, callback_data=f"delete_{word_id}"))
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"delpage_{page - 1}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"delpage_{page + 1}"))
+    if navigation:
+        markup.row(*navigation)
+    return markup.to_json()
+
+
+def peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--vocabulary', type=int, default=50, help='слов в словаре для вариантов ответа')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    vocabulary = [f'word{i}' for i in range(args.vocabulary)]
+    option_sets = [rng.sample(vocabulary, 4) for _ in range(args.calls)]
+    words = [(i, f'word{i}', f'перевод{i}') for i in range(10)]
+    index = iter(range(10 ** 12))
+
+    cases = [
+        ('главное меню', lambda: old_main_menu(), lambda: new_main_menu()),
+        ('изучение', lambda: old_study(option_sets[next(index) % args.calls]),
+         lambda: new_study(option_sets[next(index) % args.calls])),
+        ('удаление', lambda: old_delete_page(1, words, True), lambda: delete_keyboard(1, words, True)),
+    ]
+
+    assert old_main_menu() == new_main_menu()
+    assert all(old_study(options) == new_study(options) for options in option_sets[:100])
+    assert old_delete_page(1, words, True) == delete_keyboard(1, words, True)
+
+    print(f"Вызовов: {args.calls}, словарь: {args.vocabulary} слов")
+    print(f"{'клавиатура':>14} {'было мкс':>9} {'стало мкс':>10} {'было байт':>10} {'стало байт':>11}")
+    templates.study_keyboard.cache_clear()
+    for name, old, new in cases:
+        old_us = timeit.timeit(old, number=args.calls) * 1_000_000 / args.calls
+        new_us = timeit.timeit(new, number=args.calls) * 1_000_000 / args.calls
+        print(f"{name:>14} {old_us:>9.2f} {new_us:>10.2f} {peak_bytes(old):>10} {peak_bytes(new):>11}")
+    info = templates.study_keyboard.cache_info()
+    print(f"Кэш клавиатур изучения: {info.hits} попаданий, {info.misses} промахов")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Отправка сообщений под всплеском нагрузки: прямые вызовы против outbound.py.
+
+Поднимает на локальном порту фейковый Bot API (HTTP, keep-alive), который,
+как Telegram, отвечает 429 с retry_after, если в один чат пишут чаще
+--chat-rate в секунду (подряд до --chat-burst) или всем вместе чаще
+--global-rate. Затем --handlers потоков-"обработчиков" одновременно
+отправляют по --messages сообщений в --chats чатов и по --hot-messages в
+--hot-chats "горячих" чатов (пользователь отвечает очень быстро):
+
+    direct   - bot.send_message в потоке обработчика, как раньше;
+    outbound - OutboundSender: обработчик только ставит сообщение в очередь.
+
+Печатаются время обработчика на сообщение (p50/p99), сколько сообщений
+доставлено и потеряно, число ответов 429, время до доставки последнего
+сообщения и число TCP-соединений с фейковым API.
+
+Запуск (БД и сеть не нужны):
+    python benchmarks/bench_outbound.py --chats 100 --messages 3 --handlers 16
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import telebot  # noqa: E402
+from telebot import apihelper  # noqa: E402
+
+from observability import setup_logging  # noqa: E402
+from outbound import OutboundSender  # noqa: E402
+from update_filter import TokenBucketLimiter  # noqa: E402
+
+TOKEN = '123456:BENCH'
+HOT_CHAT_ID = 10 ** 9
+
+
+class FakeBotAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, args):
+        super().__init__(('127.0.0.1', 0), FakeBotAPIHandler)
+        self.args = args
+        self.chat_limiter = TokenBucketLimiter(args.chat_rate, args.chat_burst, max_users=100000)
+        self.global_limiter = TokenBucketLimiter(args.global_rate, args.global_burst)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.delivered = 0
+            self.rejected = 0
+            self.connections = 0
+            self.last_delivery = 0.0
+
+    def handle_call(self, params):
+        """(HTTP-статус, ответ) для вызова sendMessage с параметрами params."""
+        if self.args.api_ms:
+            time.sleep(self.args.api_ms / 1000)
+        chat_id = int(params['chat_id'])
+        now = time.monotonic()
+        if not self.chat_limiter.allow(chat_id, now) or not self.global_limiter.allow('global', now):
+            with self.lock:
+                self.rejected += 1
+            return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                         'parameters': {'retry_after': 1}}
+        with self.lock:
+            self.delivered += 1
+            self.last_delivery = now
+        return 200, {'ok': True, 'result': {
+            'message_id': 1, 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', ''),
+        }}
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            params.update({key: values[0] for key, values in parse_qs(body).items()})
+        status, payload = self.server.handle_call(params)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def workload(args):
+    """Список chat_id в порядке отправки: горячие чаты вперемешку с обычными."""
+    messages = []
+    for round_index in range(max(args.messages, args.hot_messages)):
+        if round_index < args.messages:
+            messages.extend(range(1, args.chats + 1))
+        if round_index < args.hot_messages:
+            messages.extend(range(HOT_CHAT_ID, HOT_CHAT_ID + args.hot_chats))
+    return messages
+
+
+def run(send, messages, handlers):
+    """Отправляет messages из handlers потоков; возвращает (время вызовов, ошибки)."""
+    durations = []
+    errors = [0]
+    lock = threading.Lock()
+    position = iter(range(len(messages)))
+
+    def handler():
+        local = []
+        while True:
+            with lock:
+                index = next(position, None)
+            if index is None:
+                break
+            chat_id = messages[index]
+            started = time.perf_counter()
+            try:
+                send(chat_id, f'сообщение {index}')
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            local.append(time.perf_counter() - started)
+        with lock:
+            durations.extend(local)
+
+    threads = [threading.Thread(target=handler) for _ in range(handlers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    durations.sort()
+    return durations, errors[0]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, int(len(sorted_values) * fraction) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=3, help='сообщений в обычный чат')
+    parser.add_argument('--hot-chats', type=int, default=5)
+    parser.add_argument('--hot-messages', type=int, default=10, help='сообщений в горячий чат')
+    parser.add_argument('--handlers', type=int, default=16, help='потоков-обработчиков')
+    parser.add_argument('--workers', type=int, default=8, help='потоков OutboundSender')
+    parser.add_argument('--api-ms', type=float, default=20.0, help='задержка фейкового Bot API')
+    parser.add_argument('--chat-rate', type=float, default=1.0)
+    parser.add_argument('--chat-burst', type=int, default=3)
+    parser.add_argument('--global-rate', type=float, default=30.0)
+    parser.add_argument('--global-burst', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_logging('ERROR')
+    server = FakeBotAPI(args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    apihelper.CUSTOM_REQUEST_SENDER = None
+    apihelper.API_URL = f'http://127.0.0.1:{server.server_port}/bot{{0}}/{{1}}'
+    bot = telebot.TeleBot(TOKEN, threaded=False)
+    messages = workload(args)
+
+    print(f"Сообщений: {len(messages)} ({args.chats} чатов по {args.messages}, "
+          f"{args.hot_chats} горячих по {args.hot_messages}), обработчиков: {args.handlers}, "
+          f"Bot API: {args.api_ms} мс, лимиты: {args.chat_rate}/с на чат, {args.global_rate}/с всего")
+    print(f"{'режим':>9} {'p50 мс':>8} {'p99 мс':>8} {'доставлено':>11} {'потеряно':>9} "
+          f"{'429':>5} {'время с':>8} {'соединений':>11}")
+
+    modes = [('direct', None), ('outbound', OutboundSender(
+        bot, workers=args.workers, chat_rate=args.chat_rate, chat_burst=args.chat_burst,
+        global_rate=args.global_rate, global_burst=args.global_burst, max_retries=10))]
+    for name, outbox in modes:
+        # Лимиты фейкового API восстанавливаются между режимами
+        time.sleep(max(args.chat_burst / args.chat_rate, args.global_burst / args.global_rate))
+        server.reset()
+        started = time.monotonic()
+        if outbox is None:
+            durations, lost = run(bot.send_message, messages, args.handlers)
+        else:
+            futures = []
+            futures_lock = threading.Lock()
+
+            def send(chat_id, text):
+                future = outbox.send_message(chat_id, text)
+                with futures_lock:
+                    futures.append(future)
+
+            durations, lost = run(send, messages, args.handlers)
+            for future in futures:
+                if future.exception() is not None:
+                    lost += 1
+            outbox.stop()
+        print(f"{name:>9} {percentile(durations, 0.5) * 1000:>8.2f} {percentile(durations, 0.99) * 1000:>8.2f} "
+              f"{server.delivered:>11} {lost:>9} {server.rejected:>5} "
+              f"{server.last_delivery - started:>8.2f} {server.connections:>11}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
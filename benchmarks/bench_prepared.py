@@ -0,0 +1,140 @@
+"""Частые запросы PostgreSQLDatabase: обычный cursor.execute против PREPARE/EXECUTE.
+
+Оба режима выполняют одни и те же выражения из database.statements:
+"ad-hoc" - с выключенным реестром (текст запроса каждый раз разбирается и
+планируется заново), "prepared" - через EXECUTE подготовленного на
+соединении выражения.
+
+Запуск (нужен PostgreSQL из config.DATABASE_URL):
+    python benchmarks/bench_prepared.py --users 1000 --base-words 500 --calls 2000
+
+Замеры идут во временной схеме bench_prepared, которая удаляется в конце.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from user_state import Mode, UserState  # noqa: E402
+
+
+def scenarios(args):
+    """Сценарии вида (название, f(statements, cursor, i)); i - номер вызова."""
+    def user(i):
+        return i % args.users + 1
+
+    def get_state(statements, cursor, i):
+        statements.execute(cursor, 'get_user_state', (user(i),)).fetchone()
+
+    def set_state(statements, cursor, i):
+        state = UserState(Mode.STUDY, word_id=i, question='замер', correct_answer='bench')
+        statements.execute(cursor, 'set_user_state', (user(i), int(state.mode), state.encode_data()))
+
+    def deck(statements, cursor, i):
+        statements.execute(cursor, 'deck_word_ids', (user(i),)).fetchall()
+
+    def words_by_ids(statements, cursor, i):
+        ids = random.sample(range(1, args.base_words + 1), 4)
+        statements.execute(cursor, 'words_by_ids', (ids,)).fetchall()
+
+    def prefetch(statements, cursor, i):
+        ids = random.sample(range(1, args.base_words + 1), min(32, args.base_words))
+        statements.execute(cursor, 'prefetch_questions', (user(i), 8, [], ids)).fetchall()
+
+    def word_count(statements, cursor, i):
+        statements.execute(cursor, 'word_count', (user(i),)).fetchone()
+
+    def stats(statements, cursor, i):
+        statements.execute(cursor, 'user_stats', (user(i),)).fetchone()
+
+    def page(statements, cursor, i):
+        statements.execute(cursor, 'user_words_page', (user(i), 'base%d' % (i % 100), 10)).fetchall()
+
+    def add_delete(statements, cursor, i):
+        user_id = user(i)
+        word_id = statements.execute(cursor, 'insert_word', ('bench%d' % i, 'замер', user_id)).fetchone()[0]
+        statements.execute(cursor, 'link_word', (user_id, word_id))
+        statements.execute(cursor, 'refresh_word_count', (user_id,)).fetchone()
+        statements.execute(cursor, 'unlink_word', (user_id, word_id))
+        statements.execute(cursor, 'delete_word', (word_id,))
+        statements.execute(cursor, 'refresh_word_count', (user_id,)).fetchone()
+
+    return [
+        ('get_user_state', get_state),
+        ('set_user_state', set_state),
+        ('deck_word_ids', deck),
+        ('words_by_ids', words_by_ids),
+        ('prefetch_questions', prefetch),
+        ('word_count', word_count),
+        ('user_stats', stats),
+        ('user_words_page', page),
+        ('add+delete word', add_delete),
+    ]
+
+
+def run(conn, statements, scenario, calls):
+    cursor = conn.cursor()
+    # Прогрев: в режиме prepared здесь же выполняется PREPARE
+    for i in range(min(50, calls)):
+        scenario(statements, cursor, i)
+    conn.commit()
+
+    started = time.perf_counter()
+    for i in range(calls):
+        scenario(statements, cursor, i)
+        conn.commit()
+    return (time.perf_counter() - started) * 1_000_000 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--base-words', type=int, default=500)
+    parser.add_argument('--calls', type=int, default=2000, help='вызовов на сценарий в каждом режиме')
+    args = parser.parse_args()
+
+    import psycopg2
+
+    import migrations
+    from config import DATABASE_URL
+    from database import statements
+
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP SCHEMA IF EXISTS bench_prepared CASCADE")
+        cursor.execute("CREATE SCHEMA bench_prepared")
+        cursor.execute("SET search_path TO bench_prepared")
+        cursor.execute(migrations.schema_sql())
+        cursor.execute('''
+            INSERT INTO words (english_word, russian_translation)
+            SELECT 'base' || g, 'база' || g FROM generate_series(1, %s) g
+        ''', (args.base_words,))
+        cursor.execute('''
+            INSERT INTO users (user_id, first_name)
+            SELECT g, 'user' || g FROM generate_series(1, %s) g
+        ''', (args.users,))
+        cursor.execute("ANALYZE")
+        conn.commit()
+
+        print(f"Пользователей: {args.users}, базовых слов: {args.base_words}, вызовов: {args.calls}")
+        print(f"{'запрос':>16} {'ad-hoc мкс':>11} {'prepared мкс':>13} {'ускорение':>10}")
+        for name, scenario in scenarios(args):
+            statements.enabled = False
+            adhoc = run(conn, statements, scenario, args.calls)
+            statements.enabled = True
+            prepared = run(conn, statements, scenario, args.calls)
+            print(f"{name:>16} {adhoc:>11.1f} {prepared:>13.1f} {adhoc / prepared:>9.2f}x")
+    finally:
+        conn.rollback()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_prepared CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Стоимость регистрации и размер таблиц: копия базового словаря против общего.
+
+Старая схема при каждом /start копировала все базовые слова в user_words
+(users x базовые слова строк). Новая хранит только пользователя, а базовые
+слова видны через представление user_deck.
+
+Запуск (нужен PostgreSQL из config.DATABASE_URL):
+    python benchmarks/bench_registration.py --users 100000 --base-words 50
+
+Замеры идут во временной схеме bench_registration, которая удаляется в конце.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+OLD_REGISTER = [
+    "INSERT INTO users (user_id, username, first_name) VALUES (%(id)s, %(name)s, %(name)s) "
+    "ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name",
+    "INSERT INTO user_words (user_id, word_id) SELECT %(id)s, word_id FROM words WHERE added_by IS NULL "
+    "ON CONFLICT (user_id, word_id) DO NOTHING",
+]
+NEW_REGISTER = OLD_REGISTER[:1]
+
+
+def timed_calls(conn, statements, user_ids):
+    cursor = conn.cursor()
+    timings = []
+    for user_id in user_ids:
+        started = time.perf_counter()
+        for statement in statements:
+            cursor.execute(statement, {'id': user_id, 'name': f'user{user_id}'})
+        conn.commit()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def table_size(cursor, *tables):
+    cursor.execute("SELECT " + " + ".join("pg_total_relation_size(%s)" for _ in tables), tables)
+    return cursor.fetchone()[0] / 1024 / 1024
+
+
+def run_model(conn, name, statements, bulk_sql, args):
+    cursor = conn.cursor()
+    cursor.execute("TRUNCATE users, user_words, user_hidden_words")
+    conn.commit()
+
+    # Первые --timed регистраций замеряются по одной, остальные добавляются одним запросом
+    first_p50, first_p99 = timed_calls(conn, statements, range(1, args.timed + 1))
+    cursor.execute(bulk_sql, (args.timed + 1, args.users))
+    conn.commit()
+    repeat_p50, repeat_p99 = timed_calls(conn, statements, range(1, args.timed + 1))
+    cursor.execute("VACUUM ANALYZE user_words")
+
+    cursor.execute("SELECT COUNT(*) FROM user_words")
+    rows = cursor.fetchone()[0]
+    size = table_size(cursor, 'user_words', 'user_hidden_words')
+
+    count_sql = ("SELECT COUNT(*) FROM user_words WHERE user_id = %s" if name == 'копия'
+                 else "SELECT COUNT(*) FROM user_deck WHERE user_id = %s")
+    started = time.perf_counter()
+    for user_id in range(1, args.timed + 1):
+        cursor.execute(count_sql, (user_id,))
+        cursor.fetchone()
+    count_ms = (time.perf_counter() - started) * 1000 / args.timed
+
+    print(f"{name:>7} {first_p50:>9.2f} {first_p99:>9.2f} {repeat_p50:>9.2f} {repeat_p99:>9.2f} "
+          f"{rows:>12} {size:>10.1f} {count_ms:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--base-words', type=int, default=50)
+    parser.add_argument('--timed', type=int, default=500, help='сколько регистраций замерять по одной')
+    args = parser.parse_args()
+
+    import psycopg2
+    from config import DATABASE_URL
+
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP SCHEMA IF EXISTS bench_registration CASCADE")
+        cursor.execute("CREATE SCHEMA bench_registration")
+        cursor.execute("SET search_path TO bench_registration")
+        with open(os.path.join(ROOT, 'create_tables.sql'), encoding='utf-8') as file:
+            cursor.execute(file.read())
+        cursor.execute('''
+            INSERT INTO words (english_word, russian_translation)
+            SELECT 'base' || g, 'база' || g FROM generate_series(1, %s) g
+        ''', (args.base_words,))
+        conn.commit()
+
+        print(f"Пользователей: {args.users}, базовых слов: {args.base_words}")
+        print(f"{'схема':>7} {'рег. p50':>9} {'рег. p99':>9} {'повт. p50':>9} {'повт. p99':>9} "
+              f"{'строк uw':>12} {'размер МБ':>10} {'count мс':>10}")
+
+        run_model(conn, 'копия', OLD_REGISTER, '''
+            WITH new_users AS (
+                INSERT INTO users (user_id, first_name)
+                SELECT g, 'user' || g FROM generate_series(%s, %s) g
+                RETURNING user_id
+            )
+            INSERT INTO user_words (user_id, word_id)
+            SELECT u.user_id, w.word_id FROM new_users u CROSS JOIN words w WHERE w.added_by IS NULL
+        ''', args)
+        run_model(conn, 'общий', NEW_REGISTER, '''
+            INSERT INTO users (user_id, first_name)
+            SELECT g, 'user' || g FROM generate_series(%s, %s) g
+        ''', args)
+    finally:
+        conn.rollback()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_registration CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
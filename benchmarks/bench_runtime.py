@@ -0,0 +1,225 @@
+"""Нагрузочное сравнение режимов запуска: main.py (потоки TeleBot) против async_main.py.
+
+Оба режима запускают настоящих ботов: каждый из --users пользователей
+одновременно присылает --messages команд /stats (два обращения к
+хранилищу: get_stats и get_weak_words, ответ ставится в очередь
+OutboundSender). Вызовы Bot API перехватывает фейковый сервер из
+load_harness с задержкой --api-ms.
+
+Режимы:
+    threads - main.bot и bot_handlers: обновления обрабатывает пул из
+              --threads воркеров TeleBot, хранилище синхронное;
+    async   - async_main.bot и async_handlers: обработчики - корутины,
+              хранилище AsyncPostgreSQLDatabase.
+
+Режим threads прогоняется для каждого значения --threads (например,
+2 8 32 128), чтобы сравнивать с async при одинаковом и при большем
+числе воркеров, а не только с двумя воркерами по умолчанию. Общий
+ограничитель - --pool: столько обращений к хранилищу выполняется
+одновременно в обоих режимах (как пул соединений DB_POOL_MAX_SIZE).
+
+Хранилище - --url. memory:// (по умолчанию): к каждому вызову
+добавляется задержка --db-ms, как сетевой круг до удаленного PostgreSQL;
+в режиме threads это time.sleep под threading.Semaphore(--pool), в
+режиме async - asyncio.sleep под asyncio.Semaphore(--pool) поверх той же
+MemoryDatabase. PostgreSQL (postgresql://... или "host=... dbname=..."):
+оба режима работают с настоящей БД через пулы размера --pool
+(psycopg2 и asyncpg), --db-ms не используется. sqlite:// в режиме async
+не поддерживается.
+
+Ответы в обоих режимах отправляет OutboundSender (OUTBOUND_WORKERS
+потоков): при большой --api-ms узким местом становится он, и результаты
+режимов выравниваются.
+
+Печатаются пропускная способность и время от отправки пачки обновлений до
+ответа (p50/p99).
+
+Запуск:
+    python benchmarks/bench_runtime.py --users 1000 5000 --messages 3 --db-ms 5 --threads 2 8 32 128
+"""
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_harness import FIRST_USER_ID, FakeTelegramAPI, UpdateFactory  # noqa: E402
+
+# Вызовы хранилища, которыми пользуется /stats
+STATS_CALLS = ('get_stats', 'get_weak_words')
+
+
+class TimingTelegramAPI(FakeTelegramAPI):
+    """Фейковый Bot API, который запоминает время каждого отправленного сообщения."""
+
+    def __init__(self, api_ms):
+        super().__init__(api_ms)
+        self.sent_at = []
+        self._sent = threading.Condition()
+
+    def __call__(self, method, url, params=None, **kwargs):
+        response = super().__call__(method, url, params, **kwargs)
+        if url.endswith('/sendMessage'):
+            with self._sent:
+                self.sent_at.append(time.perf_counter())
+                self._sent.notify_all()
+        return response
+
+    def wait_sent(self, count, timeout):
+        with self._sent:
+            return self._sent.wait_for(lambda: len(self.sent_at) >= count, timeout)
+
+
+def setup(args, api):
+    """Настройка до импорта main/async_main (они читают config при импорте)."""
+    import config
+    from telebot import apihelper
+
+    config.DATABASE_URL = args.url
+    config.DB_POOL_MAX_SIZE = args.pool
+    config.METRICS_PORT = 0
+    config.LOG_LEVEL = 'WARNING'
+    # Нагрузка идет пачкой от каждого пользователя: лимиты не применяются
+    config.RATE_LIMIT_BURST = float('inf')
+    config.OUTBOUND_CHAT_RATE = config.OUTBOUND_GLOBAL_RATE = 1e9
+    apihelper.CUSTOM_REQUEST_SENDER = api
+
+
+def add_db_latency(database, seconds, pool):
+    """Синхронное хранилище: задержка вызова и не больше pool вызовов одновременно."""
+    slots = threading.Semaphore(pool)
+    for name in STATS_CALLS:
+        method = getattr(database, name)
+
+        @functools.wraps(method)
+        def delayed(*args, _method=method, **kwargs):
+            with slots:
+                time.sleep(seconds)
+                return _method(*args, **kwargs)
+
+        setattr(database, name, staticmethod(delayed) if isinstance(database, type) else delayed)
+
+
+def use_async_memory(async_database, database, seconds, pool):
+    """Асинхронное хранилище поверх database (MemoryDatabase): asyncio.sleep как ожидание ответа asyncpg."""
+    slots = asyncio.Semaphore(pool)
+    for name in STATS_CALLS:
+        method = getattr(database, name)
+
+        async def delayed(*args, _method=method, **kwargs):
+            async with slots:
+                await asyncio.sleep(seconds)
+                return _method(*args, **kwargs)
+
+        setattr(async_database, name, staticmethod(delayed))
+
+
+def report(mode, users, sent_at, started):
+    latencies = sorted(at - started for at in sent_at)
+    elapsed = latencies[-1]
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    print(f"{mode:>12} {users:>7} {len(latencies) / elapsed:>12.0f} {p50:>10.0f} {p99:>10.0f}")
+
+
+def run_threads(updates, threads):
+    import main
+    from telebot import util
+
+    main.bot.worker_pool.close()
+    main.bot.worker_pool = util.ThreadPool(main.bot, num_threads=threads)
+    started = time.perf_counter()
+    main.bot.process_new_updates(updates)
+    return started
+
+
+def run_async(loop, updates):
+    import async_main
+
+    started = time.perf_counter()
+    # process_new_updates дожидается всех обработчиков (asyncio.gather)
+    loop.run_until_complete(async_main.bot.process_new_updates(updates))
+    return started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='memory://', help='DATABASE_URL: memory:// или PostgreSQL')
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 5000])
+    parser.add_argument('--messages', type=int, default=3, help='команд /stats на пользователя')
+    parser.add_argument('--db-ms', type=float, default=5.0, help='задержка одного вызова хранилища (memory://)')
+    parser.add_argument('--api-ms', type=float, default=0.0, help='задержка вызова Bot API')
+    parser.add_argument('--threads', type=int, nargs='+', default=[2, 8, 32, 128],
+                        help='воркеры TeleBot (num_threads) для режима threads')
+    parser.add_argument('--pool', type=int, default=10, help='одновременных вызовов хранилища в обоих режимах')
+    parser.add_argument('--modes', nargs='+', default=['threads', 'async'], choices=['threads', 'async'])
+    args = parser.parse_args()
+
+    api = TimingTelegramAPI(args.api_ms)
+    setup(args, api)
+
+    from telebot import types
+
+    import bot_handlers
+    import main as main_module
+    from storage import storage_scheme
+
+    scheme = storage_scheme(args.url)
+    if 'async' in args.modes and scheme == 'sqlite':
+        parser.error("--url: режим async работает только с memory:// и PostgreSQL")
+
+    database = bot_handlers.database
+    database.check_and_init_database()
+
+    loop = None
+    if 'async' in args.modes:
+        import async_main
+
+        loop = asyncio.new_event_loop()
+        if scheme == 'memory':
+            # До add_db_latency: асинхронный режим не должен получить time.sleep
+            use_async_memory(async_main.database, database, args.db_ms / 1000, args.pool)
+        else:
+            loop.run_until_complete(async_main.database.check_and_init_database())
+    if scheme == 'memory':
+        add_db_latency(database, args.db_ms / 1000, args.pool)
+
+    factory = UpdateFactory()
+    runs = []
+    for mode in args.modes:
+        if mode == 'threads':
+            runs.extend((f'threads/{threads}', functools.partial(run_threads, threads=threads))
+                        for threads in args.threads)
+        else:
+            runs.append(('async', functools.partial(run_async, loop)))
+
+    print(f"{'режим':>12} {'польз.':>7} {'обновл./с':>12} {'p50, мс':>10} {'p99, мс':>10}")
+    try:
+        for users in args.users:
+            user_ids = range(FIRST_USER_ID, FIRST_USER_ID + users)
+            for user_id in user_ids:
+                database.register_user(user_id, f'load{user_id}', f'user{user_id}')
+            for name, run in runs:
+                updates = [types.Update.de_json(factory.message(user_id, '/stats'))
+                           for _ in range(args.messages) for user_id in user_ids]
+                api.sent_at.clear()
+                started = run(updates)
+                if not api.wait_sent(len(updates), timeout=600):
+                    raise RuntimeError(f"{name}: ответов {len(api.sent_at)} из {len(updates)}")
+                report(name, users, list(api.sent_at), started)
+    finally:
+        main_module.shutdown()
+        if loop is not None:
+            async_main.outbox.stop()
+            loop.run_until_complete(async_main.database.close_pool())
+            loop.close()
+
+
+if __name__ == '__main__':
+    main()
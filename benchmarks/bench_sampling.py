@@ -0,0 +1,137 @@
+"""Бенчмарк выбора слова для /study на словарях от 50 до 100 000 слов.
+
+Запуск:
+    python benchmarks/bench_sampling.py          # только выбор в памяти (WordSampler)
+    python benchmarks/bench_sampling.py --db     # + сравнение запросов в PostgreSQL (DATABASE_URL из config.py)
+
+В режиме --db создается временная схема bench_sampling, которая удаляется после замеров.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from word_sampler import WordSampler
+
+SIZES = [50, 500, 5_000, 50_000, 100_000]
+USER_ID = 1
+
+OLD_TARGET_SQL = '''
+    SELECT w.word_id, w.english_word, w.russian_translation
+    FROM words w
+    INNER JOIN user_words uw ON w.word_id = uw.word_id
+    WHERE uw.user_id = %s
+    ORDER BY RANDOM()
+    LIMIT 1
+'''
+OLD_OPTIONS_SQL = '''
+    SELECT w.english_word
+    FROM words w
+    INNER JOIN user_words uw ON w.word_id = uw.word_id
+    WHERE uw.user_id = %s AND w.word_id != %s
+    ORDER BY RANDOM()
+    LIMIT 3
+'''
+NEW_SQL = "SELECT word_id, english_word, russian_translation FROM words WHERE word_id = ANY(%s)"
+
+
+def measure(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def bench_memory(iterations):
+    print("WordSampler.sample(user, 4), мкс")
+    print(f"{'слов':>8} {'p50':>10} {'p99':>10}")
+    for size in SIZES:
+        sampler = WordSampler(lambda user_id, size=size: range(1, size + 1))
+        sampler.get_word_ids(USER_ID)  # прогрев кэша
+        p50, p99 = measure(lambda: sampler.sample(USER_ID, 4), iterations)
+        print(f"{size:>8} {p50:>10.2f} {p99:>10.2f}")
+
+
+def bench_db(iterations):
+    import psycopg2
+    from config import DATABASE_URL
+
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DROP SCHEMA IF EXISTS bench_sampling CASCADE")
+        cursor.execute("CREATE SCHEMA bench_sampling")
+        cursor.execute("SET search_path TO bench_sampling")
+        cursor.execute('''
+            CREATE TABLE words (
+                word_id SERIAL PRIMARY KEY,
+                english_word TEXT UNIQUE NOT NULL,
+                russian_translation TEXT NOT NULL
+            );
+            CREATE TABLE user_words (
+                user_id BIGINT,
+                word_id INTEGER,
+                PRIMARY KEY (user_id, word_id)
+            );
+        ''')
+        conn.commit()
+
+        print()
+        print("PostgreSQL: ORDER BY RANDOM() (2 запроса) против WordSampler + ANY (1 запрос), мкс")
+        print(f"{'слов':>8} {'old p50':>10} {'old p99':>10} {'new p50':>10} {'new p99':>10}")
+        loaded = 0
+        for size in SIZES:
+            cursor.execute('''
+                INSERT INTO words (english_word, russian_translation)
+                SELECT 'word' || g, 'слово' || g FROM generate_series(%s, %s) g
+            ''', (loaded + 1, size))
+            cursor.execute('''
+                INSERT INTO user_words (user_id, word_id)
+                SELECT %s, word_id FROM words WHERE word_id > %s
+            ''', (USER_ID, loaded))
+            cursor.execute("ANALYZE")
+            conn.commit()
+            loaded = size
+
+            def old_path():
+                cursor.execute(OLD_TARGET_SQL, (USER_ID,))
+                target_id = cursor.fetchone()[0]
+                cursor.execute(OLD_OPTIONS_SQL, (USER_ID, target_id))
+                cursor.fetchall()
+
+            def load_ids(user_id):
+                cursor.execute("SELECT word_id FROM user_words WHERE user_id = %s", (user_id,))
+                return [row[0] for row in cursor.fetchall()]
+
+            sampler = WordSampler(load_ids)
+            sampler.get_word_ids(USER_ID)
+
+            def new_path():
+                cursor.execute(NEW_SQL, (sampler.sample(USER_ID, 4),))
+                cursor.fetchall()
+
+            old_p50, old_p99 = measure(old_path, iterations)
+            new_p50, new_p99 = measure(new_path, iterations)
+            print(f"{size:>8} {old_p50:>10.0f} {old_p99:>10.0f} {new_p50:>10.0f} {new_p99:>10.0f}")
+    finally:
+        conn.rollback()
+        cursor.execute("DROP SCHEMA IF EXISTS bench_sampling CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', action='store_true', help='сравнить запросы в PostgreSQL')
+    parser.add_argument('-n', '--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    bench_memory(args.iterations)
+    if args.db:
+        bench_db(max(args.iterations // 10, 20))
@@ -0,0 +1,94 @@
+"""Время запуска: импорт модулей бота и проверка схемы БД.
+
+Старая проверка при каждом запуске искала таблицу users в
+information_schema и заново выполняла create_tables.sql (файл читался
+до четырех раз при переборе кодировок). Новая - один запрос к
+schema_version (migrations.migrate), миграции применяются только на
+пустой или устаревшей базе.
+
+Запуск (нужен PostgreSQL из config.DATABASE_URL):
+    python benchmarks/bench_startup.py --runs 20
+
+Замеры схемы идут во временной схеме bench_startup, которая удаляется в конце.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCHEMA = 'bench_startup'
+
+
+def median_ms(fn, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def python_ms(code, runs):
+    return median_ms(lambda: subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True), runs)
+
+
+def old_check(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT FROM information_schema.tables
+            WHERE table_name = 'users'
+        )
+    """)
+    cursor.fetchone()
+    cursor.execute("SELECT to_regclass('user_hidden_words') IS NOT NULL")
+    cursor.fetchone()
+    conn.commit()
+    with open(os.path.join(ROOT, 'create_tables.sql'), encoding='utf-8') as file:
+        cursor.execute(file.read())
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    import psycopg2
+    import psycopg2.extensions
+    import migrations
+    from config import DATABASE_URL
+
+    interpreter = python_ms('pass', args.runs // 4 or 1)
+    imports = python_ms('import main', args.runs // 4 or 1)
+    print(f"Интерпретатор: {interpreter:.0f} мс, import main: {imports:.0f} мс "
+          f"(без интерпретатора {imports - interpreter:.0f} мс)")
+
+    admin = psycopg2.connect(DATABASE_URL)
+    admin.autocommit = True
+    admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    dsn = psycopg2.extensions.make_dsn(DATABASE_URL, options=f'-c search_path={SCHEMA}')
+    conn = psycopg2.connect(dsn)
+    try:
+        started = time.perf_counter()
+        applied = migrations.migrate(conn)
+        print(f"Пустая база: миграции {applied} за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+        connect = median_ms(lambda: psycopg2.connect(dsn).close(), args.runs)
+        new = median_ms(lambda: migrations.migrate(conn), args.runs)
+        old = median_ms(lambda: old_check(conn), args.runs)
+        print(f"Новое соединение: {connect:.2f} мс")
+        print(f"Проверка схемы: было {old:.2f} мс, стало {new:.2f} мс ({old / new:.0f}x)")
+    finally:
+        conn.close()
+        admin.cursor().execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        admin.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Состояние диалога: JSON-текст против UserState (state_mode + двоичные поля).
+
+Для типичных состояний (изучение слова, второй шаг добавления слова,
+импорт, пустое) сравниваются:
+
+    json   - json.dumps/json.loads словаря, как хранилось в users.user_state;
+    binary - UserState.encode_data/UserState.decode (user_state.py).
+
+Печатаются время записи и чтения одного состояния и размер в строке users:
+байты JSON-текста против 2 байт SMALLINT state_mode и длины state_data.
+Служебные заголовки значений PostgreSQL (varlena) не учитываются.
+
+Запуск (БД не нужна):
+    python benchmarks/bench_user_state.py --calls 200000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from user_state import Mode, UserState  # noqa: E402
+
+MODE_SIZE = 2  # SMALLINT
+
+STATES = [
+    ('study', {'mode': 'study', 'correct_answer': 'apple', 'question': 'яблоко', 'word_id': 12345},
+     UserState(Mode.STUDY, word_id=12345, question='яблоко', correct_answer='apple')),
+    ('add_word_step2', {'mode': 'add_word_step2', 'english_word': 'butterfly'},
+     UserState(Mode.ADD_WORD_STEP2, english_word='butterfly')),
+    ('import', {'mode': 'import'}, UserState(Mode.IMPORT)),
+    ('idle', {}, UserState()),
+]
+
+
+def per_call(function, calls):
+    """Среднее время вызова function() в микросекундах."""
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000, help='вызовов на замер')
+    args = parser.parse_args()
+
+    print(f"Вызовов на замер: {args.calls}")
+    print(f"{'состояние':>15} {'формат':>7} {'запись мкс':>11} {'чтение мкс':>11} {'байт':>5}")
+    for name, as_dict, state in STATES:
+        text = json.dumps(as_dict)
+        mode, data = int(state.mode), state.encode_data()
+        assert UserState.decode(mode, data) == state
+        rows = [
+            ('json', per_call(lambda: json.dumps(as_dict), args.calls),
+             per_call(lambda: json.loads(text), args.calls), len(text.encode('utf-8'))),
+            ('binary', per_call(lambda: (int(state.mode), state.encode_data()), args.calls),
+             per_call(lambda: UserState.decode(mode, data), args.calls), MODE_SIZE + len(data or b'')),
+        ]
+        for format_name, write_us, read_us, size in rows:
+            print(f"{name:>15} {format_name:>7} {write_us:>11.2f} {read_us:>11.2f} {size:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,470 @@
+"""Офлайн-нагрузка на обработчики main.py: фейковый Bot API и временный PostgreSQL или SQLite.
+
+Каждый из --users пользователей проходит сценарий /start, /study и
+--answers ответов, /add_word (слово и перевод), /delete_word и удаление
+добавленного слова, /stats. Обновления собираются как JSON от Telegram и
+передаются в main.bot.process_new_updates, то есть проходят через те же
+фильтры и обработчики, что и в боевом режиме. Вызовы Bot API перехватывает
+фейковый сервер в памяти (apihelper.CUSTOM_REQUEST_SENDER) с задержкой
+--api-ms; сеть не используется.
+
+База:
+    --initdb         - временный кластер initdb/pg_ctl в каталоге tmp (нужны
+                       бинарники PostgreSQL в PATH или --pg-bin);
+    --url sqlite://  - временный файл SQLite (sqlite:///путь - заданный файл),
+                       PostgreSQL не нужен;
+    --url memory://  - хранилище в памяти (SQL-запросов нет, столбцы SQL - нули);
+    по умолчанию     - отдельная схема load_harness в базе --dsn
+                       (config.DATABASE_URL), удаляется в конце.
+С SQLite и memory:// базовый словарь - initial_data.sql, --base-words не
+используется.
+
+Отчет: p50/p95/p99 времени обработки обновления по типам, пропускная
+способность и число SQL-запросов на обновление (в потоке обработчика и
+всего, вместе с фоновой записью состояний и отложенными вопросами).
+
+Запуск:
+    python benchmarks/load_harness.py --users 200 --concurrency 16 --answers 5
+    python benchmarks/load_harness.py --url sqlite:// --users 200
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2
+import psycopg2.extensions
+
+import migrations
+from db_pool import ConnectionPool
+
+CANCEL_STUDY = "❌ Отменить изучение"
+QUESTION_PREFIX = "<b>Как переводится слово</b>"
+FIRST_USER_ID = 10 ** 9
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов: общий и по текущему потоку."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.total = 0
+
+    def add(self):
+        with self._lock:
+            self.total += 1
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    def thread_count(self):
+        return getattr(self._local, 'count', 0)
+
+
+queries = QueryCounter()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        queries.add()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        queries.add()
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        queries.add()
+        return super().copy_expert(sql, file, size)
+
+
+class CountingPool(ConnectionPool):
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=CountingCursor)
+        conn.set_client_encoding('UTF8')
+        return conn
+
+
+def count_sqlite_queries():
+    """Считает запросы SQLiteDatabase (trace callback каждого соединения)."""
+    from sqlite_database import SQLiteDatabase
+
+    connect = SQLiteDatabase._connect
+
+    def counting_connect(self):
+        conn = connect(self)
+        conn.set_trace_callback(lambda statement: queries.add())
+        return conn
+
+    SQLiteDatabase._connect = counting_connect
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, result):
+        self._payload = {'ok': True, 'result': result}
+        self.text = json.dumps(self._payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeTelegramAPI:
+    """Подменяет HTTP-вызовы Bot API и запоминает, что бот отправил в каждый чат."""
+
+    def __init__(self, api_ms):
+        self.api_ms = api_ms
+        self.calls = defaultdict(int)
+        self._message_ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._questions = defaultdict(int)  # chat_id -> сколько вопросов /study отправлено
+        self._last = {}  # chat_id -> (message_id, text, reply_markup)
+
+    def __call__(self, method, url, params=None, **kwargs):
+        if self.api_ms:
+            time.sleep(self.api_ms / 1000)
+        api_method = url.rsplit('/', 1)[1]
+        params = params or {}
+        with self._cond:
+            self.calls[api_method] += 1
+
+        if api_method not in ('sendMessage', 'editMessageText', 'editMessageReplyMarkup'):
+            return FakeResponse(True)
+
+        chat_id = int(params['chat_id'])
+        message_id = int(params.get('message_id') or next(self._message_ids))
+        text = params.get('text', '')
+        markup = json.loads(params['reply_markup']) if params.get('reply_markup') else None
+        with self._cond:
+            self._last[chat_id] = (message_id, text, markup)
+            if text.startswith(QUESTION_PREFIX):
+                self._questions[chat_id] += 1
+                self._cond.notify_all()
+        return FakeResponse({
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': text,
+        })
+
+    def last(self, chat_id):
+        with self._cond:
+            return self._last.get(chat_id, (None, '', None))
+
+    def questions(self, chat_id):
+        with self._cond:
+            return self._questions[chat_id]
+
+    def wait_question(self, chat_id, seen, timeout):
+        """Ждет вопрос с номером больше seen; возвращает False по таймауту."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._questions[chat_id] > seen, timeout)
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'username': f'load{user_id}'}
+
+    def message(self, user_id, text):
+        update_id = next(self._ids)
+        return {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': self._user(user_id),
+                'text': text,
+            },
+        }
+
+    def callback(self, user_id, message_id, data):
+        update_id = next(self._ids)
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'text': '',
+                },
+            },
+        }
+
+
+def letters_word(user_id):
+    # Добавляемое слово должно состоять только из букв
+    return 'load' + ''.join(chr(ord('a') + int(digit)) for digit in str(user_id))
+
+
+class Harness:
+    def __init__(self, bot, outbox, api, args):
+        from telebot.types import Update
+
+        self.bot = bot
+        self.outbox = outbox
+        self.api = api
+        self.args = args
+        self.updates = UpdateFactory()
+        self._update_type = Update
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)  # тип обновления -> [секунды]
+        self.handler_queries = defaultdict(int)
+        self.timeouts = 0
+
+    def send(self, kind, update_json):
+        user_id = (update_json.get('message') or update_json['callback_query'])['from']['id']
+        update = self._update_type.de_json(update_json)
+        before = queries.thread_count()
+        started = time.perf_counter()
+        self.bot.process_new_updates([update])
+        elapsed = time.perf_counter() - started
+        used = queries.thread_count() - before
+        with self._lock:
+            self.latencies[kind].append(elapsed)
+            self.handler_queries[kind] += used
+        # Ответы уходят в фоне: сценарий читает их у фейкового API после отправки
+        self.outbox.wait_chat(user_id, timeout=5)
+
+    def run_user(self, user_id, rng):
+        args = self.args
+        self.send('/start', self.updates.message(user_id, '/start'))
+
+        seen = self.api.questions(user_id)
+        self.send('/study', self.updates.message(user_id, '/study'))
+        for _ in range(args.answers):
+            if self.api.questions(user_id) == seen:
+                break  # словарь пуст
+            seen = self.api.questions(user_id)
+            _, _, markup = self.api.last(user_id)
+            options = [button['text'] for row in (markup or {}).get('keyboard', []) for button in row
+                       if button['text'] != CANCEL_STUDY]
+            if not options:
+                break
+            self.send('answer', self.updates.message(user_id, rng.choice(options)))
+            if not self.api.wait_question(user_id, seen, timeout=args.next_delay + 5):
+                with self._lock:
+                    self.timeouts += 1
+                break
+        self.send('cancel', self.updates.message(user_id, CANCEL_STUDY))
+
+        word = letters_word(user_id)
+        self.send('/add_word', self.updates.message(user_id, '/add_word'))
+        self.send('add_word_text', self.updates.message(user_id, word))
+        self.send('add_word_translation', self.updates.message(user_id, 'перевод'))
+
+        self.send('/delete_word', self.updates.message(user_id, '/delete_word'))
+        message_id, _, markup = self.api.last(user_id)
+        buttons = [button for row in (markup or {}).get('inline_keyboard', []) for button in row
+                   if button.get('callback_data', '').startswith('delete_')]
+        if buttons:
+            target = next((button for button in buttons if word in button['text']), buttons[0])
+            self.send('delete_callback', self.updates.callback(user_id, message_id, target['callback_data']))
+
+        self.send('/stats', self.updates.message(user_id, '/stats'))
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, int(len(sorted_values) * fraction) - 1)]
+
+
+def report(harness, api, elapsed, total_queries):
+    print(f"{'обновление':>22} {'кол-во':>7} {'p50 мс':>8} {'p95 мс':>8} {'p99 мс':>8} {'SQL/обн.':>9}")
+    all_latencies = []
+    for kind, latencies in harness.latencies.items():
+        latencies.sort()
+        all_latencies.extend(latencies)
+        print(f"{kind:>22} {len(latencies):>7} {percentile(latencies, 0.5) * 1000:>8.2f} "
+              f"{percentile(latencies, 0.95) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} "
+              f"{harness.handler_queries[kind] / len(latencies):>9.2f}")
+    all_latencies.sort()
+    updates = len(all_latencies)
+    print(f"{'всего':>22} {updates:>7} {percentile(all_latencies, 0.5) * 1000:>8.2f} "
+          f"{percentile(all_latencies, 0.95) * 1000:>8.2f} {percentile(all_latencies, 0.99) * 1000:>8.2f} "
+          f"{sum(harness.handler_queries.values()) / updates:>9.2f}")
+    print()
+    print(f"Время: {elapsed:.2f} с, пропускная способность: {updates / elapsed:.0f} обновлений/с")
+    print(f"SQL-запросов всего (с фоновыми): {total_queries}, на обновление: {total_queries / updates:.2f}")
+    print(f"Вызовы Bot API: {dict(api.calls)}")
+    if harness.timeouts:
+        print(f"⚠️ Не дождались следующего вопроса: {harness.timeouts}")
+
+
+class EphemeralPostgres:
+    """Временный кластер PostgreSQL в каталоге tmp (initdb + pg_ctl)."""
+
+    def __init__(self, pg_bin=None):
+        self.pg_bin = pg_bin
+        self.directory = tempfile.mkdtemp(prefix='load_harness_pg_')
+        self.data = os.path.join(self.directory, 'data')
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+
+    def _tool(self, name):
+        return os.path.join(self.pg_bin, name) if self.pg_bin else name
+
+    def start(self):
+        subprocess.run([self._tool('initdb'), '-D', self.data, '-U', 'postgres', '--auth=trust',
+                        '--encoding=UTF8', '--no-sync'], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self._tool('pg_ctl'), '-D', self.data, '-w', '-l', os.path.join(self.directory, 'log'),
+                        '-o', f"-p {self.port} -k {self.directory} -c listen_addresses='' -c fsync=off",
+                        'start'], check=True, stdout=subprocess.DEVNULL)
+        return f"host={self.directory} port={self.port} user=postgres dbname=postgres"
+
+    def stop(self):
+        subprocess.run([self._tool('pg_ctl'), '-D', self.data, '-m', 'immediate', 'stop'],
+                       check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def prepare_schema(dsn, schema, base_words):
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        cursor.execute(f"SET search_path TO {schema}")
+        cursor.execute(migrations.schema_sql())
+        cursor.execute('''
+            INSERT INTO words (english_word, russian_translation)
+            SELECT 'base' || g, 'база' || g FROM generate_series(1, %s) g
+        ''', (base_words,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def drop_schema(dsn, schema):
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.cursor().execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16, help='сколько пользователей работают одновременно')
+    parser.add_argument('--answers', type=int, default=5, help='ответов в /study на пользователя')
+    parser.add_argument('--base-words', type=int, default=50)
+    parser.add_argument('--api-ms', type=float, default=0.0, help='задержка фейкового Bot API')
+    parser.add_argument('--next-delay', type=float, default=0.0, help='пауза перед следующим вопросом (STUDY_NEXT_DELAY)')
+    parser.add_argument('--pool', type=int, default=10, help='размер пула соединений')
+    parser.add_argument('--dsn', help='база для схемы load_harness (по умолчанию config.DATABASE_URL)')
+    parser.add_argument('--url', help='sqlite:// (временный файл), sqlite:///путь или memory:// вместо PostgreSQL')
+    parser.add_argument('--initdb', action='store_true', help='поднять временный кластер PostgreSQL')
+    parser.add_argument('--pg-bin', help='каталог с initdb и pg_ctl')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    cluster = None
+    dsn = None
+    sqlite_dir = None
+    schema = 'load_harness'
+    scheme = args.url.split('://', 1)[0].lower() if args.url and '://' in args.url else None
+    import config
+
+    if scheme in ('sqlite', 'memory'):
+        config.DATABASE_URL = args.url
+        if args.url.lower() == 'sqlite://':
+            sqlite_dir = tempfile.mkdtemp(prefix='load_harness_sqlite_')
+            config.DATABASE_URL = f"sqlite:///{os.path.join(sqlite_dir, 'bot.db')}"
+        if scheme == 'sqlite':
+            count_sqlite_queries()
+    elif args.url:
+        parser.error("--url: поддерживаются sqlite:// и memory://, для PostgreSQL - --dsn")
+    elif args.initdb:
+        cluster = EphemeralPostgres(args.pg_bin)
+        dsn = cluster.start()
+    else:
+        dsn = args.dsn or config.DATABASE_URL
+
+    try:
+        if dsn is not None:
+            prepare_schema(dsn, schema, args.base_words)
+
+        from telebot import apihelper
+        from observability import setup_logging
+        import main as bot_main
+        import bot_handlers
+
+        setup_logging('WARNING')
+        api = FakeTelegramAPI(args.api_ms)
+        apihelper.CUSTOM_REQUEST_SENDER = api
+        bot_main.bot.threaded = False
+        # Нагрузка идет от немногих пользователей подряд: лимит частоты не применяется
+        bot_main.update_filter.limiter.burst = float('inf')
+        bot_handlers.STUDY_NEXT_DELAY = args.next_delay
+
+        database = bot_main.database
+        if dsn is not None:
+            database._pool = CountingPool(psycopg2.extensions.make_dsn(dsn, options=f'-c search_path={schema}'),
+                                          min_size=1, max_size=args.pool)
+        else:
+            database.check_and_init_database()
+
+        harness = Harness(bot_main.bot, bot_main.outbox, api, args)
+        user_ids = iter(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+        user_ids_lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(args.seed + index)
+            while True:
+                with user_ids_lock:
+                    user_id = next(user_ids, None)
+                if user_id is None:
+                    return
+                harness.run_user(user_id, rng)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        bot_handlers.state_cache.flush()
+        elapsed = time.perf_counter() - started
+
+        storage = f"пул: {args.pool}" if dsn is not None else f"хранилище: {config.DATABASE_URL}"
+        print(f"Пользователей: {args.users}, одновременно: {args.concurrency}, ответов: {args.answers}, "
+              f"{storage}, Bot API: {args.api_ms} мс")
+        report(harness, api, elapsed, queries.total)
+
+        bot_handlers.study_scheduler.stop(wait=True)
+        bot_handlers.state_cache.stop()
+        bot_main.outbox.stop()
+        database.close_pool()
+    finally:
+        if cluster is not None:
+            cluster.stop()
+        elif dsn is not None:
+            drop_schema(dsn, schema)
+        if sqlite_dir is not None:
+            shutil.rmtree(sqlite_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Офлайн-нагрузка на webhook-режим: фейковый отправитель Telegram.
+
+Поднимает webhook_server на локальном порту с обработчиком-заглушкой
+(задержка --handle-ms вместо реальных обработчиков и Bot API), затем
+несколько потоков-"Telegram" отправляют POST-запросы с обновлениями
+для --users пользователей. В конце проверяется, что обновления каждого
+пользователя обработаны по порядку, и печатаются метрики диспетчера.
+
+Запуск:
+    python benchmarks/webhook_load.py --users 500 --updates 20 --workers 8
+
+С --url обновления отправляются во внешний, уже запущенный сервер
+(например, python main.py --webhook); проверка порядка тогда не выполняется.
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook_server import UpdateDispatcher, get_update_user_id, make_webhook_app, make_webhook_server
+
+
+def fake_update(update_id, user_id, text):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'text': text,
+        },
+    }
+
+
+def sender(url, updates, counters, lock):
+    """Фейковый Telegram: отправляет обновления по одному keep-alive соединению."""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    for update in updates:
+        body = json.dumps(update)
+        # Как и Telegram, повторяем доставку, пока сервер отвечает ошибкой
+        while True:
+            conn.request('POST', parts.path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                break
+            with lock:
+                counters['retries'] += 1
+            time.sleep(0.05)
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--updates', type=int, default=20, help='обновлений на пользователя')
+    parser.add_argument('--senders', type=int, default=8, help='параллельных соединений отправителя')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--queue-size', type=int, default=100)
+    parser.add_argument('--handle-ms', type=float, default=2.0)
+    parser.add_argument('--url', help='адрес внешнего webhook-сервера')
+    args = parser.parse_args()
+
+    handled = {}
+    handled_lock = threading.Lock()
+
+    def handler(update):
+        time.sleep(args.handle_ms / 1000)
+        with handled_lock:
+            handled.setdefault(get_update_user_id(update), []).append(update['update_id'])
+
+    server = dispatcher = None
+    url = args.url
+    if url is None:
+        dispatcher = UpdateDispatcher(handler, workers=args.workers, queue_size=args.queue_size, put_timeout=0.1)
+        dispatcher.start()
+        server = make_webhook_server(make_webhook_app(dispatcher), host='127.0.0.1', port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}/webhook'
+
+    # Обновления пользователя отправляются одним отправителем, чтобы сохранить их порядок
+    batches = [[] for _ in range(args.senders)]
+    update_id = 0
+    for round_index in range(args.updates):
+        for user_id in range(1, args.users + 1):
+            update_id += 1
+            batches[user_id % args.senders].append(fake_update(update_id, user_id, f'answer {round_index}'))
+
+    counters = {'retries': 0}
+    counters_lock = threading.Lock()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=sender, args=(url, batch, counters, counters_lock)) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if dispatcher is not None:
+        dispatcher.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"Обновлений: {update_id}, время: {elapsed:.2f} с, {update_id / elapsed:.0f} обновл./с")
+    print(f"Повторных отправок (503): {counters['retries']}")
+
+    if dispatcher is not None:
+        out_of_order = sum(1 for ids in handled.values() if ids != sorted(ids))
+        print(f"Пользователей с нарушенным порядком: {out_of_order}")
+        for key, value in dispatcher.stats().items():
+            print(f"  {key}: {value:.2f}" if isinstance(value, float) else f"  {key}: {value}")
+        server.shutdown()
+        dispatcher.stop()
+
+
+if __name__ == '__main__':
+    main()
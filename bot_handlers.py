@@ -1,222 +1,286 @@
+import io
+import logging
 import time
 
-from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from database import PostgreSQLDatabase as database
+import requests
+
+import config
+import templates
+from answer_log import AnswerLog
+from scheduler import DelayedTaskScheduler
+from state_cache import UserStateCache
+from storage import open_storage
+from study_queue import StudyQueue
+from ttl_cache import TTLCache
+from user_state import Mode, UserState
+from word_import import ImportStats, is_valid_english_word, iter_word_rows
+from word_pages import WordPageCache
+
+logger = logging.getLogger(__name__)
+
+# Хранилище выбирается по схеме DATABASE_URL: PostgreSQL, sqlite:///файл.db или memory://
+database = open_storage(config.DATABASE_URL)
+
+# Кэш состояний пользователей: 'write_behind' (запись в БД пакетами в фоне)
+# или 'write_through' (каждое изменение сразу пишется в БД)
+state_cache = UserStateCache(
+    database,
+    mode=getattr(config, 'STATE_CACHE_MODE', 'write_behind'),
+    max_size=getattr(config, 'STATE_CACHE_SIZE', 10000),
+    ttl=getattr(config, 'STATE_CACHE_TTL', 600.0),
+    flush_interval=getattr(config, 'STATE_CACHE_FLUSH_INTERVAL', 1.0),
+)
+
+# Очередь исходящих вызовов Bot API (OutboundSender): создается в main.py
+# или async_main.py, обработчики только ставят в нее сообщения
+outbox = None
+
+# Пауза перед следующим словом при изучении (в секундах)
+STUDY_NEXT_DELAY = getattr(config, 'STUDY_NEXT_DELAY', 2.0)
+
+# Отложенный показ следующего слова, ключ задачи - user_id
+study_scheduler = DelayedTaskScheduler(max_workers=getattr(config, 'STUDY_SCHEDULER_WORKERS', 4), name='study-next')
+
+# Следующие вопросы каждого изучающего пользователя загружаются заранее,
+# ответы записываются в БД в фоне
+study_queue = StudyQueue(
+    database.prefetch_questions,
+    database.record_answer,
+    size=getattr(config, 'STUDY_PREFETCH_SIZE', 5),
+    low_water=getattr(config, 'STUDY_PREFETCH_LOW', 2),
+    max_users=getattr(config, 'STUDY_PREFETCH_USERS', 1000),
+    workers=getattr(config, 'STUDY_PREFETCH_WORKERS', 2),
+)
+database.word_change_listeners.append(study_queue.invalidate)
+
+# Просроченные слова изучающего пользователя распределяются по дням
+# (Storage.reschedule_deck, не больше RESCHEDULE_DECK_PER_DAY в день) в фоне,
+# не чаще раза в RESCHEDULE_DECK_INTERVAL секунд: после перерыва повторение
+# не начинается с сотен слов сразу
+RESCHEDULE_DECK_PER_DAY = getattr(config, 'RESCHEDULE_DECK_PER_DAY', 50)
+deck_scheduler = DelayedTaskScheduler(max_workers=1, name='deck-reschedule')
+rescheduled_decks = TTLCache(max_size=getattr(config, 'STUDY_PREFETCH_USERS', 1000),
+                             ttl=getattr(config, 'RESCHEDULE_DECK_INTERVAL', 6 * 3600.0))
+
+# Журнал ответов: пишется в БД пачками в фоне, там же периодически
+# обновляются сводки для /stats и выбора слабых слов
+answer_log = AnswerLog(
+    database.log_answers,
+    database.rollup_answers,
+    batch_size=getattr(config, 'ANSWER_LOG_BATCH', 500),
+    flush_interval=getattr(config, 'ANSWER_LOG_FLUSH_MS', 500) / 1000,
+    rollup_interval=getattr(config, 'ANSWER_ROLLUP_INTERVAL', 60.0),
+)
+
+# Страницы списка слов для /delete_word, сбрасываются при изменении словаря
+word_pages = WordPageCache(
+    database.get_user_words_page,
+    page_size=getattr(config, 'DELETE_PAGE_SIZE', 10),
+    max_users=getattr(config, 'DELETE_PAGE_CACHE_USERS', 1000),
+)
+database.word_change_listeners.append(word_pages.invalidate)
 
 
 def get_user_state(user_id):
     """Возвращает состояние пользователя"""
-    return database.get_user_state(user_id)
+    return state_cache.get(user_id)
 
 
-def set_user_state(user_id, state_data):
-    """Устанавливает состояние пользователя в БД"""
-    return database.set_user_state(user_id, state_data)
+def set_user_state(user_id, state):
+    """Устанавливает состояние пользователя"""
+    return state_cache.set(user_id, state)
 
 
 def clear_user_state(user_id):
-    """Очищает состояние пользователя в БД"""
-    return database.clear_user_state(user_id)
+    """Очищает состояние пользователя"""
+    return state_cache.clear(user_id)
 
 
 def send_welcome(message):
     """Обработчик команды /start."""
-    from main import bot
     user_id = message.from_user.id
     username = message.from_user.username
     first_name = message.from_user.first_name
 
+    study_scheduler.cancel(user_id)
     database.register_user(user_id, username, first_name)
     clear_user_state(user_id)
 
-    welcome_text = """🎓 <b>Привет! Я бот для изучения английских слов!</b>
-
-<b>Доступные команды:</b>
-/start - Начать работу с ботом
-/study - 🎯 Начать изучение слов
-/add_word - ➕ Добавить новое слово
-/delete_word - 🗑️ Удалить слово из списка
-/stats - 📊 Показать статистику
-
-<b>Просто выбери команду из меню или введи ее вручную!</b>"""
-
-    bot.send_message(message.chat.id, welcome_text, parse_mode='HTML')
+    outbox.send_message(message.chat.id, templates.WELCOME_TEXT, parse_mode='HTML')
 
 
 def start_study(message):
     """Начинает урок с выбором слова."""
-    from main import bot
     user_id = message.from_user.id
 
-    # Очищаем предыдущее состояние
-    clear_user_state(user_id)
+    # Следующее слово показывается сейчас, отложенный показ больше не нужен
+    study_scheduler.cancel(user_id)
+    schedule_deck_reschedule(user_id)
 
-    question, options, correct_answer = database.get_random_word_and_options(user_id)
-
-    if not question:
-        bot.send_message(message.chat.id,
-                         "📭 <b>Ваш словарь пуст!</b>\n"
-                         "Добавьте слова с помощью /add_word",
-                         parse_mode='HTML')
+    # Вопрос из очереди в памяти; к БД - только если очередь пуста
+    question = study_queue.pop(user_id)
+    if question is None:
+        clear_user_state(user_id)
+        outbox.send_message(message.chat.id, templates.EMPTY_DECK_TEXT, parse_mode='HTML')
         return
 
-    # Сохраняем состояние изучения в БД
-    set_user_state(user_id, {
-        'mode': 'study',
-        'correct_answer': correct_answer,
-        'question': question
-    })
+    ask_question(message.chat.id, user_id, question)
+
 
-    # Создаем клавиатуру с вариантами ответов
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+def schedule_deck_reschedule(user_id):
+    """Ставит пересчет расписания повторений пользователя в фон, если его давно не было."""
+    if rescheduled_decks.get(user_id) is None:
+        rescheduled_decks.set(user_id, True)
+        deck_scheduler.schedule(0, user_id, reschedule_deck, user_id)
+
+
+def reschedule_deck(user_id):
+    """Распределяет просроченные слова по дням; очередь вопросов загружается заново."""
+    if database.reschedule_deck(user_id, RESCHEDULE_DECK_PER_DAY):
+        study_queue.invalidate(user_id)
+
+
+def ask_question(chat_id, user_id, question):
+    """Запоминает загаданное слово и отправляет вопрос."""
+    word_id, text, answer, options = question
+    set_user_state(user_id, UserState(Mode.STUDY, word_id=word_id, question=text, correct_answer=answer))
+    sent = send_study_question(chat_id, text, options)
+    # Время ответа отсчитывается от доставки вопроса, а не от постановки в очередь outbox
+    sent.add_done_callback(lambda future: mark_question_sent(user_id, word_id, future))
+
+
+def mark_question_sent(user_id, word_id, future):
+    """Записывает asked_at, когда Bot API принял вопрос; если вопрос не ушел, время ответа не считается."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    user_state = get_user_state(user_id)
+    if user_state.mode == Mode.STUDY and user_state.word_id == word_id and not user_state.asked_at:
+        user_state.asked_at = int(time.time() * 1000)
+        set_user_state(user_id, user_state)
 
-    # Распределяем кнопки по 2 в ряд
-    buttons = [KeyboardButton(option) for option in options]
-    for i in range(0, len(buttons), 2):
-        row = buttons[i:i + 2]
-        markup.row(*row)
 
-    # Добавляем кнопку отмены
-    markup.row(KeyboardButton("❌ Отменить изучение"))
+def send_study_question(chat_id, question, options):
+    """Отправляет вопрос с вариантами ответа. Возвращает Future отправки."""
 
-    bot.send_message(message.chat.id,
-                     f"<b>Как переводится слово</b> 🔤 <code>{question}</code>?",
-                     reply_markup=markup,
-                     parse_mode='HTML')
+    # Варианты по 2 в ряд и кнопка отмены; JSON клавиатуры кэшируется
+    return outbox.send_message(chat_id,
+                               templates.question_text(question),
+                               reply_markup=templates.study_keyboard(tuple(options)),
+                               parse_mode='HTML')
 
 
 def handle_text_message(message):
     """Обрабатывает все текстовые сообщения."""
-    from main import bot
     user_id = message.from_user.id
     text = message.text.strip()
 
-    user_state = get_user_state(user_id)
-    current_mode = user_state.get('mode', '')
+    current_mode = get_user_state(user_id).mode
 
     # Обработка команды отмены
-    if text.lower() in ['отмена', 'отменить', 'cancel', '❌ отменить изучение']:
+    if text.lower() in templates.CANCEL_TEXTS:
         handle_cancel(message)
         return
 
     # Обработка в зависимости от режима
-    if current_mode == 'study':
+    if current_mode == Mode.IMPORT:
+        outbox.send_message(message.chat.id, templates.IMPORT_WAITING_TEXT, parse_mode='HTML')
+    elif current_mode == Mode.STUDY:
         handle_study_answer(message)
-    elif current_mode == 'add_word_step1':
+    elif current_mode == Mode.ADD_WORD_STEP1:
         handle_add_word_step1(message)
-    elif current_mode == 'add_word_step2':
+    elif current_mode == Mode.ADD_WORD_STEP2:
         handle_add_word_step2(message)
     else:
         # Если не в активном режиме, предлагаем команды
-        bot.send_message(message.chat.id,
-                         "🤔 <b>Не понимаю команду</b>\n"
-                         "Используйте /start для просмотра доступных команд",
-                         parse_mode='HTML')
+        outbox.send_message(message.chat.id, templates.NOT_UNDERSTOOD_TEXT, parse_mode='HTML')
 
 
 def handle_cancel(message):
     """Обрабатывает отмену операции."""
-    from main import bot
     user_id = message.from_user.id
 
+    study_scheduler.cancel(user_id)
     clear_user_state(user_id)
 
-    # Создаем основную клавиатуру
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.row(KeyboardButton("/study"), KeyboardButton("/add_word"))
-    markup.row(KeyboardButton("/stats"), KeyboardButton("/delete_word"))
-
-    bot.send_message(message.chat.id,
-                     "✅ <b>Операция отменена</b>\n"
-                     "Выберите новую команду:",
-                     reply_markup=markup,
-                     parse_mode='HTML')
+    outbox.send_message(message.chat.id,
+                        templates.CANCELLED_TEXT,
+                        reply_markup=templates.MAIN_MENU_KEYBOARD,
+                        parse_mode='HTML')
 
 
 def handle_study_answer(message):
     """Обрабатывает ответ во время изучения."""
-    from main import bot
     user_id = message.from_user.id
     user_answer = message.text.strip()
 
-    user_state = get_user_state(user_id)
-    correct_answer = user_state.get('correct_answer', '')
-    question = user_state.get('question', '')
+    # Ответ на это слово уже принят, следующее слово еще не показано
+    if study_scheduler.is_pending(user_id):
+        return
 
-    # Проверяем ответ
-    if user_answer == correct_answer:
-        response_text = "✅ <b>Правильно! Отлично!</b> 🎉"
+    # Ответ проверяется по состоянию в памяти, запись в БД - в фоне
+    user_state = get_user_state(user_id)
+    correct_answer = user_state.correct_answer
+    was_correct = user_answer == correct_answer
+    study_queue.record_answer(user_id, user_state.word_id, was_correct)
+    if user_state.word_id is not None:
+        latency_ms = int(time.time() * 1000) - user_state.asked_at if user_state.asked_at else None
+        answer_log.record(user_id, user_state.word_id, was_correct, latency_ms)
+
+    if was_correct:
+        response_text = templates.CORRECT_ANSWER_TEXT
     else:
-        response_text = f"❌ <b>Неправильно.</b> Правильный ответ: <code>{correct_answer}</code>"
-
-    bot.send_message(message.chat.id, response_text, parse_mode='HTML')
+        response_text = templates.wrong_answer_text(correct_answer)
 
-    # Пауза перед следующим словом
-    time.sleep(2)
+    outbox.send_message(message.chat.id, response_text, parse_mode='HTML')
 
-    # Запускаем следующее слово
-    start_study(message)
+    # Показываем следующее слово после паузы, не занимая поток обработчика
+    question = study_queue.pop(user_id)
+    if question:
+        study_scheduler.schedule(STUDY_NEXT_DELAY, user_id, ask_question, message.chat.id, user_id, question)
+    else:
+        study_scheduler.schedule(STUDY_NEXT_DELAY, user_id, start_study, message)
 
 
 def add_word_step_1(message):
     """Начинает процесс добавления слова."""
-    from main import bot
     user_id = message.from_user.id
 
-    # Устанавливаем состояние
-    set_user_state(user_id, {'mode': 'add_word_step1'})
+    study_scheduler.cancel(user_id)
 
-    # Создаем клавиатуру с кнопкой отмены
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.row(KeyboardButton("❌ Отмена"))
+    # Устанавливаем состояние
+    set_user_state(user_id, UserState(Mode.ADD_WORD_STEP1))
 
-    bot.send_message(message.chat.id,
-                     "📝 <b>Введите слово на английском:</b>\n"
-                     "<i>Или нажмите '❌ Отмена' для отмены</i>",
-                     reply_markup=markup,
-                     parse_mode='HTML')
+    outbox.send_message(message.chat.id,
+                        templates.ADD_WORD_PROMPT_TEXT,
+                        reply_markup=templates.CANCEL_KEYBOARD,
+                        parse_mode='HTML')
 
 
 def handle_add_word_step1(message):
     """Обрабатывает первый шаг добавления слова."""
-    from main import bot
     user_id = message.from_user.id
     english_word = message.text.strip().lower()
 
     # Проверяем валидность слова
-    if not english_word or not all(c.isalpha() or c.isspace() for c in english_word):
-        bot.send_message(message.chat.id,
-                         "❌ <b>Слово должно содержать только буквы!</b>\n"
-                         "Попробуйте еще раз:",
-                         parse_mode='HTML')
+    if not is_valid_english_word(english_word):
+        outbox.send_message(message.chat.id, templates.INVALID_WORD_TEXT, parse_mode='HTML')
         return
 
     # Переходим к следующему шагу
-    set_user_state(user_id, {
-        'mode': 'add_word_step2',
-        'english_word': english_word
-    })
+    set_user_state(user_id, UserState(Mode.ADD_WORD_STEP2, english_word=english_word))
 
-    bot.send_message(message.chat.id,
-                     f"🌍 <b>Отлично! Слово:</b> <code>{english_word}</code>\n"
-                     "<b>Теперь введите перевод на русский:</b>",
-                     parse_mode='HTML')
+    outbox.send_message(message.chat.id, templates.translation_prompt_text(english_word), parse_mode='HTML')
 
 
 def handle_add_word_step2(message):
     """Обрабатывает второй шаг добавления слова."""
-    from main import bot
     user_id = message.from_user.id
     russian_translation = message.text.strip()
 
-    user_state = get_user_state(user_id)
-    english_word = user_state.get('english_word', '')
+    english_word = get_user_state(user_id).english_word
 
     if not english_word:
-        bot.send_message(message.chat.id,
-                         "❌ <b>Ошибка процесса добавления.</b>\n"
-                         "Начните заново с /add_word",
-                         parse_mode='HTML')
+        outbox.send_message(message.chat.id, templates.ADD_WORD_LOST_TEXT, parse_mode='HTML')
         clear_user_state(user_id)
         return
 
@@ -224,88 +288,136 @@ def handle_add_word_step2(message):
     success = database.add_word_to_db(user_id, english_word, russian_translation)
 
     # Восстанавливаем основную клавиатуру
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.row(KeyboardButton("/study"), KeyboardButton("/add_word"))
-    markup.row(KeyboardButton("/stats"), KeyboardButton("/delete_word"))
+    markup = templates.MAIN_MENU_KEYBOARD
 
     if success:
         words_count = database.get_word_count(user_id)
-        bot.send_message(message.chat.id,
-                         f"✅ <b>Слово '{english_word}' успешно добавлено!</b>\n"
-                         f"📊 <b>Теперь вы изучаете {words_count} слов.</b>",
-                         reply_markup=markup,
-                         parse_mode='HTML')
+        outbox.send_message(message.chat.id,
+                            templates.word_added_text(english_word, words_count),
+                            reply_markup=markup,
+                            parse_mode='HTML')
     else:
-        bot.send_message(message.chat.id,
-                         "❌ <b>Произошла ошибка при добавлении слова.</b>\n"
-                         "Возможно, такое слово уже существует.",
-                         reply_markup=markup,
-                         parse_mode='HTML')
+        outbox.send_message(message.chat.id, templates.ADD_WORD_FAILED_TEXT, reply_markup=markup, parse_mode='HTML')
 
     # Очищаем состояние
     clear_user_state(user_id)
 
 
+def import_words_start(message):
+    """Начинает импорт слов из файла."""
+    user_id = message.from_user.id
+
+    study_scheduler.cancel(user_id)
+    set_user_state(user_id, UserState(Mode.IMPORT))
+
+    outbox.send_message(message.chat.id,
+                        templates.IMPORT_PROMPT_TEXT,
+                        reply_markup=templates.CANCEL_KEYBOARD,
+                        parse_mode='HTML')
+
+
+def handle_document(message):
+    """Импортирует слова из присланного CSV/TSV файла."""
+    user_id = message.from_user.id
+
+    if get_user_state(user_id).mode != Mode.IMPORT:
+        outbox.send_message(message.chat.id, templates.IMPORT_NOT_STARTED_TEXT, parse_mode='HTML')
+        return
+
+    document = message.document
+    stats = ImportStats()
+    result = None
+    try:
+        # Файл читается из потока по строкам, без загрузки целиком в память
+        with requests.get(outbox.bot.get_file_url(document.file_id), stream=True, timeout=60) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            text_stream = io.TextIOWrapper(response.raw, encoding='utf-8-sig', errors='replace', newline='')
+            result = database.import_words(user_id, iter_word_rows(text_stream, stats, document.file_name or ''))
+    except Exception as e:
+        logger.error("Ошибка при загрузке файла импорта: %s", e, extra={'user_id': user_id})
+
+    clear_user_state(user_id)
+
+    markup = templates.MAIN_MENU_KEYBOARD
+
+    if result is None:
+        outbox.send_message(message.chat.id, templates.IMPORT_FAILED_TEXT, reply_markup=markup, parse_mode='HTML')
+        return
+
+    staged, inserted = result
+    words_count = database.get_word_count(user_id)
+    outbox.send_message(message.chat.id,
+                        templates.import_done_text(staged, inserted, stats.rejected, words_count),
+                        reply_markup=markup,
+                        parse_mode='HTML')
+
+
 def delete_word_list(message):
-    """Показывает список слов пользователя для удаления."""
-    from main import bot
+    """Показывает первую страницу слов пользователя для удаления."""
     user_id = message.from_user.id
-    words = database.get_user_words(user_id)
+    page, words, has_next = word_pages.get_page(user_id, 0)
 
     if not words:
-        bot.send_message(message.chat.id, "📭 <b>Ваш словарь пуст.</b>", parse_mode='HTML')
+        outbox.send_message(message.chat.id, templates.EMPTY_LIST_TEXT, parse_mode='HTML')
         return
 
-    markup = InlineKeyboardMarkup()
-    for word_id, en_word, ru_translation in words:
-        callback_data = f"delete_{word_id}"
-        # Ограничиваем длину текста кнопки
-        button_text = f"❌ {en_word} - {ru_translation}"
-        if len(button_text) > 40:
-            button_text = f"❌ {en_word} - {ru_translation[:15]}..."
-        btn = InlineKeyboardButton(button_text, callback_data=callback_data)
-        markup.add(btn)
+    outbox.send_message(message.chat.id,
+                        templates.DELETE_PROMPT_TEXT,
+                        reply_markup=templates.delete_keyboard(page, words, has_next),
+                        parse_mode='HTML')
+
+
+def handle_delete_page(call):
+    """Обрабатывает переход между страницами списка слов."""
+    user_id = call.from_user.id
+    page, words, has_next = word_pages.get_page(user_id, int(call.data.split('_')[1]))
+
+    outbox.answer_callback_query(call.id, chat_id=call.message.chat.id)
+    if not words:
+        outbox.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text=templates.EMPTY_LIST_TEXT,
+            parse_mode='HTML'
+        )
+        return
 
-    bot.send_message(message.chat.id,
-                     "🗑️ <b>Выберите слово для удаления:</b>",
-                     reply_markup=markup,
-                     parse_mode='HTML')
+    outbox.edit_message_reply_markup(
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
+        reply_markup=templates.delete_keyboard(page, words, has_next)
+    )
 
 
 def handle_delete_query(call):
     """Обрабатывает нажатие на кнопку удаления."""
-    from main import bot
     user_id = call.from_user.id
     word_id = int(call.data.split('_')[1])
 
     success = database.delete_word_from_user(user_id, word_id)
 
     if success:
-        bot.answer_callback_query(call.id, "✅ Слово удалено!")
-        bot.edit_message_text(
+        outbox.answer_callback_query(call.id, templates.WORD_DELETED_ALERT, chat_id=call.message.chat.id)
+        outbox.edit_message_text(
             chat_id=call.message.chat.id,
             message_id=call.message.message_id,
-            text="✅ <b>Слово удалено.</b>\nНажмите /delete_word для управления другими словами.",
+            text=templates.WORD_DELETED_TEXT,
             parse_mode='HTML'
         )
     else:
-        bot.answer_callback_query(call.id, "❌ Не удалось удалить слово.")
+        outbox.answer_callback_query(call.id, templates.WORD_NOT_DELETED_ALERT, chat_id=call.message.chat.id)
 
 
 def show_stats(message):
-    """Показывает количество слов, которые изучает пользователь."""
-    from main import bot
+    """Показывает статистику пользователя: слова, точность ответов, серию дней."""
     user_id = message.from_user.id
-    words_count = database.get_word_count(user_id)
+    stats = database.get_stats(user_id)
+    words_count = stats['word_count'] if stats else 0
 
     if words_count == 0:
-        bot.send_message(message.chat.id,
-                         "📭 <b>Ваш словарь пуст.</b>\n"
-                         "Добавьте слова с помощью /add_word",
-                         parse_mode='HTML')
-    else:
-        bot.send_message(message.chat.id,
-                         f"📊 <b>Вы изучаете {words_count} слов.</b>\n"
-                         "Начните изучение: /study",
-                         parse_mode='HTML')
+        outbox.send_message(message.chat.id, templates.EMPTY_STATS_TEXT, parse_mode='HTML')
+        return
 
+    weak_words = database.get_weak_words(user_id)
+    outbox.send_message(message.chat.id, templates.stats_text(stats, weak_words), parse_mode='HTML')
@@ -0,0 +1,340 @@
+"""Многопроцессный режим: один процесс принимает обновления, N процессов их обрабатывают.
+
+Процесс приема получает обновления long polling'ом (или через webhook с
+--webhook) и раскладывает JSON по очередям multiprocessing: обновление
+пользователя попадает в процесс user_id % N, поэтому состояние диалога,
+кэши и очереди вопросов пользователя живут в одном процессе и порядок его
+обновлений сохраняется. Внутри процесса обновления обрабатывает
+UpdateDispatcher из webhook_server (потоки с тем же разбиением).
+
+Общее хранилище процессов - база данных (PostgreSQL или файл SQLite):
+users.state_mode/state_data, словари и счетчики. memory:// в этом режиме не работает.
+Лимит исходящих сообщений Telegram (OUTBOUND_GLOBAL_RATE) делится между
+процессами поровну, лимит на чат соблюдается, так как чат закреплен за
+одним процессом. Метрики процесса i - на порту METRICS_PORT + 1 + i.
+
+Завершившийся процесс-обработчик перезапускается с новой очередью:
+убитый процесс мог оставить занятой блокировку старой, поэтому обновления,
+которые в ней оставались или обрабатывались, теряются. Если
+перезапусков больше CLUSTER_MAX_RESTARTS, процесс приема завершается с
+ошибкой: неподтвержденные обновления Telegram доставит повторно.
+
+Запуск:
+    python cluster.py --processes 4
+    python cluster.py --processes 4 --webhook
+"""
+import argparse
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+
+import config
+from webhook_server import get_update_user_id
+
+logger = logging.getLogger(__name__)
+
+# Процессов-обработчиков и потоков в каждом из них
+CLUSTER_PROCESSES = getattr(config, 'CLUSTER_PROCESSES', 2)
+CLUSTER_THREADS = getattr(config, 'CLUSTER_THREADS', 4)
+CLUSTER_QUEUE_SIZE = getattr(config, 'CLUSTER_QUEUE_SIZE', 1000)
+# Сколько раз за время работы можно перезапустить упавшие процессы-обработчики
+CLUSTER_MAX_RESTARTS = getattr(config, 'CLUSTER_MAX_RESTARTS', 5)
+# Сколько секунд прием ждет места в очередях обработчиков, прежде чем завершиться с ошибкой
+CLUSTER_SUBMIT_TIMEOUT = getattr(config, 'CLUSTER_SUBMIT_TIMEOUT', 60.0)
+
+
+def run_worker(index, processes, threads, update_queue, processed, setup=None):
+    """Точка входа процесса-обработчика.
+
+    setup() вызывается до импорта main (например, чтобы подменить config
+    в benchmarks/bench_cluster.py).
+    """
+    if setup is not None:
+        setup()
+    # Лимиты считаются в каждом процессе: общий лимит Telegram делится поровну
+    config.OUTBOUND_GLOBAL_RATE = getattr(config, 'OUTBOUND_GLOBAL_RATE', 30.0) / processes
+    config.OUTBOUND_GLOBAL_BURST = max(1, getattr(config, 'OUTBOUND_GLOBAL_BURST', 30) // processes)
+    metrics_port = getattr(config, 'METRICS_PORT', 9108)
+    config.METRICS_PORT = metrics_port + 1 + index if metrics_port else 0
+
+    import main
+    from webhook_server import UpdateDispatcher, telebot_update_handler
+
+    main.setup_observability()
+    if not main.initialize_database():
+        logger.error("Процесс %s: не удалось инициализировать базу данных", index)
+        sys.exit(1)
+
+    handle = telebot_update_handler(main.bot)
+
+    def handle_counted(update):
+        try:
+            handle(update)
+        finally:
+            with processed.get_lock():
+                processed.value += 1
+
+    dispatcher = UpdateDispatcher(handle_counted, workers=threads, queue_size=CLUSTER_QUEUE_SIZE)
+    dispatcher.start()
+    logger.info("Процесс-обработчик %s из %s запущен", index, processes)
+    try:
+        while True:
+            update = update_queue.get()
+            if update is None:
+                break
+            # Очередь потока заполнена: ждем, очередь процесса придержит прием
+            while not dispatcher.submit(update):
+                pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.stop()
+        main.shutdown()
+
+
+class ProcessDispatcher:
+    """Раскладывает JSON обновлений по процессам-обработчикам (user_id % processes).
+
+    Интерфейс как у UpdateDispatcher: submit возвращает False, если очередь
+    процесса заполнена дольше put_timeout. Фоновый поток раз в
+    check_interval секунд перезапускает завершившиеся процессы; после
+    max_restarts перезапусков устанавливается событие failed и submit
+    больше не принимает обновления.
+    """
+
+    def __init__(self, processes=CLUSTER_PROCESSES, threads=CLUSTER_THREADS, queue_size=CLUSTER_QUEUE_SIZE,
+                 put_timeout=1.0, setup=None, max_restarts=CLUSTER_MAX_RESTARTS, check_interval=1.0):
+        # spawn: процессы не наследуют потоки и соединения с БД родителя
+        self._context = multiprocessing.get_context('spawn')
+        self.put_timeout = put_timeout
+        self.max_restarts = max_restarts
+        self.check_interval = check_interval
+        self._threads = threads
+        self._setup = setup
+        self._queue_size = queue_size
+        self._queues = [self._context.Queue(maxsize=queue_size) for _ in range(processes)]
+        self._processed = [self._context.Value('q', 0) for _ in range(processes)]
+        self._processes = [self._make_process(index) for index in range(processes)]
+        self._lock = threading.Lock()
+        # Перезапуск процессов и остановка не выполняются одновременно
+        self._process_lock = threading.Lock()
+        self._accepted = 0
+        self._rejected = 0
+        self._restarts = 0
+        # Обработано и потеряно процессами, которые были перезапущены
+        self._processed_before = 0
+        self._lost = 0
+        self._stopping = threading.Event()
+        self.failed = threading.Event()
+        self._supervisor = None
+
+    def _make_process(self, index):
+        return self._context.Process(
+            target=run_worker, name=f'bot-worker-{index}',
+            args=(index, len(self._queues), self._threads, self._queues[index], self._processed[index], self._setup)
+        )
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+        self._supervisor = threading.Thread(target=self._supervise, name='cluster-supervisor', daemon=True)
+        self._supervisor.start()
+
+    def _supervise(self):
+        while not self._stopping.wait(self.check_interval):
+            self.check_workers()
+
+    def check_workers(self):
+        """Перезапускает завершившиеся процессы-обработчики. False, если лимит перезапусков исчерпан."""
+        with self._process_lock:
+            if self._stopping.is_set() or self.failed.is_set():
+                return not self.failed.is_set()
+            for index, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                logger.error("Процесс %s завершился (код %s)", process.name, process.exitcode)
+                if self._restarts >= self.max_restarts:
+                    logger.error("Процессы-обработчики перезапускались %s раз, прием останавливается",
+                                 self._restarts)
+                    self.failed.set()
+                    return False
+                self._restarts += 1
+                self._replace_queue(index)
+                self._processes[index] = self._make_process(index)
+                self._processes[index].start()
+        return True
+
+    def _replace_queue(self, index):
+        # Блокировки старых очереди и счетчика не трогаем: их мог держать убитый процесс
+        processed = self._processed[index].get_obj().value
+        try:
+            lost = self._queues[index].qsize()
+        except NotImplementedError:
+            lost = 0
+        if lost:
+            logger.error("Потеряно обновлений в очереди процесса %s: %s", index, lost)
+        self._processed_before += processed
+        self._lost += lost
+        # Данные, которые еще не ушли в старую очередь, не должны задерживать выход
+        self._queues[index].cancel_join_thread()
+        self._queues[index] = self._context.Queue(maxsize=self._queue_size)
+        self._processed[index] = self._context.Value('q', 0)
+
+    def submit(self, update):
+        if self.failed.is_set():
+            with self._lock:
+                self._rejected += 1
+            return False
+        update_queue = self._queues[get_update_user_id(update) % len(self._queues)]
+        try:
+            update_queue.put(update, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._accepted += 1
+        return True
+
+    def processed(self):
+        return self._processed_before + sum(value.get_obj().value for value in self._processed)
+
+    def join(self, timeout=None):
+        """Ждет обработки всех принятых обновлений (кроме потерянных при перезапуске). False по таймауту."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.processed() + self._lost < self._accepted:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            if not all(process.is_alive() for process in self._processes):
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stop(self, timeout=30.0):
+        with self._process_lock:
+            self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for update_queue, process in zip(self._queues, self._processes):
+            # Очередь заполнена или процесс не забирает из нее: он будет остановлен по таймауту
+            try:
+                update_queue.put(None, timeout=max(0.0, min(self.put_timeout, deadline - time.monotonic())))
+            except queue.Full:
+                logger.warning("Очередь процесса %s заполнена, сигнал остановки не передан", process.name)
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Процесс %s не завершился, останавливаем", process.name)
+                process.terminate()
+
+    def stats(self):
+        with self._lock:
+            accepted, rejected = self._accepted, self._rejected
+        return {
+            'processes': len(self._processes),
+            'alive': sum(process.is_alive() for process in self._processes),
+            'accepted': accepted,
+            'rejected': rejected,
+            'processed': self.processed(),
+            'restarts': self._restarts,
+            'lost': self._lost,
+        }
+
+
+def poll_updates(dispatcher, token, timeout=20, submit_timeout=CLUSTER_SUBMIT_TIMEOUT):
+    """Long polling в процессе приема: обновление подтверждается, когда принято в очередь.
+
+    Если обновление не удается передать обработчикам submit_timeout секунд
+    или обработчики не перезапускаются, выбрасывает RuntimeError.
+    """
+    from telebot import apihelper
+
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(token, offset=offset, timeout=timeout, long_polling_timeout=timeout)
+        except Exception as e:
+            logger.error("Ошибка при получении обновлений: %s", e)
+            time.sleep(1)
+            continue
+        for update in updates:
+            deadline = time.monotonic() + submit_timeout
+            while not dispatcher.submit(update):
+                if dispatcher.failed.is_set():
+                    raise RuntimeError("процессы-обработчики не работают")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"очереди обработчиков заполнены дольше {submit_timeout} с")
+                logger.warning("Очереди обработчиков заполнены, прием приостановлен")
+            offset = update['update_id'] + 1
+
+
+def serve_webhook(dispatcher, token):
+    from telebot import TeleBot
+    from webhook_server import make_webhook_app, make_webhook_server
+
+    path = getattr(config, 'WEBHOOK_PATH', '/webhook')
+    secret_token = getattr(config, 'WEBHOOK_SECRET', None)
+    server = make_webhook_server(
+        make_webhook_app(dispatcher, path=path, secret_token=secret_token),
+        host=getattr(config, 'WEBHOOK_HOST', '0.0.0.0'),
+        port=getattr(config, 'WEBHOOK_PORT', 8443),
+    )
+    bot = TeleBot(token)
+    bot.remove_webhook()
+    bot.set_webhook(url=config.WEBHOOK_URL, secret_token=secret_token)
+    logger.info("Webhook: %s -> порт %s", config.WEBHOOK_URL, server.server_port)
+
+    def shutdown_on_failure():
+        dispatcher.failed.wait()
+        server.shutdown()
+
+    threading.Thread(target=shutdown_on_failure, name='webhook-watchdog', daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+    if dispatcher.failed.is_set():
+        raise RuntimeError("процессы-обработчики не работают")
+
+
+def main():
+    from observability import metrics, setup_logging, start_metrics_server
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=CLUSTER_PROCESSES)
+    parser.add_argument('--threads', type=int, default=CLUSTER_THREADS, help='потоков в процессе-обработчике')
+    parser.add_argument('--webhook', action='store_true')
+    args = parser.parse_args()
+
+    setup_logging(getattr(config, 'LOG_LEVEL', 'INFO'), getattr(config, 'LOG_FORMAT', 'text'))
+    if config.DATABASE_URL.lower().startswith('memory://'):
+        logger.error("memory:// не разделяется между процессами: укажите PostgreSQL или sqlite:///")
+        return 1
+
+    dispatcher = ProcessDispatcher(args.processes, args.threads)
+    dispatcher.start()
+    metrics.register_gauges('cluster', dispatcher.stats)
+    port = getattr(config, 'METRICS_PORT', 9108)
+    if port:
+        start_metrics_server(getattr(config, 'METRICS_HOST', '127.0.0.1'), port)
+    logger.info("Запуск English Learning Bot: %s процессов по %s потоков", args.processes, args.threads)
+
+    try:
+        if args.webhook:
+            serve_webhook(dispatcher, config.BOT_TOKEN)
+        else:
+            poll_updates(dispatcher, config.BOT_TOKEN)
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        logger.error("Прием обновлений остановлен: %s", e)
+        return 1
+    finally:
+        dispatcher.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,13 @@ CREATE TABLE IF NOT EXISTS users (
     username TEXT,
     first_name TEXT NOT NULL,
     user_state TEXT DEFAULT '{}',
+    base_deck BOOLEAN NOT NULL DEFAULT TRUE,
+    word_count INTEGER,
+    answers_total INTEGER NOT NULL DEFAULT 0,
+    answers_correct INTEGER NOT NULL DEFAULT 0,
+    streak_days INTEGER NOT NULL DEFAULT 0,
+    best_streak_days INTEGER NOT NULL DEFAULT 0,
+    last_studied_on DATE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -15,8 +22,25 @@ CREATE TABLE IF NOT EXISTS words (
     added_by BIGINT DEFAULT NULL
 );
 
--- Создание таблицы связи пользователей и слов
+-- Создание таблицы связи пользователей и слов: собственные слова пользователя
+-- и прогресс изучения. Базовые слова (added_by IS NULL) общие для всех и
+-- попадают сюда только при первом ответе на них (копирование при записи)
 CREATE TABLE IF NOT EXISTS user_words (
+    user_id BIGINT,
+    word_id INTEGER,
+    correct_count INTEGER NOT NULL DEFAULT 0,
+    wrong_count INTEGER NOT NULL DEFAULT 0,
+    ease REAL NOT NULL DEFAULT 2.5,
+    interval_days REAL NOT NULL DEFAULT 0,
+    repetitions INTEGER NOT NULL DEFAULT 0,
+    due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, word_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (word_id) REFERENCES words(word_id) ON DELETE CASCADE
+);
+
+-- Базовые слова, которые пользователь удалил из своего словаря
+CREATE TABLE IF NOT EXISTS user_hidden_words (
     user_id BIGINT,
     word_id INTEGER,
     PRIMARY KEY (user_id, word_id),
@@ -28,4 +52,162 @@ CREATE TABLE IF NOT EXISTS user_words (
 CREATE INDEX IF NOT EXISTS idx_user_words_user_id ON user_words(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_words_word_id ON user_words(word_id);
 CREATE INDEX IF NOT EXISTS idx_words_english ON words(english_word);
-CREATE INDEX IF NOT EXISTS idx_words_added_by ON words(added_by);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_words_added_by ON words(added_by);
+
+-- Подписка на базовый словарь для баз, созданных до ее появления
+ALTER TABLE users ADD COLUMN IF NOT EXISTS base_deck BOOLEAN NOT NULL DEFAULT TRUE;
+
+-- Статистика пользователя хранится в готовом виде: word_count пересчитывается
+-- при изменении словаря (NULL - еще не посчитан), ответы и серия дней
+-- обновляются функцией study_turn
+ALTER TABLE users ADD COLUMN IF NOT EXISTS word_count INTEGER;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS answers_total INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS answers_correct INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS streak_days INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS best_streak_days INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_studied_on DATE;
+
+-- Словарь пользователя: собственные слова и прогресс из user_words плюс
+-- общие базовые слова, кроме скрытых пользователем
+CREATE OR REPLACE VIEW user_deck AS
+SELECT uw.user_id, uw.word_id
+FROM user_words uw
+UNION ALL
+SELECT u.user_id, w.word_id
+FROM users u
+INNER JOIN words w ON w.added_by IS NULL
+WHERE u.base_deck
+  AND NOT EXISTS (SELECT 1 FROM user_words uw WHERE uw.user_id = u.user_id AND uw.word_id = w.word_id)
+  AND NOT EXISTS (SELECT 1 FROM user_hidden_words h WHERE h.user_id = u.user_id AND h.word_id = w.word_id);
+
+-- Счетчики ответов для баз, созданных до их появления
+ALTER TABLE user_words ADD COLUMN IF NOT EXISTS correct_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE user_words ADD COLUMN IF NOT EXISTS wrong_count INTEGER NOT NULL DEFAULT 0;
+
+-- Интервальное повторение (SM-2): параметры слова и время следующего показа
+ALTER TABLE user_words ADD COLUMN IF NOT EXISTS ease REAL NOT NULL DEFAULT 2.5;
+ALTER TABLE user_words ADD COLUMN IF NOT EXISTS interval_days REAL NOT NULL DEFAULT 0;
+ALTER TABLE user_words ADD COLUMN IF NOT EXISTS repetitions INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE user_words ADD COLUMN IF NOT EXISTS due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+-- Очередь повторения: ближайшее слово к показу находится по индексу
+CREATE INDEX IF NOT EXISTS idx_user_words_due ON user_words(user_id, due_at);
+
+-- Один ход изучения за один запрос: проверяет ответ на предыдущее слово,
+-- записывает результат и пересчитывает интервал повторения (SM-2, формулы
+-- совпадают с srs.review), выбирает следующее слово из очереди повторения
+-- и варианты ответа из p_word_ids (случайные word_id словаря; если слов к
+-- повторению нет, загадывается первое из них) и сохраняет новое состояние
+CREATE OR REPLACE FUNCTION study_turn(p_user_id BIGINT, p_answer TEXT, p_word_ids INTEGER[])
+RETURNS TABLE (was_correct BOOLEAN, previous_answer TEXT, question TEXT,
+               correct_answer TEXT, options TEXT[], new_state TEXT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_state JSONB;
+    v_prev_word_id INTEGER;
+    v_target_id INTEGER;
+    v_quality INTEGER;
+BEGIN
+    SELECT NULLIF(user_state, '')::JSONB INTO v_state
+    FROM users WHERE user_id = p_user_id
+    FOR UPDATE;
+
+    IF p_answer IS NOT NULL AND v_state->>'mode' = 'study' THEN
+        previous_answer := v_state->>'correct_answer';
+        was_correct := p_answer = previous_answer;
+        v_prev_word_id := (v_state->>'word_id')::INTEGER;
+
+        UPDATE users
+        SET answers_total = answers_total + 1,
+            answers_correct = answers_correct + was_correct::INTEGER,
+            streak_days = s.streak_days,
+            best_streak_days = GREATEST(best_streak_days, s.streak_days),
+            last_studied_on = CURRENT_DATE
+        FROM (
+            SELECT CASE
+                       WHEN last_studied_on = CURRENT_DATE THEN streak_days
+                       WHEN last_studied_on = CURRENT_DATE - 1 THEN streak_days + 1
+                       ELSE 1
+                   END AS streak_days
+            FROM users WHERE user_id = p_user_id
+        ) s
+        WHERE users.user_id = p_user_id;
+
+        IF v_prev_word_id IS NOT NULL
+           AND EXISTS (SELECT 1 FROM user_deck d WHERE d.user_id = p_user_id AND d.word_id = v_prev_word_id) THEN
+            -- Базовое слово получает собственную строку при первом ответе
+            INSERT INTO user_words (user_id, word_id) VALUES (p_user_id, v_prev_word_id)
+            ON CONFLICT (user_id, word_id) DO NOTHING;
+
+            v_quality := CASE WHEN was_correct THEN 4 ELSE 1 END;
+            UPDATE user_words uw
+            SET correct_count = uw.correct_count + was_correct::INTEGER,
+                wrong_count = uw.wrong_count + (NOT was_correct)::INTEGER,
+                ease = r.ease,
+                interval_days = r.interval_days,
+                repetitions = r.repetitions,
+                due_at = CURRENT_TIMESTAMP + CASE
+                    WHEN was_correct THEN r.interval_days * INTERVAL '1 day'
+                    ELSE INTERVAL '10 minutes'
+                END
+            FROM (
+                SELECT GREATEST(1.3, ease + 0.1 - (5 - v_quality) * (0.08 + (5 - v_quality) * 0.02)) AS ease,
+                       CASE
+                           WHEN NOT was_correct THEN 0
+                           WHEN repetitions = 0 THEN 1
+                           WHEN repetitions = 1 THEN 6
+                           ELSE interval_days * GREATEST(1.3, ease + 0.1 - (5 - v_quality) * (0.08 + (5 - v_quality) * 0.02))
+                       END AS interval_days,
+                       CASE WHEN was_correct THEN repetitions + 1 ELSE 0 END AS repetitions
+                FROM user_words
+                WHERE user_id = p_user_id AND word_id = v_prev_word_id
+            ) r
+            WHERE uw.user_id = p_user_id AND uw.word_id = v_prev_word_id;
+        END IF;
+    END IF;
+
+    -- Самое давно ожидающее повторения слово (индекс idx_user_words_due)
+    SELECT uw.word_id INTO v_target_id
+    FROM user_words uw
+    WHERE uw.user_id = p_user_id AND uw.due_at <= CURRENT_TIMESTAMP
+    ORDER BY uw.due_at
+    LIMIT 1;
+
+    IF v_target_id IS NULL THEN
+        v_target_id := (
+            SELECT w.word_id FROM words w
+            WHERE w.word_id = ANY(p_word_ids)
+            ORDER BY array_position(p_word_ids, w.word_id)
+            LIMIT 1
+        );
+    END IF;
+
+    SELECT array_agg(english_word ORDER BY pos) INTO options
+    FROM (
+        SELECT w.english_word, 0 AS pos FROM words w WHERE w.word_id = v_target_id
+        UNION ALL
+        (SELECT w.english_word, array_position(p_word_ids, w.word_id) AS pos
+         FROM words w
+         WHERE w.word_id = ANY(p_word_ids) AND w.word_id <> v_target_id
+         ORDER BY 2
+         LIMIT 3)
+    ) o;
+
+    IF v_target_id IS NULL THEN
+        new_state := '{}';
+    ELSE
+        SELECT w.russian_translation, w.english_word INTO question, correct_answer
+        FROM words w WHERE w.word_id = v_target_id;
+
+        new_state := jsonb_build_object(
+            'mode', 'study',
+            'correct_answer', correct_answer,
+            'question', question,
+            'word_id', v_target_id
+        )::TEXT;
+    END IF;
+
+    UPDATE users SET user_state = new_state WHERE user_id = p_user_id;
+    RETURN NEXT;
+END;
+$$;
\ No newline at end of file
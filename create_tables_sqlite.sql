@@ -0,0 +1,100 @@
+-- Схема для SQLiteDatabase (DATABASE_URL = sqlite:///english_bot.db).
+-- Повторяет create_tables.sql; время (due_at) хранится в секундах Unix,
+-- даты - строками ISO. Столбцы, которых нет в старых файлах БД,
+-- добавляет SQLiteDatabase._migrate_columns.
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT NOT NULL,
+    state_mode INTEGER NOT NULL DEFAULT 0,
+    state_data BLOB,
+    base_deck INTEGER NOT NULL DEFAULT 1,
+    word_count INTEGER,
+    streak_days INTEGER NOT NULL DEFAULT 0,
+    best_streak_days INTEGER NOT NULL DEFAULT 0,
+    last_studied_on TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS words (
+    word_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    english_word TEXT UNIQUE NOT NULL,
+    russian_translation TEXT NOT NULL,
+    added_by INTEGER DEFAULT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_words (
+    user_id INTEGER,
+    word_id INTEGER,
+    correct_count INTEGER NOT NULL DEFAULT 0,
+    wrong_count INTEGER NOT NULL DEFAULT 0,
+    ease REAL NOT NULL DEFAULT 2.5,
+    interval_days REAL NOT NULL DEFAULT 0,
+    repetitions INTEGER NOT NULL DEFAULT 0,
+    due_at REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, word_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (word_id) REFERENCES words(word_id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS user_hidden_words (
+    user_id INTEGER,
+    word_id INTEGER,
+    PRIMARY KEY (user_id, word_id),
+    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+    FOREIGN KEY (word_id) REFERENCES words(word_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_words_added_by ON words(added_by);
+CREATE INDEX IF NOT EXISTS idx_user_words_word_id ON user_words(word_id);
+
+-- Словарь пользователя: собственные слова и прогресс из user_words плюс
+-- общие базовые слова, кроме скрытых пользователем
+CREATE VIEW IF NOT EXISTS user_deck AS
+SELECT uw.user_id, uw.word_id
+FROM user_words uw
+UNION ALL
+SELECT u.user_id, w.word_id
+FROM users u
+INNER JOIN words w ON w.added_by IS NULL
+WHERE u.base_deck
+  AND NOT EXISTS (SELECT 1 FROM user_words uw WHERE uw.user_id = u.user_id AND uw.word_id = w.word_id)
+  AND NOT EXISTS (SELECT 1 FROM user_hidden_words h WHERE h.user_id = u.user_id AND h.word_id = w.word_id);
+
+-- Журнал ответов и сводки по нему (как answer_log.sql); время - секунды Unix
+CREATE TABLE IF NOT EXISTS answers (
+    answer_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    word_id INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_ms INTEGER,
+    answered_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_answer_stats (
+    user_id INTEGER PRIMARY KEY,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    latency_ms_total INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    last_answered_at REAL
+);
+
+CREATE TABLE IF NOT EXISTS word_answer_stats (
+    user_id INTEGER NOT NULL,
+    word_id INTEGER NOT NULL,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    latency_ms_total INTEGER NOT NULL DEFAULT 0,
+    latency_count INTEGER NOT NULL DEFAULT 0,
+    last_answered_at REAL,
+    PRIMARY KEY (user_id, word_id)
+);
+
+CREATE TABLE IF NOT EXISTS answer_rollup_state (
+    singleton INTEGER PRIMARY KEY CHECK (singleton = 1),
+    last_answer_id INTEGER NOT NULL DEFAULT 0,
+    rolled_up_at REAL
+);
+INSERT OR IGNORE INTO answer_rollup_state (singleton) VALUES (1);
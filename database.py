@@ -1,186 +1,477 @@
+import logging
 import psycopg2
 import psycopg2.extras
 import sys
-import os
+import threading
+import time
+from datetime import datetime, timezone
 
+import config
+import migrations
 from config import DATABASE_URL
+from db_pool import ConnectionPool
+from distractors import DistractorIndex
+from observability import DB_LATENCY, timed
+from prepared import StatementRegistry
+from storage import WEAK_REST, WEAK_WORD_CONDITION, Storage, build_questions
+from ttl_cache import TTLCache
+from user_state import UserState
+from word_sampler import WordSampler
+
+# Настройки пула соединений (можно переопределить в config.py)
+DB_POOL_MIN_SIZE = getattr(config, 'DB_POOL_MIN_SIZE', 1)
+DB_POOL_MAX_SIZE = getattr(config, 'DB_POOL_MAX_SIZE', 10)
+DB_POOL_TIMEOUT = getattr(config, 'DB_POOL_TIMEOUT', 30.0)
+DB_POOL_HEALTH_CHECK_INTERVAL = getattr(config, 'DB_POOL_HEALTH_CHECK_INTERVAL', 30.0)
+
+logger = logging.getLogger(__name__)
+
+# Кэш словарей для выбора случайных слов
+SAMPLER_MAX_USERS = getattr(config, 'SAMPLER_MAX_USERS', 1000)
+SAMPLER_TTL = getattr(config, 'SAMPLER_TTL', 300.0)
+
+# Индекс похожих слов для неверных вариантов ответа (distractors.py)
+DISTRACTOR_NEIGHBORS = getattr(config, 'DISTRACTOR_NEIGHBORS', 16)
+
+# Сводки журнала ответов не учитывают строки моложе ANSWER_ROLLUP_LAG секунд:
+# пачка с меньшими answer_id может быть еще не зафиксирована (answer_log.sql)
+ANSWER_ROLLUP_LAG = getattr(config, 'ANSWER_ROLLUP_LAG', 30)
+
+# Кэш количества слов пользователя (значение из users.word_count)
+WORD_COUNT_CACHE_SIZE = getattr(config, 'WORD_COUNT_CACHE_SIZE', 10000)
+WORD_COUNT_CACHE_TTL = getattr(config, 'WORD_COUNT_CACHE_TTL', 300.0)
+
+# Частые запросы выполняются через PREPARE/EXECUTE (см. prepared.py):
+# на каждом соединении пула текст разбирается и планируется один раз
+DB_PREPARED_STATEMENTS = getattr(config, 'DB_PREPARED_STATEMENTS', True)
+statements = StatementRegistry(enabled=DB_PREPARED_STATEMENTS)
+
+statements.register('deck_word_ids', "SELECT word_id FROM user_deck WHERE user_id = $1", ('bigint',))
+statements.register('register_user', '''
+    INSERT INTO users (user_id, username, first_name) VALUES ($1, $2, $3)
+    ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name
+''', ('bigint', 'text', 'text'))
+statements.register('words_by_ids', '''
+    SELECT word_id, english_word, russian_translation
+    FROM words
+    WHERE word_id = ANY($1)
+''', ('integer[]',))
+# Следующие вопросы: слова к повторению по очереди SM-2 (признак 0), слабые
+# слова, на которые давно не отвечали (1), и случайные слова словаря ($4,
+# выбраны WordSampler), из которых берутся и неверные варианты (2)
+PREFETCH_QUESTIONS_SQL = f'''
+    (SELECT w.word_id, w.english_word, w.russian_translation, 0
+     FROM user_words uw
+     INNER JOIN words w ON w.word_id = uw.word_id
+     WHERE uw.user_id = $1 AND uw.due_at <= CURRENT_TIMESTAMP AND uw.word_id <> ALL($3::integer[])
+     ORDER BY uw.due_at
+     LIMIT $2)
+    UNION ALL
+    (SELECT w.word_id, w.english_word, w.russian_translation, 1
+     FROM word_answer_stats s
+     INNER JOIN words w ON w.word_id = s.word_id
+     WHERE s.user_id = $1 AND {WEAK_WORD_CONDITION}
+       AND s.last_answered_at <= CURRENT_TIMESTAMP - INTERVAL '{WEAK_REST} seconds'
+       AND s.word_id <> ALL($3::integer[])
+     ORDER BY s.correct::REAL / s.answers, s.last_answered_at
+     LIMIT $2)
+    UNION ALL
+    SELECT word_id, english_word, russian_translation, 2
+    FROM words
+    WHERE word_id = ANY($4::integer[])
+'''
+WEAK_WORDS_SQL = f'''
+    SELECT w.english_word, w.russian_translation, s.answers, s.correct
+    FROM word_answer_stats s
+    INNER JOIN words w ON w.word_id = s.word_id
+    WHERE s.user_id = $1 AND {WEAK_WORD_CONDITION}
+    ORDER BY s.correct::REAL / s.answers, s.last_answered_at
+    LIMIT $2
+'''
+statements.register('prefetch_questions', PREFETCH_QUESTIONS_SQL, ('bigint', 'integer', 'integer[]', 'integer[]'))
+statements.register('record_answer', "SELECT record_answer($1, $2, $3)", ('bigint', 'integer', 'boolean'))
+statements.register('rollup_answers', "SELECT rollup_answers($1, $2)", ('integer', 'integer'))
+statements.register('weak_words', WEAK_WORDS_SQL, ('bigint', 'integer'))
+statements.register('user_words_page', '''
+    SELECT w.word_id, w.english_word, w.russian_translation
+    FROM words w
+    INNER JOIN user_deck d ON w.word_id = d.word_id
+    WHERE d.user_id = $1 AND w.english_word > $2
+    ORDER BY w.english_word
+    LIMIT $3
+''', ('bigint', 'text', 'integer'))
+statements.register('insert_word', '''
+    INSERT INTO words (english_word, russian_translation, added_by) VALUES ($1, $2, $3)
+    ON CONFLICT (english_word) DO NOTHING RETURNING word_id
+''', ('text', 'text', 'bigint'))
+statements.register('word_id_by_english', "SELECT word_id FROM words WHERE english_word = $1", ('text',))
+statements.register('link_word', '''
+    INSERT INTO user_words (user_id, word_id) VALUES ($1, $2)
+    ON CONFLICT (user_id, word_id) DO NOTHING
+''', ('bigint', 'integer'))
+statements.register('unhide_word', "DELETE FROM user_hidden_words WHERE user_id = $1 AND word_id = $2", ('bigint', 'integer'))
+statements.register('hide_word', '''
+    INSERT INTO user_hidden_words (user_id, word_id) VALUES ($1, $2)
+    ON CONFLICT (user_id, word_id) DO NOTHING
+''', ('bigint', 'integer'))
+statements.register('word_added_by', "SELECT added_by FROM words WHERE word_id = $1", ('integer',))
+statements.register('unlink_word', "DELETE FROM user_words WHERE user_id = $1 AND word_id = $2", ('bigint', 'integer'))
+statements.register('reset_word_counts', '''
+    UPDATE users SET word_count = NULL
+    WHERE user_id IN (SELECT user_id FROM user_words WHERE word_id = $1)
+    RETURNING user_id
+''', ('integer',))
+statements.register('delete_word', "DELETE FROM words WHERE word_id = $1", ('integer',))
+# Пересчет количества слов в той же транзакции, что и изменение словаря
+statements.register('refresh_word_count', '''
+    UPDATE users
+    SET word_count = (SELECT COUNT(*) FROM user_deck WHERE user_id = $1)
+    WHERE user_id = $1
+    RETURNING word_count
+''', ('bigint',))
+statements.register('word_count', "SELECT word_count FROM users WHERE user_id = $1", ('bigint',))
+# Ответы и время ответа - из сводки user_answer_stats (rollup_answers)
+statements.register('user_stats', '''
+    SELECT u.word_count, COALESCE(a.answers, 0), COALESCE(a.correct, 0),
+           CASE WHEN u.last_studied_on >= CURRENT_DATE - 1 THEN u.streak_days ELSE 0 END,
+           u.best_streak_days,
+           (SELECT COUNT(*) FROM user_words uw
+            WHERE uw.user_id = u.user_id AND uw.due_at <= CURRENT_TIMESTAMP),
+           a.latency_ms_total / NULLIF(a.latency_count, 0)
+    FROM users u
+    LEFT JOIN user_answer_stats a ON a.user_id = u.user_id
+    WHERE u.user_id = $1
+''', ('bigint',))
+# state_data = NULL - режим без полей: двоичные данные не перезаписываются
+statements.register('set_user_state', '''
+    UPDATE users SET state_mode = $2, state_data = COALESCE($3, state_data) WHERE user_id = $1
+''', ('bigint', 'smallint', 'bytea'))
+statements.register('get_user_state', "SELECT state_mode, state_data FROM users WHERE user_id = $1", ('bigint',))
+
+
+class PostgreSQLDatabase(Storage):
+    _pool = None
+    _pool_lock = threading.Lock()
+    _sampler = None
+    _distractors = None
+    _schema_ready = False  # миграции проверены в этом процессе
+    _word_counts = TTLCache(max_size=WORD_COUNT_CACHE_SIZE, ttl=WORD_COUNT_CACHE_TTL)
+    # Функции вида f(user_id), вызываемые при изменении словаря пользователя
+    word_change_listeners = []
+
+    @classmethod
+    def get_pool(cls):
+        """Возвращает пул соединений, создавая его при первом обращении"""
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls._pool = ConnectionPool(
+                        DATABASE_URL,
+                        min_size=DB_POOL_MIN_SIZE,
+                        max_size=DB_POOL_MAX_SIZE,
+                        checkout_timeout=DB_POOL_TIMEOUT,
+                        health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+                    )
+        return cls._pool
 
-class PostgreSQLDatabase:
     @classmethod
     def get_connection(cls):
-        """Создает и возвращает соединение с базой данных"""
+        """Берет соединение с базой данных из пула"""
         try:
-            conn = psycopg2.connect(DATABASE_URL)
-            # Устанавливаем кодировку для соединения
-            conn.set_client_encoding('UTF8')
-            return conn
+            return cls.get_pool().getconn()
         except Exception as e:
-            print(f"❌ Ошибка подключения к базе данных: {e}")
+            logger.error("Ошибка подключения к базе данных: %s", e)
             raise
 
     @classmethod
-    def execute_sql_file(cls, filename):
-        """Выполняет SQL файл для инициализации базы данных"""
+    def release_connection(cls, conn):
+        """Возвращает соединение в пул"""
+        cls.get_pool().putconn(conn)
+
+    @classmethod
+    def pool_stats(cls):
+        """Возвращает метрики пула соединений"""
+        return cls.get_pool().stats()
+
+    @classmethod
+    def close_pool(cls):
+        """Закрывает все соединения пула (при остановке бота)"""
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.closeall()
+                cls._pool = None
+
+    @classmethod
+    def get_sampler(cls):
+        """Возвращает движок выбора случайных слов"""
+        if cls._sampler is None:
+            cls._sampler = WordSampler(cls._load_user_word_ids, max_users=SAMPLER_MAX_USERS, ttl=SAMPLER_TTL)
+        return cls._sampler
+
+    @classmethod
+    def _load_user_word_ids(cls, user_id):
+        """Загружает все word_id словаря пользователя (для WordSampler)"""
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
+            statements.execute(cursor, 'deck_word_ids', (user_id,))
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            cls.release_connection(conn)
 
-            # Проверяем существование файла
-            if not os.path.exists(filename):
-                print(f"❌ Файл {filename} не найден")
-                return False
-
-            # Пробуем разные кодировки
-            encodings = ['utf-8', 'utf-8-sig', 'cp1251', 'latin1']
-
-            for encoding in encodings:
-                try:
-                    with open(filename, 'r', encoding=encoding) as file:
-                        sql_script = file.read()
-
-                    # Выполняем SQL скрипт
-                    cursor.execute(sql_script)
-                    conn.commit()
-                    print(f"✅ SQL файл {filename} выполнен успешно (кодировка: {encoding})")
-                    return True
-
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    print(f"❌ Ошибка при выполнении SQL файла {filename} с кодировкой {encoding}: {e}")
-                    conn.rollback()
-                    continue
-
-            # Если ни одна кодировка не сработала
-            print(f"❌ Не удалось прочитать файл {filename} ни в одной кодировке")
-            return False
+    @classmethod
+    def get_distractors(cls):
+        """Возвращает индекс похожих слов для неверных вариантов ответа"""
+        if cls._distractors is None:
+            cls._distractors = DistractorIndex(cls._load_index_words, neighbors=DISTRACTOR_NEIGHBORS)
+        return cls._distractors
+
+    @classmethod
+    def _load_index_words(cls):
+        """Загружает все слова для построения DistractorIndex"""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT word_id, english_word, added_by IS NULL FROM words")
+            return cursor.fetchall()
+        finally:
+            cls.release_connection(conn)
+
+    @classmethod
+    def _words_changed(cls, user_id):
+        """Сбрасывает кэши, зависящие от словаря пользователя"""
+        cls.get_sampler().invalidate(user_id)
+        cls._word_counts.invalidate(user_id)
+        for listener in cls.word_change_listeners:
+            listener(user_id)
 
+    @classmethod
+    def execute_sql_file(cls, filename):
+        """Выполняет SQL файл в одной транзакции"""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(migrations.read_sql(filename))
+            conn.commit()
+            logger.info("SQL файл %s выполнен успешно", filename)
+            return True
         except Exception as e:
-            print(f"❌ Общая ошибка при выполнении SQL файла {filename}: {e}")
+            logger.error("Ошибка при выполнении SQL файла %s: %s", filename, e)
             conn.rollback()
             return False
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
+    @timed(DB_LATENCY)
     def check_and_init_database(cls):
-        """Проверяет и при необходимости инициализирует базу данных"""
-        print("🔍 Проверка базы данных...")
+        """Применяет недостающие миграции схемы (см. migrations.py).
+
+        Если схема актуальна, это один запрос к schema_version; результат
+        запоминается, и повторные вызовы в том же процессе не обращаются к БД.
+        Ошибка миграции пробрасывается: бот не должен работать с
+        недоинициализированной базой.
+        """
+        if cls._schema_ready:
+            return
 
+        started = time.perf_counter()
         conn = cls.get_connection()
         try:
-            cursor = conn.cursor()
-
-            # Проверяем существование таблиц
-            cursor.execute("""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = 'users'
-                )
-            """)
-            tables_exist = cursor.fetchone()[0]
-
-            if not tables_exist:
-                print("🔄 Таблицы не найдены, инициализация базы данных...")
-                # Сначала создаем таблицы
-                if cls.execute_sql_file('create_tables.sql'):
-                    # Затем добавляем начальные данные
-                    cls.execute_sql_file('initial_data.sql')
-                print("✅ База данных успешно инициализирована")
-            else:
-                print("✅ База данных уже инициализирована")
-
+            applied = migrations.migrate(conn)
         except Exception as e:
-            print(f"❌ Ошибка при проверке базы данных: {e}")
-            raise  # Пробрасываем исключение дальше
+            logger.error("Ошибка при проверке базы данных: %s", e)
+            raise
         finally:
-            conn.close()
+            cls.release_connection(conn)
+
+        cls._schema_ready = True
+        logger.info("Схема БД: версия %s (применено миграций: %s), проверка за %.1f мс",
+                    migrations.LATEST_VERSION, len(applied), (time.perf_counter() - started) * 1000)
 
     # Остальные методы остаются без изменений
     @classmethod
+    @timed(DB_LATENCY)
     def register_user(cls, user_id, username, first_name):
         """Регистрирует нового пользователя в базе данных."""
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
 
-            cursor.execute(
-                "INSERT INTO users (user_id, username, first_name) VALUES (%s, %s, %s) ON CONFLICT (user_id) DO UPDATE SET username = EXCLUDED.username, first_name = EXCLUDED.first_name",
-                (user_id, username, first_name)
-            )
-
-            # Добавляем пользователю все базовые слова
-            cursor.execute('''
-                INSERT INTO user_words (user_id, word_id)
-                SELECT %s, word_id FROM words WHERE added_by IS NULL
-                ON CONFLICT (user_id, word_id) DO NOTHING
-            ''', (user_id,))
+            statements.execute(cursor, 'register_user', (user_id, username, first_name))
+            # Базовые слова не копируются: они видны пользователю через user_deck
 
             conn.commit()
             return True
 
         except Exception as e:
-            print(f"❌ Ошибка при регистрации пользователя: {e}")
+            logger.error("Ошибка при регистрации пользователя: %s", e)
             conn.rollback()
             return False
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
-    def get_random_word_and_options(cls, user_id):
-        """Получает случайное слово и 3 случайных варианта ответа через БД."""
+    @timed(DB_LATENCY)
+    def prefetch_questions(cls, user_id, count, exclude=()):
+        """Следующие count вопросов пользователя одним запросом (см. Storage.prefetch_questions)."""
         conn = cls.get_connection()
         try:
+            # Случайные слова и неверные варианты выбираются в памяти по массиву word_id
+            word_ids = cls.get_sampler().sample_from(cls.get_sampler().get_word_ids(user_id), count * 4)
+            deck = cls.get_sampler().get_word_set(user_id)
             cursor = conn.cursor()
+            statements.execute(cursor, 'prefetch_questions', (user_id, count, list(exclude), word_ids))
+            rows = cursor.fetchall()
+            conn.commit()
 
-            # Получаем случайное слово пользователя
-            cursor.execute('''
-                SELECT w.word_id, w.english_word, w.russian_translation
-                FROM words w
-                INNER JOIN user_words uw ON w.word_id = uw.word_id
-                WHERE uw.user_id = %s
-                ORDER BY RANDOM()
-                LIMIT 1
-            ''', (user_id,))
+            due_rows = [row[:3] for row in rows if row[3] == 0]
+            weak_rows = [row[:3] for row in rows if row[3] == 1]
+            sampled = {row[0]: row[:3] for row in rows if row[3] == 2}
+            if len(sampled) < len(word_ids):
+                # В кэше есть удаленные слова
+                cls.get_sampler().invalidate(user_id)
+            sampled_rows = [sampled[word_id] for word_id in word_ids if word_id in sampled]
+            return build_questions(due_rows, sampled_rows, count, exclude, cls.get_distractors().chooser(deck),
+                                   weak_rows)
+        except Exception as e:
+            logger.error("Ошибка при выборе следующих вопросов: %s", e)
+            conn.rollback()
+            return []
+        finally:
+            cls.release_connection(conn)
 
-            target_word = cursor.fetchone()
-            if not target_word:
-                return None, [], []
+    @classmethod
+    @timed(DB_LATENCY)
+    def record_answer(cls, user_id, word_id, was_correct):
+        """Записывает ответ пользователя (SQL-функция record_answer)."""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            statements.execute(cursor, 'record_answer', (user_id, word_id, was_correct))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error("Ошибка при записи ответа: %s", e)
+            conn.rollback()
+            return False
+        finally:
+            cls.release_connection(conn)
 
-            target_id, en, ru = target_word
+    @classmethod
+    @timed(DB_LATENCY)
+    def log_answers(cls, rows):
+        """Добавляет пачку ответов в журнал answers одним COPY (см. Storage.log_answers)."""
+        from word_import import CopyRowStream
 
-            # Получаем 3 случайных неправильных варианта
-            cursor.execute('''
-                SELECT w.english_word
-                FROM words w
-                INNER JOIN user_words uw ON w.word_id = uw.word_id
-                WHERE uw.user_id = %s AND w.word_id != %s
-                ORDER BY RANDOM()
-                LIMIT 3
-            ''', (user_id, target_id))
+        if not rows:
+            return True
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.copy_expert(
+                "COPY answers (user_id, word_id, correct, latency_ms, answered_at) FROM STDIN",
+                CopyRowStream((user_id, word_id, correct, latency_ms, datetime.fromtimestamp(answered_at, timezone.utc))
+                              for user_id, word_id, correct, latency_ms, answered_at in rows)
+            )
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error("Ошибка при записи журнала ответов: %s", e)
+            conn.rollback()
+            return False
+        finally:
+            cls.release_connection(conn)
 
-            wrong_answers = [row[0] for row in cursor.fetchall()]
+    @classmethod
+    @timed(DB_LATENCY)
+    def rollup_answers(cls, max_rows=50000):
+        """Переносит новые строки журнала в сводки (SQL-функция rollup_answers)."""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            statements.execute(cursor, 'rollup_answers', (ANSWER_ROLLUP_LAG, max_rows))
+            count = cursor.fetchone()[0]
+            conn.commit()
+            return count
+        except Exception as e:
+            logger.error("Ошибка при обновлении сводок ответов: %s", e)
+            conn.rollback()
+            return 0
+        finally:
+            cls.release_connection(conn)
 
-            # Формируем варианты ответов
-            options = [en] + wrong_answers
+    @classmethod
+    @timed(DB_LATENCY)
+    def get_weak_words(cls, user_id, limit=3):
+        """Слабые слова пользователя по word_answer_stats (см. Storage.get_weak_words)."""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            statements.execute(cursor, 'weak_words', (user_id, limit))
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except Exception as e:
+            logger.error("Ошибка при выборе слабых слов: %s", e)
+            conn.rollback()
+            return []
+        finally:
+            cls.release_connection(conn)
 
-            # Если недостаточно неправильных вариантов, добавляем заглушки
-            while len(options) < 4:
-                options.append(f"word_{len(options)}")
+    @classmethod
+    @timed(DB_LATENCY)
+    def reschedule_deck(cls, user_id, per_day=50):
+        """Распределяет просроченные слова пользователя по дням (не больше per_day в день).
 
-            # Перемешиваем варианты
-            import random
-            random.shuffle(options)
+        Пересчет выполняется для всего словаря сразу (srs.spread_overdue),
+        в БД изменения записываются одним запросом.
+        """
+        import numpy as np
+        import srs
 
-            return (ru, options, en)
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT word_id, EXTRACT(EPOCH FROM due_at), EXTRACT(EPOCH FROM LOCALTIMESTAMP)
+                FROM user_words
+                WHERE user_id = %s
+            ''', (user_id,))
+            rows = cursor.fetchall()
+            if not rows:
+                return 0
+
+            word_ids = np.array([row[0] for row in rows])
+            due_at = np.array([float(row[1]) for row in rows])
+            new_due_at = srs.spread_overdue(due_at, float(rows[0][2]), per_day)
+            changed = np.flatnonzero(new_due_at != due_at)
+            if not changed.size:
+                return 0
+
+            # due_at хранится без часового пояса, поэтому эпоха считается в UTC в обе стороны
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                UPDATE user_words SET due_at = to_timestamp(v.due_at) AT TIME ZONE 'UTC'
+                FROM (VALUES %s) AS v(user_id, word_id, due_at)
+                WHERE user_words.user_id = v.user_id AND user_words.word_id = v.word_id
+                """,
+                [(user_id, int(word_ids[i]), float(new_due_at[i])) for i in changed],
+                template="(%s::bigint, %s::integer, %s::double precision)"
+            )
+            conn.commit()
+            return len(changed)
 
         except Exception as e:
-            print(f"❌ Ошибка при получении случайного слова: {e}")
-            return None, [], []
+            logger.error("Ошибка при пересчете расписания повторений: %s", e)
+            conn.rollback()
+            return 0
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
+    @timed(DB_LATENCY)
     def get_user_words(cls, user_id):
         """Получает список слов для конкретного пользователя."""
         conn = cls.get_connection()
@@ -190,8 +481,8 @@ class PostgreSQLDatabase:
             cursor.execute('''
                 SELECT w.word_id, w.english_word, w.russian_translation
                 FROM words w
-                INNER JOIN user_words uw ON w.word_id = uw.word_id
-                WHERE uw.user_id = %s
+                INNER JOIN user_deck d ON w.word_id = d.word_id
+                WHERE d.user_id = %s
                 ORDER BY w.english_word
             ''', (user_id,))
 
@@ -199,12 +490,30 @@ class PostgreSQLDatabase:
             return words
 
         except Exception as e:
-            print(f"❌ Ошибка при получении слов пользователя: {e}")
+            logger.error("Ошибка при получении слов пользователя: %s", e)
+            return []
+        finally:
+            cls.release_connection(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    def get_user_words_page(cls, user_id, after_word=None, limit=10):
+        """Получает страницу слов пользователя по алфавиту, начиная после after_word."""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            statements.execute(cursor, 'user_words_page', (user_id, after_word or '', limit))
+
+            return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+
+        except Exception as e:
+            logger.error("Ошибка при получении страницы слов пользователя: %s", e)
             return []
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
+    @timed(DB_LATENCY)
     def add_word_to_db(cls, user_id, english_word, russian_translation):
         """Добавляет новое слово в БД и связывает с пользователем."""
         conn = cls.get_connection()
@@ -212,135 +521,298 @@ class PostgreSQLDatabase:
             cursor = conn.cursor()
 
             # Добавляем слово
-            cursor.execute(
-                "INSERT INTO words (english_word, russian_translation, added_by) VALUES (%s, %s, %s) ON CONFLICT (english_word) DO NOTHING RETURNING word_id",
-                (english_word, russian_translation, user_id)
-            )
+            statements.execute(cursor, 'insert_word', (english_word, russian_translation, user_id))
 
             result = cursor.fetchone()
+            created_id = None
             if result:
-                word_id = result[0]
+                word_id = created_id = result[0]
                 # Связываем слово с пользователем
-                cursor.execute(
-                    "INSERT INTO user_words (user_id, word_id) VALUES (%s, %s) ON CONFLICT (user_id, word_id) DO NOTHING",
-                    (user_id, word_id)
-                )
+                statements.execute(cursor, 'link_word', (user_id, word_id))
             else:
                 # Если слово уже существует, получаем его ID
-                cursor.execute("SELECT word_id FROM words WHERE english_word = %s", (english_word,))
+                statements.execute(cursor, 'word_id_by_english', (english_word,))
                 result = cursor.fetchone()
                 if result:
                     word_id = result[0]
-                    cursor.execute(
-                        "INSERT INTO user_words (user_id, word_id) VALUES (%s, %s) ON CONFLICT (user_id, word_id) DO NOTHING",
-                        (user_id, word_id)
-                    )
+                    statements.execute(cursor, 'link_word', (user_id, word_id))
+                    # Базовое слово могло быть скрыто пользователем раньше
+                    statements.execute(cursor, 'unhide_word', (user_id, word_id))
 
+            statements.execute(cursor, 'refresh_word_count', (user_id,))
             conn.commit()
+            if created_id is not None:
+                cls.get_distractors().add(created_id, english_word)
+            cls._words_changed(user_id)
             return True
 
         except Exception as e:
-            print(f"❌ Ошибка при добавлении слова: {e}")
+            logger.error("Ошибка при добавлении слова: %s", e)
             conn.rollback()
             return False
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
+    @timed(DB_LATENCY)
+    def import_words(cls, user_id, rows):
+        """Массово добавляет слова пользователю из итератора пар (english_word, russian_translation).
+
+        Строки загружаются через COPY во временную таблицу и переносятся в
+        words/user_words в одной транзакции. Возвращает (staged, inserted):
+        сколько строк загружено и сколько слов появилось в словаре
+        пользователя; остальные - дубликаты или слова, которые уже были в
+        словаре (в том числе базовые). При ошибке возвращает None.
+        """
+        from word_import import CopyRowStream
+
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TEMP TABLE import_staging (
+                    line_no INTEGER NOT NULL,
+                    english_word TEXT NOT NULL,
+                    russian_translation TEXT NOT NULL
+                ) ON COMMIT DROP
+            ''')
+            cursor.copy_expert(
+                "COPY import_staging (line_no, english_word, russian_translation) FROM STDIN",
+                CopyRowStream((line_no, english_word, russian_translation)
+                              for line_no, (english_word, russian_translation) in enumerate(rows, 1))
+            )
+            staged = cursor.rowcount
+
+            # Новые слова; при повторе слова в файле берется первый перевод
+            cursor.execute('''
+                INSERT INTO words (english_word, russian_translation, added_by)
+                SELECT DISTINCT ON (english_word) english_word, russian_translation, %s
+                FROM import_staging
+                ORDER BY english_word, line_no
+                ON CONFLICT (english_word) DO NOTHING
+                RETURNING word_id, english_word
+            ''', (user_id,))
+            created_words = cursor.fetchall()
+
+            # Связываем с пользователем слова файла, которых еще нет в его словаре,
+            # включая уже существовавшие в words и скрытые базовые
+            cursor.execute('''
+                INSERT INTO user_words (user_id, word_id)
+                SELECT %s, w.word_id
+                FROM (SELECT DISTINCT english_word FROM import_staging) s
+                INNER JOIN words w ON w.english_word = s.english_word
+                WHERE NOT EXISTS (SELECT 1 FROM user_deck d WHERE d.user_id = %s AND d.word_id = w.word_id)
+                ON CONFLICT (user_id, word_id) DO NOTHING
+            ''', (user_id, user_id))
+            inserted = cursor.rowcount
+
+            # Базовые слова из файла снова видны пользователю
+            cursor.execute('''
+                DELETE FROM user_hidden_words h
+                USING import_staging s, words w
+                WHERE h.user_id = %s AND w.english_word = s.english_word AND h.word_id = w.word_id
+            ''', (user_id,))
+
+            statements.execute(cursor, 'refresh_word_count', (user_id,))
+            conn.commit()
+            cls.get_distractors().add_many(
+                (word_id, english_word, False) for word_id, english_word in created_words)
+            cls._words_changed(user_id)
+            return staged, inserted
+
+        except Exception as e:
+            logger.error("Ошибка при импорте слов: %s", e)
+            conn.rollback()
+            return None
+        finally:
+            cls.release_connection(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
     def delete_word_from_user(cls, user_id, word_id):
         """Удаляет связь пользователь-слово."""
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT added_by FROM words WHERE word_id = %s", (word_id,))
+            statements.execute(cursor, 'word_added_by', (word_id,))
             result = cursor.fetchone()
             added_by = result[0] if result else None
 
-            cursor.execute("DELETE FROM user_words WHERE user_id = %s AND word_id = %s", (user_id, word_id))
+            statements.execute(cursor, 'unlink_word', (user_id, word_id))
 
+            affected_users = []
             if added_by == user_id:
-                cursor.execute("DELETE FROM words WHERE word_id = %s", (word_id,))
-
+                # Слово пропадет и у других пользователей, которые его добавили:
+                # их счетчики будут пересчитаны при следующем чтении
+                statements.execute(cursor, 'reset_word_counts', (word_id,))
+                affected_users = [row[0] for row in cursor.fetchall()]
+                statements.execute(cursor, 'delete_word', (word_id,))
+            elif added_by is None and result:
+                # Общее базовое слово не удаляется, а скрывается для пользователя
+                statements.execute(cursor, 'hide_word', (user_id, word_id))
+
+            statements.execute(cursor, 'refresh_word_count', (user_id,))
             conn.commit()
+            if added_by == user_id:
+                cls.get_distractors().remove(word_id)
+            cls._words_changed(user_id)
+            for other_user_id in affected_users:
+                cls._words_changed(other_user_id)
             return True
 
         except Exception as e:
-            print(f"❌ Ошибка при удалении слова: {e}")
+            logger.error("Ошибка при удалении слова: %s", e)
             conn.rollback()
             return False
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
+    @timed(DB_LATENCY)
     def get_word_count(cls, user_id):
-        """Возвращает количество слов у пользователя."""
+        """Возвращает количество слов у пользователя.
+
+        Значение берется из кэша или из users.word_count; словарь
+        пересчитывается только если счетчик еще не заполнен.
+        """
+        count = cls._word_counts.get(user_id)
+        if count is not None:
+            return count
+
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM user_words WHERE user_id = %s", (user_id,))
+            statements.execute(cursor, 'word_count', (user_id,))
             result = cursor.fetchone()
-            return result[0] if result else 0
+            if not result:
+                return 0
+
+            count = result[0]
+            if count is None:
+                statements.execute(cursor, 'refresh_word_count', (user_id,))
+                count = cursor.fetchone()[0]
+                conn.commit()
+
+            cls._word_counts.set(user_id, count)
+            return count
         except Exception as e:
-            print(f"❌ Ошибка при получении количества слов: {e}")
+            logger.error("Ошибка при получении количества слов: %s", e)
+            conn.rollback()
             return 0
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
-    def set_user_state(cls, user_id, state_data):
-        """Устанавливает состояние пользователя в БД."""
+    @timed(DB_LATENCY)
+    def get_stats(cls, user_id):
+        """Возвращает статистику пользователя одним чтением строки users и ее сводки ответов.
+
+        Словарь с ключами word_count, answers_total, answers_correct,
+        accuracy (доля верных ответов или None), streak_days,
+        best_streak_days, due_count (слова, которые пора повторить) и
+        avg_latency_ms (среднее время ответа или None). Ответы и время
+        берутся из сводки user_answer_stats и отстают от журнала на
+        интервал rollup_answers.
+        При ошибке или отсутствии пользователя возвращает None.
+        """
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
-            import json
-            state_json = json.dumps(state_data)
-            cursor.execute(
-                "UPDATE users SET user_state = %s WHERE user_id = %s",
-                (state_json, user_id)
-            )
-            conn.commit()
-            return True
+            statements.execute(cursor, 'user_stats', (user_id,))
+            result = cursor.fetchone()
+            if not result:
+                return None
+
+            word_count, answers_total, answers_correct, streak_days, best_streak_days, due_count, avg_latency_ms = result
+            if word_count is None:
+                statements.execute(cursor, 'refresh_word_count', (user_id,))
+                word_count = cursor.fetchone()[0]
+                conn.commit()
+            cls._word_counts.set(user_id, word_count)
+
+            return {
+                'word_count': word_count,
+                'answers_total': answers_total,
+                'answers_correct': answers_correct,
+                'accuracy': answers_correct / answers_total if answers_total else None,
+                'streak_days': streak_days,
+                'best_streak_days': best_streak_days,
+                'due_count': due_count,
+                'avg_latency_ms': avg_latency_ms,
+            }
         except Exception as e:
-            print(f"❌ Ошибка при установке состояния: {e}")
+            logger.error("Ошибка при получении статистики: %s", e)
             conn.rollback()
-            return False
+            return None
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
-    def get_user_state(cls, user_id):
-        """Получает состояние пользователя из БД."""
+    @timed(DB_LATENCY)
+    def set_user_state(cls, user_id, state):
+        """Устанавливает состояние пользователя (UserState) в БД."""
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT user_state FROM users WHERE user_id = %s", (user_id,))
-            result = cursor.fetchone()
-            if result and result[0]:
-                import json
-                return json.loads(result[0])
-            return {}
+            statements.execute(cursor, 'set_user_state', (user_id, int(state.mode), state.encode_data()))
+            conn.commit()
+            return True
         except Exception as e:
-            print(f"❌ Ошибка при получении состояния: {e}")
-            return {}
+            logger.error("Ошибка при установке состояния: %s", e)
+            conn.rollback()
+            return False
         finally:
-            conn.close()
+            cls.release_connection(conn)
 
     @classmethod
-    def clear_user_state(cls, user_id):
-        """Очищает состояние пользователя в БД."""
+    @timed(DB_LATENCY)
+    def set_user_states(cls, states):
+        """Устанавливает состояния нескольких пользователей одним запросом."""
+        if not states:
+            return True
         conn = cls.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute(
-                "UPDATE users SET user_state = '{}' WHERE user_id = %s",
-                (user_id,)
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                UPDATE users SET state_mode = v.state_mode, state_data = COALESCE(v.state_data, users.state_data)
+                FROM (VALUES %s) AS v(user_id, state_mode, state_data)
+                WHERE users.user_id = v.user_id
+                """,
+                [(user_id, int(state.mode), state.encode_data()) for user_id, state in states.items()],
+                template="(%s::bigint, %s::smallint, %s::bytea)"
             )
             conn.commit()
             return True
         except Exception as e:
-            print(f"❌ Ошибка при очистке состояния: {e}")
+            logger.error("Ошибка при пакетной установке состояний: %s", e)
             conn.rollback()
             return False
         finally:
-            conn.close()
\ No newline at end of file
+            cls.release_connection(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    def get_user_state(cls, user_id):
+        """Получает состояние пользователя (UserState) из БД."""
+        conn = cls.get_connection()
+        try:
+            cursor = conn.cursor()
+            statements.execute(cursor, 'get_user_state', (user_id,))
+            result = cursor.fetchone()
+            if result:
+                return UserState.decode(*result)
+            return UserState()
+        except Exception as e:
+            logger.error("Ошибка при получении состояния: %s", e)
+            return UserState()
+        finally:
+            cls.release_connection(conn)
+
+    @classmethod
+    @timed(DB_LATENCY)
+    def clear_user_state(cls, user_id):
+        """Очищает состояние пользователя в БД."""
+        return cls.set_user_state(user_id, UserState())
\ No newline at end of file
@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время."""
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений с PostgreSQL.
+
+    Держит от min_size до max_size соединений. Если все соединения заняты,
+    поток ждет освобождения не дольше checkout_timeout секунд. Соединение,
+    пролежавшее в пуле дольше health_check_interval, перед выдачей
+    проверяется запросом SELECT 1 и при ошибке пересоздается.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, checkout_timeout=30.0,
+                 health_check_interval=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Некорректные размеры пула: min_size=%s, max_size=%s" % (min_size, max_size))
+
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, время возврата в пул)
+        self._size = 0  # всего открытых соединений (в пуле + выданных)
+        self._closed = False
+
+        # Метрики ожидания соединения
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._health_failures = 0
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        # Устанавливаем кодировку для соединения
+        conn.set_client_encoding('UTF8')
+        return conn
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Выдает соединение из пула, при необходимости ожидая освобождения."""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError("Пул соединений закрыт")
+
+                while not self._idle and self._size >= self.max_size:
+                    waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            "Нет свободных соединений за %.1f с (max_size=%s)" % (self.checkout_timeout, self.max_size))
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn, returned_at = None, None
+                    # Резервируем место под новое соединение
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, returned_at):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._health_failures += 1
+                    self._cond.notify()
+                continue
+
+            self._record_checkout(time.monotonic() - started, waited)
+            return conn
+
+    def _record_checkout(self, wait_time, waited):
+        with self._cond:
+            self._checkouts += 1
+            if waited:
+                self._waits += 1
+            self._wait_total += wait_time
+            self._wait_max = max(self._wait_max, wait_time)
+
+    def putconn(self, conn):
+        """Возвращает соединение в пул, откатывая незавершенную транзакцию."""
+        healthy = not conn.closed
+        if healthy and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                healthy = False
+
+        with self._cond:
+            if healthy and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        """Закрывает все свободные соединения и запрещает выдачу новых."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Возвращает снимок метрик пула."""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_avg_ms': (self._wait_total / self._checkouts * 1000) if self._checkouts else 0.0,
+                'wait_max_ms': self._wait_max * 1000,
+                'timeouts': self._timeouts,
+                'health_failures': self._health_failures,
+            }
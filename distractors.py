@@ -0,0 +1,392 @@
+"""Правдоподобные неверные варианты ответа: индекс похожих слов.
+
+Для каждого слова таблицы words заранее выбираются neighbors ближайших по
+написанию слов среди всех слов и отдельно среди слов общего базового
+словаря. Сходство - скалярное произведение векторов, в которых сложены:
+
+- символьные 2- и 3-граммы с метками начала и конца слова (хэшируются в
+  dims измерений, нормированы) - приближение редакционного расстояния;
+  общие окончания (-ing, -ly, -tion) отчасти заменяют часть речи, которой
+  в words нет;
+- первые 1-PREFIX_LENGTH букв - бонус за общий префикс;
+- длина слова и соседние длины - бонус за близкую длину.
+
+Поэтому индекс строится одним векторным проходом NumPy: умножение матриц
+блоками по BLOCK строк и выбор лучших (build; в фоне - refresh, его
+запускает первый вызов chooser). Новые слова добавляются пакетами
+(add_many) с пересчетом соседей только у задетых строк, удаленные
+помечаются (remove), а при большой доле удаленных индекс перестраивается.
+Запрос pick просматривает две строки соседей и занимает микросекунды; пока
+индекс не построен, варианты остаются случайными. Слово, которого нет в
+индексе (добавлено в другом процессе), pick не пересчитывает: оно
+добавляется фоновым потоком, а до тех пор варианты для него случайные.
+
+Варианты берутся сначала из словаря пользователя среди всех похожих слов,
+а если их мало - среди похожих слов базового словаря, которые пользователь
+не скрыл. Слова других пользователей не показываются.
+"""
+import logging
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PREFIX_LENGTH = 3
+PREFIX_DIMS = 64
+PREFIX_WEIGHT = 0.2  # бонус за общий префикс из PREFIX_LENGTH букв
+LENGTH_DIMS = 32
+# Бонус за длину: одинаковая ~0.19, отличие на 1 - 0.1, на 2 - 0.016
+LENGTH_SAME = 0.4
+LENGTH_NEAR = 0.125
+# Строк матрицы сходства за один шаг построения (память: BLOCK x число слов)
+BLOCK = 256
+
+
+def _ngrams(word):
+    marked = f'^{word}$'
+    for size in (2, 3):
+        for start in range(len(marked) - size + 1):
+            yield marked[start:start + size]
+
+
+def _bucket(text, dims):
+    return zlib.crc32(text.encode('utf-8')) % dims
+
+
+class DistractorIndex:
+    """Индекс ближайших по написанию слов для неверных вариантов ответа."""
+
+    _ARRAYS = ('_ids', '_base', '_alive', '_vectors', '_all_rows', '_all_scores', '_base_rows', '_base_scores')
+
+    def __init__(self, loader=None, neighbors=16, dims=128, rebuild_ratio=0.25):
+        self.neighbors = neighbors
+        self.dims = dims
+        self.rebuild_ratio = rebuild_ratio
+
+        self._lock = threading.Lock()
+        self._loader = loader  # loader() -> [(word_id, english_word, базовое ли)]
+        self._ready = False
+        self._building = False
+        self._pending = []  # слова, добавленные во время построения
+        self._pending_removed = set()
+        self._missing = {}  # word_id -> строка: слова, которых не нашел pick
+        self._adding = False
+        self._reset(0)
+
+        self._builds = 0
+        self._build_ms = 0.0
+        self._added = 0
+        self._picks = 0
+        self._base_fallbacks = 0
+        self._misses = 0
+
+    def _reset(self, capacity):
+        self._size = 0
+        self._dead = 0
+        self._positions = {}  # word_id -> строка
+        self._texts = []
+        self._keys = []  # english_word в нижнем регистре
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._base = np.zeros(capacity, dtype=bool)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._vectors = np.zeros((capacity, self.dims + PREFIX_DIMS + LENGTH_DIMS), dtype=np.float32)
+        # Соседи среди всех слов и среди базовых: номера строк (-1 - нет) и сходство
+        self._all_rows = np.full((capacity, self.neighbors), -1, dtype=np.int32)
+        self._all_scores = np.full((capacity, self.neighbors), -np.inf, dtype=np.float32)
+        self._base_rows = np.full((capacity, self.neighbors), -1, dtype=np.int32)
+        self._base_scores = np.full((capacity, self.neighbors), -np.inf, dtype=np.float32)
+
+    def _grow(self, capacity):
+        if capacity <= len(self._ids):
+            return
+        capacity = max(capacity, 2 * len(self._ids), 64)
+        for name in self._ARRAYS:
+            array = getattr(self, name)
+            fill = -1 if name.endswith('_rows') else (-np.inf if name.endswith('_scores') else 0)
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _featurize(self, start, rows):
+        """Заполняет строки start.. для слов rows [(word_id, english_word, базовое ли)]."""
+        end = start + len(rows)
+        gram_rows, gram_cols, prefix_cols, length_cols = [], [], [], []
+        for offset, (word_id, english_word, is_base) in enumerate(rows):
+            key = english_word.strip().lower()
+            self._positions[word_id] = start + offset
+            self._texts.append(english_word)
+            self._keys.append(key)
+            for gram in _ngrams(key):
+                gram_rows.append(offset)
+                gram_cols.append(_bucket(gram, self.dims))
+            prefix_cols.append([_bucket('^' + key[:size], PREFIX_DIMS) for size in range(1, PREFIX_LENGTH + 1)])
+            length_cols.append(min(len(key), LENGTH_DIMS - 2) + 1)
+        self._ids[start:end] = [row[0] for row in rows]
+        self._base[start:end] = [bool(row[2]) for row in rows]
+        self._alive[start:end] = True
+
+        vectors = self._vectors[start:end]
+        vectors[:] = 0
+        grams = vectors[:, :self.dims]
+        np.add.at(grams, (np.array(gram_rows, dtype=np.intp), np.array(gram_cols, dtype=np.intp)), 1.0)
+        grams /= np.maximum(np.linalg.norm(grams, axis=1, keepdims=True), 1e-6)
+
+        offsets = np.arange(len(rows))
+        prefix = vectors[:, self.dims:self.dims + PREFIX_DIMS]
+        np.add.at(prefix, (np.repeat(offsets, PREFIX_LENGTH), np.array(prefix_cols).ravel()),
+                  np.sqrt(PREFIX_WEIGHT / PREFIX_LENGTH))
+        length = vectors[:, self.dims + PREFIX_DIMS:]
+        length_cols = np.array(length_cols)
+        length[offsets, length_cols - 1] = LENGTH_NEAR
+        length[offsets, length_cols] = LENGTH_SAME
+        length[offsets, length_cols + 1] = LENGTH_NEAR
+
+        self._all_rows[start:end] = self._base_rows[start:end] = -1
+        self._all_scores[start:end] = self._base_scores[start:end] = -np.inf
+        self._size = end
+
+    def _similarity(self, start, end):
+        """Матрица сходства строк start..end со всеми словами индекса."""
+        scores = self._vectors[start:end] @ self._vectors[:self._size].T
+        if self._dead:
+            scores[:, ~self._alive[:self._size]] = -np.inf
+        rows = np.arange(end - start)
+        scores[rows, start + rows] = -np.inf
+        return scores
+
+    def _top(self, scores, candidates):
+        """(строки, сходство) лучших neighbors кандидатов каждой строки scores по убыванию.
+
+        candidates - номера строк индекса для столбцов scores (вектор или матрица).
+        """
+        rows = np.full((len(scores), self.neighbors), -1, dtype=np.int32)
+        row_scores = np.full((len(scores), self.neighbors), -np.inf, dtype=np.float32)
+        k = min(self.neighbors, scores.shape[1])
+        if k == 0:
+            return rows, row_scores
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        if candidates.ndim == 1:
+            top = candidates[top]
+        else:
+            top = np.take_along_axis(candidates, top, axis=1)
+        rows[:, :k] = np.where(np.isfinite(top_scores), top, -1)
+        row_scores[:, :k] = top_scores
+        return rows, row_scores
+
+    def _fill(self, start, end, scores):
+        """Соседи строк start..end по их матрице сходства scores."""
+        self._all_rows[start:end], self._all_scores[start:end] = self._top(
+            scores, np.arange(self._size, dtype=np.int32))
+        base = np.nonzero(self._base[:self._size])[0].astype(np.int32)
+        self._base_rows[start:end], self._base_scores[start:end] = self._top(scores[:, base], base)
+
+    def _merge(self, rows_name, scores_name, limit, incoming, new_rows):
+        """Добавляет к соседям строк 0..limit новые строки new_rows со сходством incoming."""
+        neighbor_scores = getattr(self, scores_name)
+        # Пересчитываются только строки, где новое слово ближе худшего соседа
+        touched = np.nonzero(incoming.max(axis=1) > neighbor_scores[:limit, -1])[0]
+        if not len(touched):
+            return
+        neighbor_rows = getattr(self, rows_name)
+        candidates = np.concatenate(
+            [neighbor_rows[touched], np.broadcast_to(new_rows, (len(touched), len(new_rows)))], axis=1)
+        merged = np.concatenate([neighbor_scores[touched], incoming[touched]], axis=1)
+        neighbor_rows[touched], neighbor_scores[touched] = self._top(merged, candidates)
+
+    def build(self, rows):
+        """Строит индекс заново по всем словам rows [(word_id, english_word, базовое ли)]."""
+        started = time.perf_counter()
+        rows = list(rows)
+        with self._lock:
+            self._building = True
+
+        # Строится отдельный экземпляр: запросы пока работают со старым индексом
+        fresh = DistractorIndex(neighbors=self.neighbors, dims=self.dims)
+        fresh._grow(len(rows))
+        if rows:
+            fresh._featurize(0, rows)
+            for start in range(0, len(rows), BLOCK):
+                end = min(start + BLOCK, len(rows))
+                fresh._fill(start, end, fresh._similarity(start, end))
+
+        with self._lock:
+            for name in ('_size', '_dead', '_positions', '_texts', '_keys') + self._ARRAYS:
+                setattr(self, name, getattr(fresh, name))
+            pending, self._pending = self._pending, []
+            removed, self._pending_removed = self._pending_removed, set()
+            self._ready = True
+            self._building = False
+            self._builds += 1
+            self._build_ms = (time.perf_counter() - started) * 1000
+            # Изменения, сделанные во время построения
+            if pending:
+                self._add_locked(pending)
+            for word_id in removed:
+                self._remove_locked(word_id)
+        logger.info("Индекс неверных вариантов: %s слов за %.0f мс", len(rows), self._build_ms)
+
+    def refresh(self, loader=None):
+        """Перестраивает индекс в фоновом потоке; loader() возвращает строки для build."""
+        with self._lock:
+            if loader is not None:
+                self._loader = loader
+            loader = self._loader
+            if loader is None or self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                self.build(loader())
+            except Exception as e:
+                logger.error("Ошибка при построении индекса неверных вариантов: %s", e)
+                with self._lock:
+                    self._building = False
+
+        threading.Thread(target=run, name='distractor-index', daemon=True).start()
+
+    def add(self, word_id, english_word, is_base=False):
+        self.add_many([(word_id, english_word, is_base)])
+
+    def add_many(self, rows):
+        """Добавляет новые слова [(word_id, english_word, базовое ли)] и обновляет соседей."""
+        rows = list(rows)
+        with self._lock:
+            if self._building:
+                self._pending.extend(rows)
+            elif self._ready:
+                self._add_locked(rows)
+
+    def _add_missing(self, word_id, english_word):
+        # Вызывается под _lock: слово добавит фоновый поток, а не запрос pick
+        self._missing[word_id] = (word_id, english_word, False)
+        if self._adding:
+            return
+        self._adding = True
+
+        def run():
+            while True:
+                with self._lock:
+                    rows = list(self._missing.values())
+                    self._missing.clear()
+                    if not rows:
+                        self._adding = False
+                        return
+                try:
+                    self.add_many(rows)
+                except Exception as e:
+                    logger.error("Ошибка при добавлении слов в индекс неверных вариантов: %s", e)
+
+        threading.Thread(target=run, name='distractor-add', daemon=True).start()
+
+    def _add_locked(self, rows):
+        rows = list({row[0]: row for row in rows if row[0] not in self._positions}.values())
+        for chunk_start in range(0, len(rows), BLOCK):
+            chunk = rows[chunk_start:chunk_start + BLOCK]
+            start = self._size
+            self._grow(start + len(chunk))
+            self._featurize(start, chunk)
+            end = self._size
+            scores = self._similarity(start, end)
+            self._fill(start, end, scores)
+
+            # Новые слова становятся соседями старых, если похожи сильнее худшего соседа
+            if start:
+                incoming = scores[:, :start].T
+                new_rows = np.arange(start, end, dtype=np.int32)
+                self._merge('_all_rows', '_all_scores', start, incoming, new_rows)
+                new_base = np.nonzero(self._base[start:end])[0]
+                if len(new_base):
+                    self._merge('_base_rows', '_base_scores', start, incoming[:, new_base], new_rows[new_base])
+        self._added += len(rows)
+
+    def remove(self, word_id):
+        """Исключает удаленное слово из вариантов."""
+        with self._lock:
+            if self._building:
+                self._pending_removed.add(word_id)
+            rebuild = self._remove_locked(word_id)
+        if rebuild:
+            self.refresh()
+
+    def _remove_locked(self, word_id):
+        position = self._positions.pop(word_id, None)
+        if position is None:
+            return False
+        self._alive[position] = False
+        self._dead += 1
+        return self._dead > self._size * self.rebuild_ratio
+
+    def pick(self, word_id, english_word, deck, count=3):
+        """До count похожих на english_word слов из deck (множество word_id словаря пользователя).
+
+        Сначала ищутся среди всех похожих слов, затем среди похожих базовых;
+        и те и другие должны быть в deck, поэтому скрытые слова не предлагаются.
+        """
+        with self._lock:
+            if not self._ready:
+                return []
+            self._picks += 1
+            position = self._positions.get(word_id)
+            if position is None:
+                # Слово добавлено в другом процессе: варианты будут после фонового добавления
+                self._misses += 1
+                self._add_missing(word_id, english_word)
+                return []
+            target = self._keys[position]
+            own = []
+            for row in self._all_rows[position].tolist():
+                if row < 0:
+                    break
+                if self._alive[row] and self._keys[row] != target and int(self._ids[row]) in deck:
+                    own.append(self._texts[row])
+            base = []
+            if len(own) < count:
+                for row in self._base_rows[position].tolist():
+                    if len(own) + len(base) >= count or row < 0:
+                        break
+                    text = self._texts[row]
+                    if (self._alive[row] and self._keys[row] != target and text not in own
+                            and int(self._ids[row]) in deck):
+                        base.append(text)
+                if base:
+                    self._base_fallbacks += 1
+                if len(own) + len(base) < count:
+                    self._misses += 1
+
+        # Из 2 * count самых похожих слов словаря выбираются count, чтобы варианты менялись
+        return random.sample(own[:2 * count], min(count, len(own))) + base
+
+    def chooser(self, deck, count=3):
+        """Функция f(word_id, english_word) для build_questions.
+
+        deck - множество word_id словаря (WordSampler.get_word_set); другой
+        контейнер копируется в множество при каждом вызове. Пока индекс не
+        построен, запускает построение и возвращает None.
+        """
+        if not self._ready:
+            self.refresh()
+            return None
+        deck = deck if isinstance(deck, (set, frozenset)) else set(deck)
+        return lambda word_id, english_word: self.pick(word_id, english_word, deck, count)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': int(self._ready),
+                'words': self._size - self._dead,
+                'builds': self._builds,
+                'build_ms': self._build_ms,
+                'added': self._added,
+                'picks': self._picks,
+                'base_fallbacks': self._base_fallbacks,
+                'misses': self._misses,
+            }
@@ -1,5 +1,5 @@
 -- Добавление базовых слов в словарь
-INSERT OR IGNORE INTO words (english_word, russian_translation) VALUES 
+INSERT INTO words (english_word, russian_translation) VALUES
 ('red', 'красный'),
 ('blue', 'синий'),
 ('green', 'зеленый'),
@@ -14,7 +14,7 @@ INSERT OR IGNORE INTO words (english_word, russian_translation) VALUES
 ('book', 'книга'),
 ('water', 'вода'),
 ('food', 'еда'),
-('friend', 'друг');
+('friend', 'друг'),
 ('hello', 'привет'),
 ('goodbye', 'пока'),
 ('thank you', 'спасибо'),
@@ -50,4 +50,4 @@ INSERT OR IGNORE INTO words (english_word, russian_translation) VALUES
 ('computer', 'компьютер'),
 ('phone', 'телефон'),
 ('internet', 'интернет')
-ON CONFLICT (english_word) DO NOTHING;
\ No newline at end of file
+ON CONFLICT (english_word) DO NOTHING;
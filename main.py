@@ -1,63 +1,106 @@
+import logging
 import os
 import sys
+import time
+
+# Время запуска процесса: от него считается время старта бота
+STARTED_AT = time.perf_counter()
 
 # Установка UTF-8 кодировки для Windows
 if sys.platform == "win32":
     os.system('chcp 65001 > nul')
 
 import telebot
+import config
 from config import BOT_TOKEN
 import bot_handlers as handlers
-from database import PostgreSQLDatabase as database
+from observability import HANDLER_LATENCY, metrics, setup_logging, start_metrics_server, timed
+from outbound import OutboundSender
+from update_filter import UpdateFilter, make_middleware
+
+logger = logging.getLogger(__name__)
+
+database = handlers.database
 
 # Создание экземпляра бота
-bot = telebot.TeleBot(BOT_TOKEN)
+bot = telebot.TeleBot(BOT_TOKEN, use_class_middlewares=True)
+
+# Сообщения отправляются в фоне с учетом лимитов Telegram
+outbox = handlers.outbox = OutboundSender(bot)
+
+# Повторы и лишние обновления отбрасываются до обработчиков (и запросов к БД)
+update_filter = UpdateFilter()
+bot.setup_middleware(make_middleware(update_filter, outbox))
 
 
 # Регистрация обработчиков команд
 @bot.message_handler(commands=['start', 'начать'])
+@timed(HANDLER_LATENCY)
 def handle_start(message):
-    print(f"Команда /start от пользователя {message.from_user.id}")
+    logger.debug("Команда /start", extra={'user_id': message.from_user.id})
     handlers.send_welcome(message)
 
 
 @bot.message_handler(commands=['study', 'учить', 'обучение'])
+@timed(HANDLER_LATENCY)
 def handle_study(message):
-    print(f"Команда /study от пользователя {message.from_user.id}")
+    logger.debug("Команда /study", extra={'user_id': message.from_user.id})
     handlers.start_study(message)
 
 
 @bot.message_handler(commands=['add_word', 'добавить', 'новое слово'])
+@timed(HANDLER_LATENCY)
 def handle_add_word(message):
-    print(f"Команда /add_word от пользователя {message.from_user.id}")
+    logger.debug("Команда /add_word", extra={'user_id': message.from_user.id})
     handlers.add_word_step_1(message)
 
 
 @bot.message_handler(commands=['delete_word', 'удалить', 'удалить слово'])
+@timed(HANDLER_LATENCY)
 def handle_delete_word(message):
-    print(f"Команда /delete_word от пользователя {message.from_user.id}")
+    logger.debug("Команда /delete_word", extra={'user_id': message.from_user.id})
     handlers.delete_word_list(message)
 
 
+@bot.message_handler(commands=['import', 'импорт'])
+@timed(HANDLER_LATENCY)
+def handle_import(message):
+    logger.debug("Команда /import", extra={'user_id': message.from_user.id})
+    handlers.import_words_start(message)
+
+
+@bot.message_handler(content_types=['document'])
+@timed(HANDLER_LATENCY)
+def handle_document(message):
+    logger.debug("Документ", extra={'user_id': message.from_user.id})
+    handlers.handle_document(message)
+
+
 @bot.message_handler(commands=['stats', 'статистика', 'слова'])
+@timed(HANDLER_LATENCY)
 def handle_stats(message):
-    print(f"Команда /stats от пользователя {message.from_user.id}")
+    logger.debug("Команда /stats", extra={'user_id': message.from_user.id})
     handlers.show_stats(message)
 
 
 @bot.callback_query_handler(func=lambda call: True)
+@timed(HANDLER_LATENCY)
 def handle_callback(call):
-    print(f"Callback от пользователя {call.from_user.id}: {call.data}")
+    logger.debug("Callback", extra={'user_id': call.from_user.id, 'data': call.data})
     if call.data.startswith('delete_'):
         handlers.handle_delete_query(call)
+    elif call.data.startswith('delpage_'):
+        handlers.handle_delete_page(call)
     else:
-        bot.answer_callback_query(call.id, "Неизвестная команда")
+        outbox.answer_callback_query(call.id, "Неизвестная команда", chat_id=call.message.chat.id)
 
 
 # Обработчик текстовых сообщений (для изучения слов)
 @bot.message_handler(content_types=['text'])
+@timed(HANDLER_LATENCY)
 def handle_text(message):
-    print(f"Текстовое сообщение от {message.from_user.id}: {message.text}")
+    # Текст сообщения не логируется: это ответы пользователя
+    logger.debug("Текстовое сообщение", extra={'user_id': message.from_user.id, 'length': len(message.text)})
     # Проверяем, не является ли сообщение командой
     if message.text.startswith('/'):
         handle_unknown(message)
@@ -69,39 +112,103 @@ def handle_text(message):
 
 # Обработчик неизвестных команд
 @bot.message_handler(func=lambda message: True)
+@timed(HANDLER_LATENCY)
 def handle_unknown(message):
     if message.text.startswith('/'):
-        print(f"Неизвестная команда: {message.text} от пользователя {message.from_user.id}")
-        bot.reply_to(message, "Неизвестная команда. Используйте /start для просмотра доступных команд.")
+        logger.debug("Неизвестная команда", extra={'user_id': message.from_user.id, 'command': message.text.split()[0][:64]})
+        outbox.reply_to(message, "Неизвестная команда. Используйте /start для просмотра доступных команд.")
 
 
 def initialize_database():
     # Инициализирует базу данных при запуске бота
-    print("🔄 Проверка и инициализация базы данных...")
+    logger.info("Проверка и инициализация базы данных")
+    started = time.perf_counter()
     try:
         database.check_and_init_database()
-        print("✅ База данных готова к работе!")
+        logger.info("База данных готова к работе за %.1f мс", (time.perf_counter() - started) * 1000)
         return True
     except Exception as e:
-        print(f"❌ Ошибка при инициализации базы данных: {e}")
+        logger.error("Ошибка при инициализации базы данных: %s", e)
         return False
 
+
+def setup_observability():
+    # Логи через очередь и метрики Prometheus на http://METRICS_HOST:METRICS_PORT/metrics
+    setup_logging(getattr(config, 'LOG_LEVEL', 'INFO'), getattr(config, 'LOG_FORMAT', 'text'))
+    metrics.register_gauges('db_pool', database.pool_stats)
+    metrics.register_gauges('state_cache', handlers.state_cache.stats)
+    metrics.register_gauges('study_queue', handlers.study_queue.stats)
+    metrics.register_gauges('answer_log', handlers.answer_log.stats)
+    metrics.register_gauges('distractors', handlers.database.get_distractors().stats)
+    metrics.register_gauges('update_filter', update_filter.stats)
+    metrics.register_gauges('outbound', outbox.stats)
+
+    port = getattr(config, 'METRICS_PORT', 9108)
+    if port:
+        server = start_metrics_server(getattr(config, 'METRICS_HOST', '127.0.0.1'), port)
+        logger.info("Метрики: http://%s:%s/metrics", *server.server_address[:2])
+
+
+def run_webhook():
+    # Прием обновлений через webhook: python main.py --webhook
+    from webhook_server import UpdateDispatcher, make_webhook_app, make_webhook_server, telebot_update_handler
+
+    path = getattr(config, 'WEBHOOK_PATH', '/webhook')
+    secret_token = getattr(config, 'WEBHOOK_SECRET', None)
+
+    dispatcher = UpdateDispatcher(
+        telebot_update_handler(bot),
+        workers=getattr(config, 'WEBHOOK_WORKERS', 4),
+        queue_size=getattr(config, 'WEBHOOK_QUEUE_SIZE', 1000),
+    )
+    dispatcher.start()
+    metrics.register_gauges('webhook', dispatcher.stats)
+
+    server = make_webhook_server(
+        make_webhook_app(dispatcher, path=path, secret_token=secret_token),
+        host=getattr(config, 'WEBHOOK_HOST', '0.0.0.0'),
+        port=getattr(config, 'WEBHOOK_PORT', 8443),
+    )
+
+    bot.remove_webhook()
+    bot.set_webhook(url=config.WEBHOOK_URL, secret_token=secret_token)
+    logger.info("Webhook: %s -> порт %s", config.WEBHOOK_URL, server.server_port)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        dispatcher.stop()
+
+
+def shutdown():
+    # Сохраняет отложенные изменения и отправляет сообщения из очереди
+    handlers.study_scheduler.stop(wait=False)
+    handlers.study_queue.stop()
+    handlers.answer_log.stop()
+    handlers.state_cache.stop()
+    outbox.stop()
+    database.close_pool()
+
+
 # Запуск бота
 if __name__ == '__main__':
-    print("=" * 50)
-    print("Запуск English Learning Bot...")
-    print("=" * 50)
+    setup_observability()
+    logger.info("Запуск English Learning Bot")
 
     # Инициализация базы данных
     if not initialize_database():
-        print("❌ Не удалось инициализировать базу данных. Завершение работы.")
+        logger.error("Не удалось инициализировать базу данных. Завершение работы.")
         sys.exit(1)
 
-    print("Бот запущен и готов к работе!")
-    print("Ожидание сообщений...")
-    print("=" * 50)
+    logger.info("Бот запущен за %.2f с, ожидание сообщений", time.perf_counter() - STARTED_AT)
 
     try:
-        bot.infinity_polling()
+        if '--webhook' in sys.argv:
+            run_webhook()
+        else:
+            bot.infinity_polling()
     except Exception as e:
-        print(f"❌ Ошибка в работе бота: {e}")
\ No newline at end of file
+        logger.exception("Ошибка в работе бота: %s", e)
+    finally:
+        shutdown()
\ No newline at end of file
@@ -0,0 +1,396 @@
+import random
+import threading
+import time
+from datetime import date
+
+import srs
+from distractors import DistractorIndex
+from observability import DB_LATENCY, timed
+from storage import (MAX_LATENCY_MS, WEAK_ACCURACY, WEAK_MIN_ANSWERS, WEAK_REST, Storage, build_questions,
+                     load_base_words, next_streak, visible_streak)
+from user_state import UserState
+
+
+class _Word:
+    __slots__ = ('word_id', 'english_word', 'russian_translation', 'added_by')
+
+    def __init__(self, word_id, english_word, russian_translation, added_by):
+        self.word_id = word_id
+        self.english_word = english_word
+        self.russian_translation = russian_translation
+        self.added_by = added_by
+
+
+class _Progress:
+    """Строка user_words: счетчики ответов и параметры SM-2."""
+    __slots__ = ('correct_count', 'wrong_count', 'ease', 'interval_days', 'repetitions', 'due_at')
+
+    def __init__(self, now):
+        self.correct_count = 0
+        self.wrong_count = 0
+        self.ease = srs.DEFAULT_EASE
+        self.interval_days = 0.0
+        self.repetitions = 0
+        self.due_at = now
+
+
+class _AnswerStats:
+    """Строка сводки user_answer_stats/word_answer_stats."""
+    __slots__ = ('answers', 'correct', 'latency_ms_total', 'latency_count', 'last_answered_at')
+
+    def __init__(self):
+        self.answers = 0
+        self.correct = 0
+        self.latency_ms_total = 0
+        self.latency_count = 0
+        self.last_answered_at = 0.0
+
+    def add(self, correct, latency_ms, answered_at):
+        self.answers += 1
+        self.correct += bool(correct)
+        if latency_ms is not None and latency_ms <= MAX_LATENCY_MS:
+            self.latency_ms_total += latency_ms
+            self.latency_count += 1
+        self.last_answered_at = max(self.last_answered_at, answered_at)
+
+
+class _User:
+    __slots__ = ('username', 'first_name', 'state_mode', 'state_data', 'base_deck', 'streak_days',
+                 'best_streak_days', 'last_studied_on')
+
+    def __init__(self, username, first_name):
+        self.username = username
+        self.first_name = first_name
+        self.state_mode = 0
+        self.state_data = None
+        self.base_deck = True
+        self.streak_days = 0
+        self.best_streak_days = 0
+        self.last_studied_on = None
+
+
+class MemoryDatabase(Storage):
+    """Хранилище целиком в памяти процесса (DATABASE_URL = "memory://").
+
+    Повторяет поведение PostgreSQLDatabase, включая общий базовый словарь,
+    скрытые слова и SM-2, но ничего не сохраняет между запусками. Нужно для
+    тестов, нагрузочных прогонов и демонстрационного запуска без БД.
+    Все операции выполняются под одной блокировкой.
+    """
+
+    def __init__(self):
+        self.word_change_listeners = []
+        self._lock = threading.RLock()
+        self._users = {}  # user_id -> _User
+        self._words = {}  # word_id -> _Word
+        self._word_ids = {}  # english_word -> word_id
+        self._base_ids = set()  # word_id общих базовых слов
+        self._user_words = {}  # user_id -> {word_id: _Progress}
+        self._hidden = {}  # user_id -> {word_id}
+        self._answers = []  # журнал ответов, еще не учтенный в сводках
+        self._user_answer_stats = {}  # user_id -> _AnswerStats
+        self._word_answer_stats = {}  # user_id -> {word_id: _AnswerStats}
+        self._next_word_id = 1
+        self._operations = 0
+        self._distractors = DistractorIndex(self._index_words)
+
+    def _index_words(self):
+        with self._lock:
+            return [(word.word_id, word.english_word, word.added_by is None) for word in self._words.values()]
+
+    def get_distractors(self):
+        return self._distractors
+
+    def _words_changed(self, user_id):
+        for listener in self.word_change_listeners:
+            listener(user_id)
+
+    def _add_word(self, english_word, russian_translation, added_by):
+        """Добавляет слово, если его еще нет; возвращает (word_id, создано ли)."""
+        word_id = self._word_ids.get(english_word)
+        if word_id is not None:
+            return word_id, False
+        word_id = self._next_word_id
+        self._next_word_id += 1
+        self._words[word_id] = _Word(word_id, english_word, russian_translation, added_by)
+        self._word_ids[english_word] = word_id
+        if added_by is None:
+            self._base_ids.add(word_id)
+        return word_id, True
+
+    def _deck(self, user_id):
+        """word_id словаря пользователя (аналог представления user_deck)."""
+        user = self._users.get(user_id)
+        deck = set(self._user_words.get(user_id, ()))
+        if user is not None and user.base_deck:
+            deck |= self._base_ids - self._hidden.get(user_id, set())
+        return deck
+
+    def _link(self, user_id, word_id, now):
+        words = self._user_words.setdefault(user_id, {})
+        if word_id in words:
+            return False
+        words[word_id] = _Progress(now)
+        return True
+
+    @timed(DB_LATENCY)
+    def check_and_init_database(self):
+        with self._lock:
+            if not self._words:
+                for english_word, russian_translation in load_base_words():
+                    self._add_word(english_word, russian_translation, None)
+
+    @timed(DB_LATENCY)
+    def register_user(self, user_id, username, first_name):
+        with self._lock:
+            self._operations += 1
+            user = self._users.get(user_id)
+            if user is None:
+                self._users[user_id] = _User(username, first_name)
+            else:
+                user.username = username
+                user.first_name = first_name
+        return True
+
+    @timed(DB_LATENCY)
+    def prefetch_questions(self, user_id, count, exclude=()):
+        now = time.time()
+        with self._lock:
+            self._operations += 1
+            deck = self._deck(user_id)
+            progress = self._user_words.get(user_id, {})
+            due = sorted((entry.due_at, word_id) for word_id, entry in progress.items()
+                         if entry.due_at <= now and word_id not in exclude)[:count]
+            due_rows = [self._row(word_id) for _, word_id in due]
+            weak_rows = [self._row(word_id) for word_id in self._weak_word_ids(user_id, now - WEAK_REST)
+                         if word_id not in exclude][:count]
+            sampled_rows = [self._row(word_id) for word_id in random.sample(list(deck), min(count * 4, len(deck)))]
+        return build_questions(due_rows, sampled_rows, count, exclude, self._distractors.chooser(deck), weak_rows)
+
+    def _weak_word_ids(self, user_id, rested_before=None):
+        """word_id слабых слов словаря по сводкам, самые слабые первыми (под self._lock)."""
+        deck = self._deck(user_id)
+        weak = [(stats.correct / stats.answers, stats.last_answered_at, word_id)
+                for word_id, stats in self._word_answer_stats.get(user_id, {}).items()
+                if word_id in deck and stats.answers >= WEAK_MIN_ANSWERS
+                and stats.correct < stats.answers * WEAK_ACCURACY
+                and (rested_before is None or stats.last_answered_at <= rested_before)]
+        return [word_id for _, _, word_id in sorted(weak)]
+
+    def _row(self, word_id):
+        word = self._words[word_id]
+        return word.word_id, word.english_word, word.russian_translation
+
+    @timed(DB_LATENCY)
+    def record_answer(self, user_id, word_id, was_correct):
+        with self._lock:
+            self._operations += 1
+            self._record_answer(user_id, self._users.get(user_id), word_id, was_correct,
+                                self._deck(user_id), time.time())
+        return True
+
+    def _record_answer(self, user_id, user, word_id, was_correct, deck, now):
+        if user is not None:
+            today = date.today()
+            user.streak_days = next_streak(user.last_studied_on, user.streak_days, today)
+            user.best_streak_days = max(user.best_streak_days, user.streak_days)
+            user.last_studied_on = today
+
+        if word_id not in deck:
+            return
+        self._link(user_id, word_id, now)
+        entry = self._user_words[user_id][word_id]
+        entry.correct_count += was_correct
+        entry.wrong_count += not was_correct
+        entry.ease, entry.interval_days, entry.repetitions, due_in = srs.review_one(
+            entry.ease, entry.interval_days, entry.repetitions, was_correct)
+        entry.due_at = now + due_in
+
+    @timed(DB_LATENCY)
+    def log_answers(self, rows):
+        with self._lock:
+            self._operations += 1
+            self._answers.extend(rows)
+        return True
+
+    @timed(DB_LATENCY)
+    def rollup_answers(self, max_rows=50000):
+        with self._lock:
+            self._operations += 1
+            batch = self._answers[:max_rows]
+            # Журнал в памяти нужен только для сводок: учтенные строки не хранятся
+            del self._answers[:max_rows]
+            for user_id, word_id, correct, latency_ms, answered_at in batch:
+                self._user_answer_stats.setdefault(user_id, _AnswerStats()).add(correct, latency_ms, answered_at)
+                words = self._word_answer_stats.setdefault(user_id, {})
+                words.setdefault(word_id, _AnswerStats()).add(correct, latency_ms, answered_at)
+        return len(batch)
+
+    @timed(DB_LATENCY)
+    def get_weak_words(self, user_id, limit=3):
+        with self._lock:
+            self._operations += 1
+            word_stats = self._word_answer_stats.get(user_id, {})
+            return [(self._words[word_id].english_word, self._words[word_id].russian_translation,
+                     word_stats[word_id].answers, word_stats[word_id].correct)
+                    for word_id in self._weak_word_ids(user_id)[:limit]]
+
+    @timed(DB_LATENCY)
+    def reschedule_deck(self, user_id, per_day=50):
+        import numpy as np
+
+        with self._lock:
+            self._operations += 1
+            progress = self._user_words.get(user_id, {})
+            if not progress:
+                return 0
+            entries = list(progress.values())
+            due_at = np.array([entry.due_at for entry in entries])
+            new_due_at = srs.spread_overdue(due_at, time.time(), per_day)
+            changed = np.flatnonzero(new_due_at != due_at)
+            for index in changed:
+                entries[index].due_at = float(new_due_at[index])
+            return len(changed)
+
+    @timed(DB_LATENCY)
+    def get_user_words(self, user_id):
+        with self._lock:
+            self._operations += 1
+            words = [self._words[word_id] for word_id in self._deck(user_id)]
+        words.sort(key=lambda word: word.english_word)
+        return [(word.word_id, word.english_word, word.russian_translation) for word in words]
+
+    @timed(DB_LATENCY)
+    def get_user_words_page(self, user_id, after_word=None, limit=10):
+        after_word = after_word or ''
+        return [row for row in self.get_user_words(user_id) if row[1] > after_word][:limit]
+
+    @timed(DB_LATENCY)
+    def add_word_to_db(self, user_id, english_word, russian_translation):
+        with self._lock:
+            self._operations += 1
+            word_id, created = self._add_word(english_word, russian_translation, user_id)
+            self._link(user_id, word_id, time.time())
+            if not created:
+                # Базовое слово могло быть скрыто пользователем раньше
+                self._hidden.get(user_id, set()).discard(word_id)
+        if created:
+            self._distractors.add(word_id, english_word)
+        self._words_changed(user_id)
+        return True
+
+    @timed(DB_LATENCY)
+    def import_words(self, user_id, rows):
+        now = time.time()
+        staged = inserted = 0
+        created_words = []
+        with self._lock:
+            self._operations += 1
+            hidden = self._hidden.get(user_id, set())
+            deck = self._deck(user_id)
+            for english_word, russian_translation in rows:
+                staged += 1
+                word_id, created = self._add_word(english_word, russian_translation, user_id)
+                if created:
+                    created_words.append((word_id, english_word, False))
+                # Слова, которые уже видны в словаре (в том числе базовые), не считаются добавленными
+                if word_id not in deck:
+                    inserted += self._link(user_id, word_id, now)
+                    deck.add(word_id)
+                hidden.discard(word_id)
+        self._distractors.add_many(created_words)
+        self._words_changed(user_id)
+        return staged, inserted
+
+    @timed(DB_LATENCY)
+    def delete_word_from_user(self, user_id, word_id):
+        affected_users = []
+        with self._lock:
+            self._operations += 1
+            word = self._words.get(word_id)
+            self._user_words.get(user_id, {}).pop(word_id, None)
+            if word is not None and word.added_by == user_id:
+                # Слово удаляется целиком, в том числе у других пользователей
+                for other_user_id, words in self._user_words.items():
+                    if words.pop(word_id, None) is not None:
+                        affected_users.append(other_user_id)
+                del self._words[word_id]
+                del self._word_ids[word.english_word]
+                self._distractors.remove(word_id)
+            elif word is not None and word.added_by is None:
+                self._hidden.setdefault(user_id, set()).add(word_id)
+        self._words_changed(user_id)
+        for other_user_id in affected_users:
+            self._words_changed(other_user_id)
+        return True
+
+    @timed(DB_LATENCY)
+    def get_word_count(self, user_id):
+        with self._lock:
+            self._operations += 1
+            return len(self._deck(user_id)) if user_id in self._users else 0
+
+    @timed(DB_LATENCY)
+    def get_stats(self, user_id):
+        now = time.time()
+        with self._lock:
+            self._operations += 1
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            due_count = sum(entry.due_at <= now for entry in self._user_words.get(user_id, {}).values())
+            answer_stats = self._user_answer_stats.get(user_id) or _AnswerStats()
+            return {
+                'word_count': len(self._deck(user_id)),
+                'answers_total': answer_stats.answers,
+                'answers_correct': answer_stats.correct,
+                'accuracy': answer_stats.correct / answer_stats.answers if answer_stats.answers else None,
+                'streak_days': visible_streak(user.last_studied_on, user.streak_days, date.today()),
+                'best_streak_days': user.best_streak_days,
+                'due_count': due_count,
+                'avg_latency_ms': (answer_stats.latency_ms_total // answer_stats.latency_count
+                                   if answer_stats.latency_count else None),
+            }
+
+    @timed(DB_LATENCY)
+    def set_user_state(self, user_id, state):
+        return self.set_user_states({user_id: state})
+
+    @timed(DB_LATENCY)
+    def set_user_states(self, states):
+        with self._lock:
+            self._operations += 1
+            for user_id, state in states.items():
+                user = self._users.get(user_id)
+                if user is not None:
+                    # Как в SQL: режим без полей не перезаписывает state_data
+                    user.state_mode = int(state.mode)
+                    data = state.encode_data()
+                    if data is not None:
+                        user.state_data = data
+        return True
+
+    @timed(DB_LATENCY)
+    def get_user_state(self, user_id):
+        with self._lock:
+            self._operations += 1
+            user = self._users.get(user_id)
+            if user is None:
+                return UserState()
+            mode, data = user.state_mode, user.state_data
+        return UserState.decode(mode, data)
+
+    @timed(DB_LATENCY)
+    def clear_user_state(self, user_id):
+        return self.set_user_states({user_id: UserState()})
+
+    def pool_stats(self):
+        with self._lock:
+            return {
+                'users': len(self._users),
+                'words': len(self._words),
+                'operations': self._operations,
+            }
+
+    def close_pool(self):
+        pass
@@ -0,0 +1,20 @@
+-- Одноразовый переход на общий базовый словарь (копирование при записи).
+-- Миграция 3 (см. migrations.py); в базах, где таблица user_hidden_words
+-- появилась раньше schema_version, считается уже примененной.
+
+-- Базовые слова, которые пользователь удалил, становятся скрытыми
+INSERT INTO user_hidden_words (user_id, word_id)
+SELECT u.user_id, w.word_id
+FROM users u
+INNER JOIN words w ON w.added_by IS NULL
+WHERE NOT EXISTS (SELECT 1 FROM user_words uw WHERE uw.user_id = u.user_id AND uw.word_id = w.word_id)
+ON CONFLICT (user_id, word_id) DO NOTHING;
+
+-- Копии базовых слов без прогресса больше не нужны: они видны через user_deck
+DELETE FROM user_words uw
+USING words w
+WHERE uw.word_id = w.word_id
+  AND w.added_by IS NULL
+  AND uw.correct_count = 0
+  AND uw.wrong_count = 0
+  AND uw.repetitions = 0;
@@ -0,0 +1,154 @@
+"""Версионированные миграции схемы PostgreSQL.
+
+Каждая миграция - SQL-файл с номером версии в списке MIGRATIONS. Номера
+примененных версий хранятся в таблице schema_version, поэтому при обычном
+запуске проверка схемы - один запрос к schema_version. Недостающие
+миграции применяются по порядку в одной транзакции под advisory-блокировкой
+(одновременно запущенные процессы не применят их дважды); при ошибке
+транзакция откатывается целиком и исключение пробрасывается вызывающему.
+
+Новая миграция добавляется в конец MIGRATIONS; уже выпущенные файлы не
+меняются.
+"""
+import functools
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+SQL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MIGRATIONS = [
+    (1, 'create_tables.sql'),
+    (2, 'initial_data.sql'),
+    (3, 'migrate_base_deck.sql'),
+    (4, 'record_answer.sql'),
+    (5, 'user_state_binary.sql'),
+    (6, 'answer_log.sql'),
+    (7, 'answer_totals.sql'),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Миграция с базовым словарем: временные схемы в benchmarks/ заполняют словарь сами
+BASE_WORDS_VERSION = 2
+
+# Базы, созданные до появления schema_version, уже перешли на общий базовый
+# словарь, если в них есть таблица user_hidden_words: повторный переход
+# скрыл бы пользователям базовые слова
+SHARED_BASE_DECK_VERSION = 3
+
+# Ключ pg_advisory_xact_lock для применения миграций
+MIGRATION_LOCK_KEY = 7_340_017
+
+CREATE_VERSION_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+APPLIED_VERSIONS_SQL = "SELECT COALESCE(array_agg(version), '{}') FROM schema_version"
+LEGACY_STATE_SQL = "SELECT to_regclass('users') IS NOT NULL, to_regclass('user_hidden_words') IS NOT NULL"
+
+
+@functools.lru_cache(maxsize=None)
+def read_sql(filename):
+    """Текст SQL-файла миграции (читается один раз за процесс)."""
+    with open(os.path.join(SQL_DIR, filename), encoding='utf-8-sig') as file:
+        return file.read()
+
+
+def schema_sql():
+    """SQL всех миграций, кроме базового словаря (для временных схем в benchmarks/)."""
+    return '\n'.join(read_sql(filename) for version, filename in MIGRATIONS if version != BASE_WORDS_VERSION)
+
+
+def pending_migrations(applied):
+    """Миграции [(версия, файл)], которых нет среди примененных версий applied."""
+    return [(version, filename) for version, filename in MIGRATIONS if version not in applied]
+
+
+def baseline_versions(tables_exist, shared_base_deck):
+    """Версии, которые считаются примененными в базе без schema_version."""
+    if tables_exist and shared_base_deck:
+        return [SHARED_BASE_DECK_VERSION]
+    return []
+
+
+def _describe(version):
+    return dict(MIGRATIONS)[version]
+
+
+def migrate(conn):
+    """Приводит схему к LATEST_VERSION через соединение psycopg2.
+
+    Возвращает список примененных сейчас версий (пустой, если схема уже
+    актуальна).
+    """
+    import psycopg2.errors
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(APPLIED_VERSIONS_SQL)
+        applied = set(cursor.fetchone()[0])
+    except psycopg2.errors.UndefinedTable:
+        applied = None
+    conn.rollback()
+    if applied is not None and not pending_migrations(applied):
+        return []
+
+    try:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+        cursor.execute(LEGACY_STATE_SQL)
+        tables_exist, shared_base_deck = cursor.fetchone()
+        cursor.execute(CREATE_VERSION_TABLE_SQL)
+        cursor.execute(APPLIED_VERSIONS_SQL)
+        applied = set(cursor.fetchone()[0])
+        if not applied:
+            for version in baseline_versions(tables_exist, shared_base_deck):
+                cursor.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)",
+                               (version, _describe(version)))
+                applied.add(version)
+
+        done = []
+        for version, filename in pending_migrations(applied):
+            logger.info("Миграция схемы %s: %s", version, filename)
+            cursor.execute(read_sql(filename))
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (%s, %s)", (version, filename))
+            done.append(version)
+        conn.commit()
+        return done
+    except Exception:
+        conn.rollback()
+        raise
+
+
+async def migrate_async(conn):
+    """То же, что migrate, для соединения asyncpg."""
+    import asyncpg
+
+    try:
+        applied = set(await conn.fetchval(APPLIED_VERSIONS_SQL))
+    except asyncpg.exceptions.UndefinedTableError:
+        applied = None
+    if applied is not None and not pending_migrations(applied):
+        return []
+
+    done = []
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_KEY)
+        tables_exist, shared_base_deck = await conn.fetchrow(LEGACY_STATE_SQL)
+        await conn.execute(CREATE_VERSION_TABLE_SQL)
+        applied = set(await conn.fetchval(APPLIED_VERSIONS_SQL))
+        if not applied:
+            for version in baseline_versions(tables_exist, shared_base_deck):
+                await conn.execute("INSERT INTO schema_version (version, name) VALUES ($1, $2)",
+                                   version, _describe(version))
+                applied.add(version)
+
+        for version, filename in pending_migrations(applied):
+            logger.info("Миграция схемы %s: %s", version, filename)
+            await conn.execute(read_sql(filename))
+            await conn.execute("INSERT INTO schema_version (version, name) VALUES ($1, $2)", version, filename)
+            done.append(version)
+    return done
@@ -0,0 +1,255 @@
+import atexit
+import bisect
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Стандартные поля LogRecord; все остальное пришло через extra и выводится как поля записи
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Формат "время уровень логгер сообщение key=value ..." для чтения глазами и grep."""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name} {record.getMessage()}"
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value!r}' if isinstance(value, str) and ' ' in value
+                                   else f'{key}={value}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись (для сборщиков логов)."""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level='INFO', fmt='text'):
+    """Настраивает корневой логгер: записи уходят в очередь, а в stdout их пишет отдельный поток.
+
+    Обработчики бота только кладут запись в очередь и не ждут вывода.
+    Повторный вызов меняет уровень, но не создает второй поток.
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+
+    with _listener_lock:
+        if _listener is not None:
+            return
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(JsonFormatter() if fmt == 'json' else KeyValueFormatter())
+
+        log_queue = queue.SimpleQueue()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток вывода."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+# Границы корзин гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', 'counts', 'sum', 'count')
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram:
+    """Гистограмма с одной меткой (например, имя обработчика)."""
+
+    def __init__(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        child = self._children.get(label_value)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(label_value, _HistogramChild(len(self.buckets) + 1))
+        index = bisect.bisect_left(self.buckets, value)
+        with child._lock:
+            child.counts[index] += 1
+            child.sum += value
+            child.count += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            children = sorted(self._children.items())
+        for label_value, child in children:
+            counts, total, count = child.snapshot()
+            label = f'{self.label}="{_escape_label(label_value)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._gauge_sources = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, documentation, label, buckets=DEFAULT_BUCKETS):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, documentation, label, buckets)
+            return self._histograms[name]
+
+    def register_gauges(self, prefix, source):
+        """Добавляет gauge-метрики prefix_<ключ> из словаря, который возвращает source().
+
+        Подходит для stats() пула соединений, кэша состояний и диспетчера webhook.
+        """
+        with self._lock:
+            self._gauge_sources.append((prefix, source))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = list(self._histograms.values())
+            gauge_sources = list(self._gauge_sources)
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        for prefix, source in gauge_sources:
+            try:
+                values = source()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Не удалось получить метрики", extra={'source': prefix, 'error': str(e)})
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'# TYPE {prefix}_{key} gauge')
+                    lines.append(f'{prefix}_{key} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+HANDLER_LATENCY = metrics.histogram('bot_handler_duration_seconds', 'Время работы обработчика Telegram', 'handler')
+DB_LATENCY = metrics.histogram('db_method_duration_seconds', 'Время выполнения метода базы данных', 'method')
+
+
+def timed(histogram, name=None):
+    """Декоратор: записывает время выполнения функции в histogram с меткой name.
+
+    Работает и с обычными функциями, и с корутинами; по умолчанию метка -
+    имя функции. Время записывается и при исключении.
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    histogram.observe(label, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(label, time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry = metrics
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host='127.0.0.1', port=9108, registry=metrics):
+    """Запускает HTTP-сервер с GET /metrics в фоновом потоке и возвращает его."""
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,237 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: не больше сообщения в секунду в один чат (короткие
+# всплески допускаются) и около 30 сообщений в секунду всего
+OUTBOUND_CHAT_RATE = getattr(config, 'OUTBOUND_CHAT_RATE', 1.0)
+OUTBOUND_CHAT_BURST = getattr(config, 'OUTBOUND_CHAT_BURST', 3)
+OUTBOUND_GLOBAL_RATE = getattr(config, 'OUTBOUND_GLOBAL_RATE', 30.0)
+OUTBOUND_GLOBAL_BURST = getattr(config, 'OUTBOUND_GLOBAL_BURST', 30)
+# Потоков отправки; у каждого свое keep-alive соединение с Bot API
+OUTBOUND_WORKERS = getattr(config, 'OUTBOUND_WORKERS', 8)
+# Сколько раз повторять вызов после ответа 429
+OUTBOUND_MAX_RETRIES = getattr(config, 'OUTBOUND_MAX_RETRIES', 3)
+OUTBOUND_MAX_CHATS = getattr(config, 'OUTBOUND_MAX_CHATS', 10000)
+
+
+class RateSchedule:
+    """Token bucket, который не отказывает, а назначает время отправки.
+
+    reserve(key) возвращает момент, когда можно выполнить очередной вызов
+    (GCRA: rate вызовов в секунду, подряд до burst без ожидания). Моменты
+    для одного ключа не убывают, поэтому порядок вызовов сохраняется.
+    Хранится не больше max_keys ключей: давно не использованные
+    вытесняются первыми.
+    """
+
+    def __init__(self, rate, burst=1, max_keys=10000):
+        self.interval = 1.0 / rate
+        self.tolerance = (burst - 1) * self.interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._tat = OrderedDict()  # key -> теоретическое время следующего вызова
+
+    def reserve(self, key=None, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            self._tat[key] = tat + self.interval
+            self._tat.move_to_end(key)
+            while len(self._tat) > self.max_keys:
+                self._tat.popitem(last=False)
+        return max(now, tat - self.tolerance)
+
+    def delay(self, key, until):
+        """Не выдавать ключу время раньше until (после ответа 429)."""
+        with self._lock:
+            self._tat[key] = max(self._tat.get(key, until), until)
+
+    def __len__(self):
+        return len(self._tat)
+
+
+class _Worker:
+    """Поток отправки со своей кучей вызовов (время отправки, номер, ...)."""
+
+    def __init__(self, sender, index):
+        self.sender = sender
+        self.cond = threading.Condition()
+        self.heap = []
+        self.paused = {}  # chat_id -> время, до которого Bot API просил подождать
+        self.thread = threading.Thread(target=self.run, name=f'outbound-{index}', daemon=True)
+
+    def push(self, item):
+        with self.cond:
+            heapq.heappush(self.heap, item)
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.heap:
+                        wait = self.heap[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    elif self.sender.stopped:
+                        return
+                    else:
+                        wait = None
+                    self.cond.wait(wait)
+                item = heapq.heappop(self.heap)
+                ready, seq, chat_id, paced, method, args, kwargs, future, attempt, queued_at = item
+                paused_until = self.paused.get(chat_id)
+                if paused_until is not None:
+                    if paused_until > time.monotonic():
+                        # Вызовы чата ждут вместе с повтором и остаются в прежнем порядке
+                        heapq.heappush(self.heap, (paused_until,) + item[1:])
+                        continue
+                    del self.paused[chat_id]
+            self.sender._call(self, item)
+
+
+class OutboundSender:
+    """Очередь исходящих вызовов Bot API с учетом лимитов Telegram.
+
+    Обработчик ставит вызов в очередь и сразу продолжает работу
+    (fire and forget): send_message и другие методы возвращают Future с
+    результатом, ждать его не обязательно. Вызовы выполняет пул потоков
+    bot (TeleBot) в отдельных потоках: apihelper держит по сессии
+    requests на поток, поэтому соединения с Bot API переиспользуются.
+
+    - вызовы одного чата выполняются одним потоком по порядку, не чаще
+      chat_rate в секунду (подряд до chat_burst);
+    - все вызовы вместе - не чаще global_rate в секунду;
+    - ответ 429 приостанавливает чат на retry_after секунд, после чего
+      вызов повторяется (до max_retries раз);
+    - ответы на callback-запросы лимитами сообщений не ограничиваются.
+
+    Ошибки, кроме 429, пишутся в лог и передаются в Future.
+    """
+
+    def __init__(self, bot, workers=OUTBOUND_WORKERS, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 global_rate=OUTBOUND_GLOBAL_RATE, global_burst=OUTBOUND_GLOBAL_BURST,
+                 max_retries=OUTBOUND_MAX_RETRIES, max_chats=OUTBOUND_MAX_CHATS):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.chat_schedule = RateSchedule(chat_rate, chat_burst, max_chats)
+        self.global_schedule = RateSchedule(global_rate, global_burst)
+        self.stopped = False
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = defaultdict(int)  # chat_id -> вызовов в очереди
+        self._counters = {'sent': 0, 'failed': 0, 'retries': 0}
+        self._delay_max = 0.0
+        self._workers = [_Worker(self, index) for index in range(workers)]
+        for worker in self._workers:
+            worker.thread.start()
+
+    def submit(self, chat_id, method, /, *args, paced=True, **kwargs):
+        """Ставит в очередь вызов bot.<method>(*args, **kwargs) для чата chat_id.
+
+        chat_id и method - только позиционные: kwargs вызова тоже может
+        содержать chat_id (edit_message_text).
+        """
+        if self.stopped:
+            raise RuntimeError("Отправка остановлена")
+        future = Future()
+        now = time.monotonic()
+        ready = self.chat_schedule.reserve(chat_id, now) if paced else now
+        with self._lock:
+            self._pending[chat_id] += 1
+        worker = self._workers[hash(chat_id) % len(self._workers)]
+        worker.push((ready, next(self._seq), chat_id, paced, method, args, kwargs, future, 0, now))
+        return future
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self.submit(chat_id, 'send_message', chat_id, text, **kwargs)
+
+    def reply_to(self, message, text, **kwargs):
+        return self.submit(message.chat.id, 'reply_to', message, text, **kwargs)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return self.submit(chat_id, 'edit_message_text', text, chat_id=chat_id, message_id=message_id, **kwargs)
+
+    def edit_message_reply_markup(self, chat_id=None, message_id=None, **kwargs):
+        return self.submit(chat_id, 'edit_message_reply_markup', chat_id=chat_id, message_id=message_id, **kwargs)
+
+    def answer_callback_query(self, callback_query_id, text=None, chat_id=None, **kwargs):
+        # chat_id только выбирает поток и учитывается в wait_chat; лимиты чата не применяются
+        return self.submit(chat_id if chat_id is not None else callback_query_id, 'answer_callback_query',
+                           callback_query_id, text, paced=False, **kwargs)
+
+    def _call(self, worker, item):
+        from telebot.apihelper import ApiTelegramException
+
+        ready, seq, chat_id, paced, method, args, kwargs, future, attempt, queued_at = item
+        if paced:
+            wait = self.global_schedule.reserve() - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        try:
+            result = getattr(self.bot, method)(*args, **kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429 and attempt < self.max_retries:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                until = time.monotonic() + retry_after
+                self.chat_schedule.delay(chat_id, until)
+                with worker.cond:
+                    worker.paused[chat_id] = until
+                    heapq.heappush(worker.heap, (until, seq) + item[2:8] + (attempt + 1, queued_at))
+                    worker.cond.notify()
+                with self._lock:
+                    self._counters['retries'] += 1
+                logger.warning("Bot API просит подождать", extra={'method': method, 'retry_after': retry_after})
+                return
+            self._done(chat_id, 'failed')
+            logger.error("Ошибка вызова Bot API %s: %s", method, e)
+            future.set_exception(e)
+        except Exception as e:
+            self._done(chat_id, 'failed')
+            logger.error("Ошибка вызова Bot API %s: %s", method, e)
+            future.set_exception(e)
+        else:
+            self._done(chat_id, 'sent', time.monotonic() - queued_at)
+            future.set_result(result)
+
+    def _done(self, chat_id, outcome, delay=0.0):
+        with self._lock:
+            self._counters[outcome] += 1
+            self._delay_max = max(self._delay_max, delay)
+            self._pending[chat_id] -= 1
+            if not self._pending[chat_id]:
+                del self._pending[chat_id]
+                self._idle.notify_all()
+
+    def wait_chat(self, chat_id, timeout=None):
+        """Ждет, пока будут выполнены все вызовы чата. False по таймауту."""
+        with self._idle:
+            return self._idle.wait_for(lambda: chat_id not in self._pending, timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['queued'] = sum(self._pending.values())
+            stats['delay_max_ms'] = self._delay_max * 1000
+        stats['chats'] = len(self.chat_schedule)
+        return stats
+
+    def stop(self, timeout=10.0):
+        """Отправляет то, что уже в очереди, и останавливает потоки."""
+        self.stopped = True
+        for worker in self._workers:
+            with worker.cond:
+                worker.cond.notify()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.thread.join(max(0.0, deadline - time.monotonic()))
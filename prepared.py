@@ -0,0 +1,65 @@
+import re
+import threading
+import weakref
+
+_PLACEHOLDER = re.compile(r'\$(\d+)')
+
+
+class StatementRegistry:
+    """Реестр SQL-выражений, подготавливаемых на сервере (PREPARE/EXECUTE).
+
+    Выражение регистрируется один раз под именем, с параметрами $1, $2, ...
+    и их типами. На каждом соединении при первом вызове выполняется
+    PREPARE, дальше - только EXECUTE: PostgreSQL не разбирает текст
+    запроса заново и может переиспользовать план. Подготовленные выражения
+    живут до закрытия соединения, поэтому реестр запоминает, что уже
+    подготовлено, для каждого соединения пула (слабые ссылки - закрытые
+    соединения забываются сами).
+
+    При enabled=False выражения выполняются обычным cursor.execute с тем
+    же текстом - для сравнения в benchmarks/bench_prepared.py.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._statements = {}  # name -> (PREPARE ..., EXECUTE ..., обычный SQL)
+        self._sql = {}  # name -> текст с параметрами $1, $2, ...
+        self._prepared = weakref.WeakKeyDictionary()  # conn -> {name}
+        self._lock = threading.Lock()
+
+    def register(self, name, sql, types=()):
+        count = len(types)
+        self._sql[name] = sql
+        self._statements[name] = (
+            f"PREPARE {name} ({', '.join(types)}) AS {sql}" if types else f"PREPARE {name} AS {sql}",
+            f"EXECUTE {name} ({', '.join(['%s'] * count)})" if count else f"EXECUTE {name}",
+            _PLACEHOLDER.sub(lambda m: f"%(p{m.group(1)})s", sql),
+        )
+        return name
+
+    def sql(self, name):
+        """Текст выражения name с параметрами $1, $2, ... (asyncpg принимает его как есть)."""
+        return self._sql[name]
+
+    def execute(self, cursor, name, params=()):
+        """Выполняет выражение name с параметрами params (кортеж в порядке $1, $2, ...)."""
+        prepare_sql, execute_sql, plain_sql = self._statements[name]
+        if not self.enabled:
+            cursor.execute(plain_sql, {f'p{index}': value for index, value in enumerate(params, 1)})
+            return cursor
+
+        conn = cursor.connection
+        with self._lock:
+            prepared = self._prepared.get(conn)
+            if prepared is None:
+                prepared = self._prepared[conn] = set()
+        if name not in prepared:
+            cursor.execute(prepare_sql)
+            prepared.add(name)
+        cursor.execute(execute_sql, params)
+        return cursor
+
+    def forget(self, conn):
+        """Забывает выражения соединения (например, после DISCARD ALL)."""
+        with self._lock:
+            self._prepared.pop(conn, None)
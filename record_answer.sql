@@ -0,0 +1,61 @@
+-- Миграция 4: запись ответа отдельно от выбора следующего слова.
+-- Вопросы выбираются заранее (PostgreSQLDatabase.prefetch_questions), а
+-- ответ записывается в фоне: счетчики и серия дней пользователя и SM-2
+-- слова обновляются так же, как в study_turn (формулы совпадают с srs.review)
+
+CREATE OR REPLACE FUNCTION record_answer(p_user_id BIGINT, p_word_id INTEGER, p_correct BOOLEAN)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_quality INTEGER := CASE WHEN p_correct THEN 4 ELSE 1 END;
+BEGIN
+    UPDATE users
+    SET answers_total = answers_total + 1,
+        answers_correct = answers_correct + p_correct::INTEGER,
+        streak_days = s.streak_days,
+        best_streak_days = GREATEST(best_streak_days, s.streak_days),
+        last_studied_on = CURRENT_DATE
+    FROM (
+        SELECT CASE
+                   WHEN last_studied_on = CURRENT_DATE THEN streak_days
+                   WHEN last_studied_on = CURRENT_DATE - 1 THEN streak_days + 1
+                   ELSE 1
+               END AS streak_days
+        FROM users WHERE user_id = p_user_id
+    ) s
+    WHERE users.user_id = p_user_id;
+
+    IF p_word_id IS NULL
+       OR NOT EXISTS (SELECT 1 FROM user_deck d WHERE d.user_id = p_user_id AND d.word_id = p_word_id) THEN
+        RETURN;
+    END IF;
+
+    -- Базовое слово получает собственную строку при первом ответе
+    INSERT INTO user_words (user_id, word_id) VALUES (p_user_id, p_word_id)
+    ON CONFLICT (user_id, word_id) DO NOTHING;
+
+    UPDATE user_words uw
+    SET correct_count = uw.correct_count + p_correct::INTEGER,
+        wrong_count = uw.wrong_count + (NOT p_correct)::INTEGER,
+        ease = r.ease,
+        interval_days = r.interval_days,
+        repetitions = r.repetitions,
+        due_at = CURRENT_TIMESTAMP + CASE
+            WHEN p_correct THEN r.interval_days * INTERVAL '1 day'
+            ELSE INTERVAL '10 minutes'
+        END
+    FROM (
+        SELECT GREATEST(1.3, ease + 0.1 - (5 - v_quality) * (0.08 + (5 - v_quality) * 0.02)) AS ease,
+               CASE
+                   WHEN NOT p_correct THEN 0
+                   WHEN repetitions = 0 THEN 1
+                   WHEN repetitions = 1 THEN 6
+                   ELSE interval_days * GREATEST(1.3, ease + 0.1 - (5 - v_quality) * (0.08 + (5 - v_quality) * 0.02))
+               END AS interval_days,
+               CASE WHEN p_correct THEN repetitions + 1 ELSE 0 END AS repetitions
+        FROM user_words
+        WHERE user_id = p_user_id AND word_id = p_word_id
+    ) r
+    WHERE uw.user_id = p_user_id AND uw.word_id = p_word_id;
+END;
+$$;
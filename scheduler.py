@@ -0,0 +1,151 @@
+import asyncio
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class DelayedTaskScheduler:
+    """Планировщик отложенных задач на куче с одним потоком-таймером.
+
+    Задачи выполняются в собственном пуле потоков, поэтому ожидание не
+    занимает воркеры бота. У каждой задачи есть ключ (например, user_id):
+    новая задача с тем же ключом заменяет старую, а cancel(key) отменяет
+    ее до запуска.
+    """
+
+    def __init__(self, max_workers=4, name='delayed-tasks'):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._cond = threading.Condition()
+        self._heap = []  # (время запуска, seq, key, fn, args, kwargs)
+        self._tasks = {}  # key -> seq актуальной задачи
+        self._seq = itertools.count()
+        self._thread = None
+        self._stopped = False
+
+    def schedule(self, delay, key, fn, *args, **kwargs):
+        """Запускает fn(*args, **kwargs) через delay секунд, заменяя задачу с тем же ключом."""
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Планировщик остановлен")
+            seq = next(self._seq)
+            self._tasks[key] = seq
+            heapq.heappush(self._heap, (time.monotonic() + delay, seq, key, fn, args, kwargs))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def cancel(self, key):
+        """Отменяет ожидающую задачу. Возвращает True, если задача была."""
+        with self._cond:
+            # Запись в куче остается и будет пропущена при извлечении
+            return self._tasks.pop(key, None) is not None
+
+    def is_pending(self, key):
+        with self._cond:
+            return key in self._tasks
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._tasks)
+
+    def _ensure_thread(self):
+        # Вызывается под self._cond
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    run_at = self._heap[0][0]
+                    now = time.monotonic()
+                    if run_at > now:
+                        self._cond.wait(run_at - now)
+                        continue
+
+                    _, seq, key, fn, args, kwargs = heapq.heappop(self._heap)
+                    if self._tasks.get(key) != seq:
+                        continue  # задача отменена или заменена
+                    del self._tasks[key]
+                    break
+                else:
+                    return
+
+            self._executor.submit(self._execute, fn, args, kwargs)
+
+    def _execute(self, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception("Ошибка в отложенной задаче %s: %s", getattr(fn, '__name__', fn), e)
+
+    def stop(self, wait=True):
+        """Останавливает планировщик; ожидающие задачи отбрасываются."""
+        with self._cond:
+            self._stopped = True
+            self._tasks.clear()
+            self._heap.clear()
+            self._cond.notify_all()
+        self._executor.shutdown(wait=wait)
+
+
+class AsyncDelayedTaskScheduler:
+    """То же для asyncio: fn - корутина, ожидание - задача цикла событий.
+
+    Ключи, замена и отмена - как у DelayedTaskScheduler: cancel(key)
+    отменяет задачу только до запуска, начатая задача выполняется до конца.
+    """
+
+    def __init__(self, name='delayed-tasks'):
+        self.name = name
+        self._tasks = {}  # key -> задача, ожидающая запуска
+        self._running = set()
+
+    def schedule(self, delay, key, fn, *args, **kwargs):
+        """Запускает fn(*args, **kwargs) через delay секунд, заменяя задачу с тем же ключом."""
+        self.cancel(key)
+        task = asyncio.get_running_loop().create_task(self._run(delay, key, fn, args, kwargs))
+        self._tasks[key] = task
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    def cancel(self, key):
+        """Отменяет ожидающую задачу. Возвращает True, если задача была."""
+        task = self._tasks.pop(key, None)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def is_pending(self, key):
+        return key in self._tasks
+
+    def pending_count(self):
+        return len(self._tasks)
+
+    async def _run(self, delay, key, fn, args, kwargs):
+        await asyncio.sleep(delay)
+        # Дальше задача уже не отменяется через cancel
+        del self._tasks[key]
+        try:
+            await fn(*args, **kwargs)
+        except Exception as e:
+            logger.exception("Ошибка в отложенной задаче %s: %s", getattr(fn, '__name__', fn), e)
+
+    async def stop(self):
+        """Отбрасывает ожидающие задачи и дожидается начатых."""
+        for key in list(self._tasks):
+            self.cancel(key)
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
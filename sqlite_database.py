@@ -0,0 +1,762 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+
+import config
+import srs
+from distractors import DistractorIndex
+from observability import DB_LATENCY, timed
+from storage import (MAX_LATENCY_MS, WEAK_REST, WEAK_WORD_CONDITION, Storage, build_questions,
+                     load_base_words, next_streak, visible_streak)
+from ttl_cache import TTLCache
+from user_state import UserState
+from word_sampler import WordSampler
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'create_tables_sqlite.sql')
+# Версия схемы хранится в PRAGMA user_version: если она не меньше этой,
+# проверка при запуске - один запрос. Увеличивается при изменении схемы
+SCHEMA_VERSION = 4
+
+# Сколько записей писатель объединяет в одну транзакцию
+SQLITE_WRITE_BATCH = getattr(config, 'SQLITE_WRITE_BATCH', 64)
+# Размер кэша подготовленных выражений на соединение
+SQLITE_STATEMENT_CACHE = getattr(config, 'SQLITE_STATEMENT_CACHE', 256)
+SQLITE_BUSY_TIMEOUT = getattr(config, 'SQLITE_BUSY_TIMEOUT', 30.0)
+
+# Строки импорта передаются писателю порциями, чтобы файл не лежал в памяти целиком
+IMPORT_CHUNK_SIZE = 1000
+
+# Столбцы, которых может не быть в файлах БД, созданных старыми версиями бота
+MIGRATED_COLUMNS = {
+    'users': [
+        ('state_mode', 'INTEGER NOT NULL DEFAULT 0'),
+        ('state_data', 'BLOB'),
+        ('base_deck', 'INTEGER NOT NULL DEFAULT 1'),
+        ('word_count', 'INTEGER'),
+        ('streak_days', 'INTEGER NOT NULL DEFAULT 0'),
+        ('best_streak_days', 'INTEGER NOT NULL DEFAULT 0'),
+        ('last_studied_on', 'TEXT'),
+    ],
+    'user_words': [
+        ('correct_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('wrong_count', 'INTEGER NOT NULL DEFAULT 0'),
+        ('ease', 'REAL NOT NULL DEFAULT 2.5'),
+        ('interval_days', 'REAL NOT NULL DEFAULT 0'),
+        ('repetitions', 'INTEGER NOT NULL DEFAULT 0'),
+        ('due_at', 'REAL NOT NULL DEFAULT 0'),
+    ],
+}
+
+REFRESH_WORD_COUNT_SQL = '''
+    UPDATE users
+    SET word_count = (SELECT COUNT(*) FROM user_deck WHERE user_id = :user_id)
+    WHERE user_id = :user_id
+'''
+
+PAGE_SQL = '''
+    SELECT w.word_id, w.english_word, w.russian_translation
+    FROM words w
+    INNER JOIN user_deck d ON w.word_id = d.word_id
+    WHERE d.user_id = ? AND w.english_word > ?
+    ORDER BY w.english_word
+    LIMIT ?
+'''
+
+# Сводки по строкам журнала answers с answer_id в (:from_id, :to_id], как
+# функция rollup_answers PostgreSQL. Строки пишет один поток-писатель, поэтому
+# answer_id фиксируются по порядку и задержка, как в PostgreSQL, не нужна
+ROLLUP_WORD_SQL = '''
+    INSERT INTO word_answer_stats (user_id, word_id, answers, correct, latency_ms_total, latency_count,
+                                   last_answered_at)
+    SELECT user_id, word_id, COUNT(*), SUM(correct),
+           SUM(CASE WHEN latency_ms <= :max_latency THEN latency_ms ELSE 0 END),
+           COUNT(CASE WHEN latency_ms <= :max_latency THEN 1 END),
+           MAX(answered_at)
+    FROM answers
+    WHERE answer_id > :from_id AND answer_id <= :to_id
+    GROUP BY user_id, word_id
+    ON CONFLICT (user_id, word_id) DO UPDATE
+    SET answers = answers + excluded.answers,
+        correct = correct + excluded.correct,
+        latency_ms_total = latency_ms_total + excluded.latency_ms_total,
+        latency_count = latency_count + excluded.latency_count,
+        last_answered_at = MAX(last_answered_at, excluded.last_answered_at)
+'''
+ROLLUP_USER_SQL = '''
+    INSERT INTO user_answer_stats (user_id, answers, correct, latency_ms_total, latency_count, last_answered_at)
+    SELECT user_id, COUNT(*), SUM(correct),
+           SUM(CASE WHEN latency_ms <= :max_latency THEN latency_ms ELSE 0 END),
+           COUNT(CASE WHEN latency_ms <= :max_latency THEN 1 END),
+           MAX(answered_at)
+    FROM answers
+    WHERE answer_id > :from_id AND answer_id <= :to_id
+    GROUP BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET answers = answers + excluded.answers,
+        correct = correct + excluded.correct,
+        latency_ms_total = latency_ms_total + excluded.latency_ms_total,
+        latency_count = latency_count + excluded.latency_count,
+        last_answered_at = MAX(last_answered_at, excluded.last_answered_at)
+'''
+
+
+class SQLiteDatabase(Storage):
+    """Хранилище в файле SQLite для развертывания на одной машине.
+
+    Файл открывается в режиме WAL: читатели работают параллельно, каждый
+    поток через свое соединение. Все записи выполняет один поток-писатель
+    из очереди; задачи, накопившиеся за время транзакции, выполняются
+    следующей транзакцией вместе (каждая в своем SAVEPOINT), поэтому fsync
+    делается один раз на пачку. SQL-тексты постоянные, и sqlite3 берет
+    подготовленные выражения из кэша соединения.
+    """
+
+    def __init__(self, path, write_batch=SQLITE_WRITE_BATCH):
+        if path in ('', ':memory:'):
+            raise ValueError("Для хранения в памяти используйте DATABASE_URL = 'memory://'")
+
+        self.path = path
+        self.write_batch = write_batch
+        self.word_change_listeners = []
+
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._sampler = WordSampler(self._load_user_word_ids,
+                                    max_users=getattr(config, 'SAMPLER_MAX_USERS', 1000),
+                                    ttl=getattr(config, 'SAMPLER_TTL', 300.0))
+        self._word_counts = TTLCache(max_size=getattr(config, 'WORD_COUNT_CACHE_SIZE', 10000),
+                                     ttl=getattr(config, 'WORD_COUNT_CACHE_TTL', 300.0))
+        self._distractors = DistractorIndex(self._index_words,
+                                            neighbors=getattr(config, 'DISTRACTOR_NEIGHBORS', 16))
+
+        # Метрики очереди записи
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self._batches = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name='sqlite-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _reader(self):
+        """Соединение для чтения, свое у каждого потока."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _writer_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            task = self._queue.get()
+            if task is None:
+                break
+            batch = [task]
+            while len(batch) < self.write_batch:
+                try:
+                    task = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    stopping = True
+                    break
+                batch.append(task)
+            self._run_batch(conn, batch)
+        conn.close()
+
+    def _run_batch(self, conn, batch):
+        started = time.monotonic()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, fn, args, enqueued_at in batch:
+                conn.execute("SAVEPOINT task")
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    conn.execute("RELEASE task")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO task")
+                    conn.execute("RELEASE task")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, None, e) for future, _, _, _ in batch]
+
+        with self._stats_lock:
+            self._batches += 1
+            self._writes += len(batch)
+            for _, _, _, enqueued_at in batch:
+                wait_time = started - enqueued_at
+                self._wait_total += wait_time
+                self._wait_max = max(self._wait_max, wait_time)
+
+        # Результаты отдаются только после COMMIT
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _write(self, fn, *args):
+        """Выполняет fn(conn, *args) в потоке-писателе и возвращает результат."""
+        if not self._writer.is_alive():
+            raise RuntimeError("Хранилище SQLite закрыто")
+        future = Future()
+        self._queue.put((future, fn, args, time.monotonic()))
+        return future.result()
+
+    def _load_user_word_ids(self, user_id):
+        rows = self._reader().execute("SELECT word_id FROM user_deck WHERE user_id = ?", (user_id,))
+        return [row[0] for row in rows]
+
+    def _index_words(self):
+        return self._reader().execute(
+            "SELECT word_id, english_word, added_by IS NULL FROM words").fetchall()
+
+    def get_distractors(self):
+        return self._distractors
+
+    def _words_changed(self, user_id):
+        self._sampler.invalidate(user_id)
+        self._word_counts.invalidate(user_id)
+        for listener in self.word_change_listeners:
+            listener(user_id)
+
+    @timed(DB_LATENCY)
+    def check_and_init_database(self):
+        conn = self._connect()
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                logger.info("База данных SQLite уже инициализирована: %s (схема %s)", self.path, version)
+                return
+
+            with open(SCHEMA_FILE, encoding='utf-8') as file:
+                conn.executescript(file.read())
+            self._migrate_columns(conn)
+            self._migrate_user_state(conn)
+            self._migrate_answer_totals(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_user_words_due ON user_words(user_id, due_at)")
+
+            if conn.execute("SELECT 1 FROM words WHERE added_by IS NULL LIMIT 1").fetchone() is None:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO words (english_word, russian_translation) VALUES (?, ?)",
+                        load_base_words()
+                    )
+                logger.info("База данных SQLite инициализирована: %s", self.path)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except Exception as e:
+            logger.error("Ошибка при проверке базы данных: %s", e)
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _migrate_columns(conn):
+        for table, columns in MIGRATED_COLUMNS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, definition in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    @staticmethod
+    def _migrate_user_state(conn):
+        """Переносит режимы без полей из старого JSON-столбца user_state (как миграция 5 PostgreSQL)."""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if 'user_state' in existing:
+            with conn:
+                conn.execute('''
+                    UPDATE users
+                    SET state_mode = CASE json_extract(user_state, '$.mode')
+                                         WHEN 'add_word_step1' THEN 2
+                                         WHEN 'import' THEN 4
+                                         ELSE 0
+                                     END
+                    WHERE user_state LIKE '%"mode"%' AND json_valid(user_state)
+                ''')
+
+    @staticmethod
+    def _migrate_answer_totals(conn):
+        """Переносит ответы до журнала из счетчиков users в user_answer_stats (как миграция 7 PostgreSQL)."""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if 'answers_total' not in existing:
+            return
+        with conn:
+            conn.execute('''
+                INSERT INTO user_answer_stats (user_id, answers, correct)
+                SELECT u.user_id, u.answers_total - COALESCE(j.answers, 0),
+                       MAX(u.answers_correct - COALESCE(j.correct, 0), 0)
+                FROM users u
+                LEFT JOIN (
+                    SELECT user_id, COUNT(*) AS answers, SUM(correct) AS correct FROM answers GROUP BY user_id
+                ) j ON j.user_id = u.user_id
+                WHERE u.answers_total > COALESCE(j.answers, 0)
+                ON CONFLICT (user_id) DO UPDATE
+                SET answers = answers + excluded.answers,
+                    correct = correct + excluded.correct
+            ''')
+            conn.execute("ALTER TABLE users DROP COLUMN answers_total")
+            conn.execute("ALTER TABLE users DROP COLUMN answers_correct")
+
+    @timed(DB_LATENCY)
+    def register_user(self, user_id, username, first_name):
+        try:
+            self._write(self._register_user, user_id, username, first_name)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при регистрации пользователя: %s", e)
+            return False
+
+    @staticmethod
+    def _register_user(conn, user_id, username, first_name):
+        conn.execute(
+            "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET username = excluded.username, first_name = excluded.first_name",
+            (user_id, username, first_name)
+        )
+
+    @timed(DB_LATENCY)
+    def prefetch_questions(self, user_id, count, exclude=()):
+        try:
+            word_ids = self._sampler.sample_from(self._sampler.get_word_ids(user_id), count * 4)
+            deck = self._sampler.get_word_set(user_id)
+            exclude = list(exclude)
+            conn = self._reader()
+            due_rows = conn.execute(f'''
+                SELECT w.word_id, w.english_word, w.russian_translation
+                FROM user_words uw
+                INNER JOIN words w ON w.word_id = uw.word_id
+                WHERE uw.user_id = ? AND uw.due_at <= ? AND uw.word_id NOT IN ({','.join('?' * len(exclude))})
+                ORDER BY uw.due_at
+                LIMIT ?
+            ''', (user_id, time.time(), *exclude, count)).fetchall()
+            weak_rows = conn.execute(f'''
+                SELECT w.word_id, w.english_word, w.russian_translation
+                FROM word_answer_stats s
+                INNER JOIN words w ON w.word_id = s.word_id
+                WHERE s.user_id = ? AND {WEAK_WORD_CONDITION}
+                  AND s.last_answered_at <= ? AND s.word_id NOT IN ({','.join('?' * len(exclude))})
+                ORDER BY CAST(s.correct AS REAL) / s.answers, s.last_answered_at
+                LIMIT ?
+            ''', (user_id, time.time() - WEAK_REST, *exclude, count)).fetchall()
+            sampled = {row[0]: row for row in conn.execute(
+                f"SELECT word_id, english_word, russian_translation FROM words WHERE word_id IN ({','.join('?' * len(word_ids))})",
+                word_ids
+            )}
+            if len(sampled) < len(word_ids):
+                self._sampler.invalidate(user_id)
+            sampled_rows = [sampled[word_id] for word_id in word_ids if word_id in sampled]
+            return build_questions(due_rows, sampled_rows, count, exclude, self._distractors.chooser(deck),
+                                   weak_rows)
+        except Exception as e:
+            logger.error("Ошибка при выборе следующих вопросов: %s", e)
+            return []
+
+    @timed(DB_LATENCY)
+    def record_answer(self, user_id, word_id, was_correct):
+        try:
+            self._write(self._record_answer, user_id, word_id, was_correct, time.time(), date.today())
+            return True
+        except Exception as e:
+            logger.error("Ошибка при записи ответа: %s", e)
+            return False
+
+    @staticmethod
+    def _record_answer(conn, user_id, word_id, was_correct, now, today):
+        """Серия дней пользователя, счетчики и SM-2 слова (как SQL-функция record_answer)."""
+        user = conn.execute("SELECT streak_days, last_studied_on FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if user is None:
+            return
+        last_studied_on = date.fromisoformat(user[1]) if user[1] else None
+        streak_days = next_streak(last_studied_on, user[0], today)
+        conn.execute('''
+            UPDATE users
+            SET streak_days = ?,
+                best_streak_days = MAX(best_streak_days, ?),
+                last_studied_on = ?
+            WHERE user_id = ?
+        ''', (streak_days, streak_days, today.isoformat(), user_id))
+
+        if word_id is None or not conn.execute(
+                "SELECT 1 FROM user_deck WHERE user_id = ? AND word_id = ?", (user_id, word_id)).fetchone():
+            return
+        # Базовое слово получает собственную строку при первом ответе
+        conn.execute("INSERT OR IGNORE INTO user_words (user_id, word_id, due_at) VALUES (?, ?, ?)",
+                     (user_id, word_id, now))
+        ease, interval_days, repetitions = conn.execute(
+            "SELECT ease, interval_days, repetitions FROM user_words WHERE user_id = ? AND word_id = ?",
+            (user_id, word_id)
+        ).fetchone()
+        ease, interval_days, repetitions, due_in = srs.review_one(ease, interval_days, repetitions, was_correct)
+        conn.execute('''
+            UPDATE user_words
+            SET correct_count = correct_count + ?, wrong_count = wrong_count + ?,
+                ease = ?, interval_days = ?, repetitions = ?, due_at = ?
+            WHERE user_id = ? AND word_id = ?
+        ''', (was_correct, not was_correct, ease, interval_days, repetitions, now + due_in, user_id, word_id))
+
+    @timed(DB_LATENCY)
+    def log_answers(self, rows):
+        if not rows:
+            return True
+        try:
+            self._write(self._log_answers, rows)
+            return True
+        except Exception as e:
+            logger.error("Ошибка при записи журнала ответов: %s", e)
+            return False
+
+    @staticmethod
+    def _log_answers(conn, rows):
+        conn.executemany(
+            "INSERT INTO answers (user_id, word_id, correct, latency_ms, answered_at) VALUES (?, ?, ?, ?, ?)", rows)
+
+    @timed(DB_LATENCY)
+    def rollup_answers(self, max_rows=50000):
+        try:
+            return self._write(self._rollup_answers, max_rows, time.time())
+        except Exception as e:
+            logger.error("Ошибка при обновлении сводок ответов: %s", e)
+            return 0
+
+    @staticmethod
+    def _rollup_answers(conn, max_rows, now):
+        from_id = conn.execute("SELECT last_answer_id FROM answer_rollup_state").fetchone()[0]
+        to_id, count = conn.execute(
+            "SELECT MAX(answer_id), COUNT(*) FROM (SELECT answer_id FROM answers WHERE answer_id > ? "
+            "ORDER BY answer_id LIMIT ?)", (from_id, max_rows)).fetchone()
+        if to_id is None:
+            return 0
+        params = {'from_id': from_id, 'to_id': to_id, 'max_latency': MAX_LATENCY_MS}
+        conn.execute(ROLLUP_WORD_SQL, params)
+        conn.execute(ROLLUP_USER_SQL, params)
+        conn.execute("UPDATE answer_rollup_state SET last_answer_id = ?, rolled_up_at = ?", (to_id, now))
+        return count
+
+    @timed(DB_LATENCY)
+    def get_weak_words(self, user_id, limit=3):
+        try:
+            return self._reader().execute(f'''
+                SELECT w.english_word, w.russian_translation, s.answers, s.correct
+                FROM word_answer_stats s
+                INNER JOIN words w ON w.word_id = s.word_id
+                WHERE s.user_id = ? AND {WEAK_WORD_CONDITION}
+                ORDER BY CAST(s.correct AS REAL) / s.answers, s.last_answered_at
+                LIMIT ?
+            ''', (user_id, limit)).fetchall()
+        except Exception as e:
+            logger.error("Ошибка при выборе слабых слов: %s", e)
+            return []
+
+    @timed(DB_LATENCY)
+    def reschedule_deck(self, user_id, per_day=50):
+        try:
+            return self._write(self._reschedule_deck, user_id, per_day, time.time())
+        except Exception as e:
+            logger.error("Ошибка при пересчете расписания повторений: %s", e)
+            return 0
+
+    @staticmethod
+    def _reschedule_deck(conn, user_id, per_day, now):
+        import numpy as np
+
+        rows = conn.execute("SELECT word_id, due_at FROM user_words WHERE user_id = ?", (user_id,)).fetchall()
+        if not rows:
+            return 0
+        due_at = np.array([row[1] for row in rows], dtype=np.float64)
+        new_due_at = srs.spread_overdue(due_at, now, per_day)
+        changed = np.flatnonzero(new_due_at != due_at)
+        conn.executemany(
+            "UPDATE user_words SET due_at = ? WHERE user_id = ? AND word_id = ?",
+            [(float(new_due_at[i]), user_id, rows[i][0]) for i in changed]
+        )
+        return len(changed)
+
+    @timed(DB_LATENCY)
+    def get_user_words(self, user_id):
+        try:
+            return self._reader().execute('''
+                SELECT w.word_id, w.english_word, w.russian_translation
+                FROM words w
+                INNER JOIN user_deck d ON w.word_id = d.word_id
+                WHERE d.user_id = ?
+                ORDER BY w.english_word
+            ''', (user_id,)).fetchall()
+        except Exception as e:
+            logger.error("Ошибка при получении слов пользователя: %s", e)
+            return []
+
+    @timed(DB_LATENCY)
+    def get_user_words_page(self, user_id, after_word=None, limit=10):
+        try:
+            return self._reader().execute(PAGE_SQL, (user_id, after_word or '', limit)).fetchall()
+        except Exception as e:
+            logger.error("Ошибка при получении страницы слов пользователя: %s", e)
+            return []
+
+    @timed(DB_LATENCY)
+    def add_word_to_db(self, user_id, english_word, russian_translation):
+        try:
+            created_id = self._write(self._add_word, user_id, english_word, russian_translation, time.time())
+        except Exception as e:
+            logger.error("Ошибка при добавлении слова: %s", e)
+            return False
+        if created_id is not None:
+            self._distractors.add(created_id, english_word)
+        self._words_changed(user_id)
+        return True
+
+    @staticmethod
+    def _add_word(conn, user_id, english_word, russian_translation, now):
+        """Возвращает word_id, если слово создано, иначе None."""
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO words (english_word, russian_translation, added_by) VALUES (?, ?, ?)",
+            (english_word, russian_translation, user_id)
+        )
+        created_id = None
+        if cursor.rowcount:
+            word_id = created_id = cursor.lastrowid
+        else:
+            word_id = conn.execute("SELECT word_id FROM words WHERE english_word = ?", (english_word,)).fetchone()[0]
+            # Базовое слово могло быть скрыто пользователем раньше
+            conn.execute("DELETE FROM user_hidden_words WHERE user_id = ? AND word_id = ?", (user_id, word_id))
+        conn.execute("INSERT OR IGNORE INTO user_words (user_id, word_id, due_at) VALUES (?, ?, ?)",
+                     (user_id, word_id, now))
+        conn.execute(REFRESH_WORD_COUNT_SQL, {'user_id': user_id})
+        return created_id
+
+    @timed(DB_LATENCY)
+    def import_words(self, user_id, rows):
+        """Импорт порциями по IMPORT_CHUNK_SIZE строк; каждая порция - отдельная запись.
+
+        В отличие от PostgreSQL импорт не атомарен: при ошибке уже
+        записанные порции остаются в словаре.
+        """
+        staged = inserted = 0
+        chunk = []
+        try:
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    inserted += self._import(user_id, chunk)
+                    staged += len(chunk)
+                    chunk = []
+            inserted += self._import(user_id, chunk)
+            staged += len(chunk)
+        except Exception as e:
+            logger.error("Ошибка при импорте слов: %s", e)
+            if staged:
+                self._words_changed(user_id)
+            return None
+        self._words_changed(user_id)
+        return staged, inserted
+
+    def _import(self, user_id, chunk):
+        inserted, created_words = self._write(self._import_chunk, user_id, chunk, time.time())
+        self._distractors.add_many((word_id, english_word, False) for word_id, english_word in created_words)
+        return inserted
+
+    @staticmethod
+    def _import_chunk(conn, user_id, chunk, now):
+        """Возвращает (добавлено в словарь, [(word_id, english_word)] созданных слов)."""
+        # Писатель один, поэтому новые слова - это word_id больше прежнего максимума
+        last_word_id = conn.execute("SELECT COALESCE(MAX(word_id), 0) FROM words").fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO words (english_word, russian_translation, added_by) VALUES (?, ?, ?)",
+            [(english_word, russian_translation, user_id) for english_word, russian_translation in chunk]
+        )
+        before = conn.total_changes
+        # Слова, которые уже видны в словаре (в том числе базовые), не считаются добавленными
+        conn.executemany(
+            "INSERT OR IGNORE INTO user_words (user_id, word_id, due_at) SELECT ?, w.word_id, ? FROM words w "
+            "WHERE w.english_word = ? AND NOT EXISTS "
+            "(SELECT 1 FROM user_deck d WHERE d.user_id = ? AND d.word_id = w.word_id)",
+            [(user_id, now, english_word, user_id) for english_word, _ in chunk]
+        )
+        inserted = conn.total_changes - before
+        # Базовые слова из файла снова видны пользователю
+        conn.executemany(
+            "DELETE FROM user_hidden_words WHERE user_id = ? AND word_id = (SELECT word_id FROM words WHERE english_word = ?)",
+            [(user_id, english_word) for english_word, _ in chunk]
+        )
+        conn.execute(REFRESH_WORD_COUNT_SQL, {'user_id': user_id})
+        created_words = conn.execute(
+            "SELECT word_id, english_word FROM words WHERE word_id > ?", (last_word_id,)).fetchall()
+        return inserted, created_words
+
+    @timed(DB_LATENCY)
+    def delete_word_from_user(self, user_id, word_id):
+        try:
+            affected_users, deleted = self._write(self._delete_word, user_id, word_id)
+        except Exception as e:
+            logger.error("Ошибка при удалении слова: %s", e)
+            return False
+        if deleted:
+            self._distractors.remove(word_id)
+        self._words_changed(user_id)
+        for other_user_id in affected_users:
+            self._words_changed(other_user_id)
+        return True
+
+    @staticmethod
+    def _delete_word(conn, user_id, word_id):
+        """Возвращает (пользователи, у которых пропало слово, удалено ли слово целиком)."""
+        result = conn.execute("SELECT added_by FROM words WHERE word_id = ?", (word_id,)).fetchone()
+        added_by = result[0] if result else None
+
+        conn.execute("DELETE FROM user_words WHERE user_id = ? AND word_id = ?", (user_id, word_id))
+
+        affected_users = []
+        if added_by == user_id:
+            # Слово пропадет и у других пользователей: их счетчики пересчитаются при чтении
+            affected_users = [row[0] for row in conn.execute(
+                "SELECT user_id FROM user_words WHERE word_id = ?", (word_id,))]
+            conn.executemany("UPDATE users SET word_count = NULL WHERE user_id = ?",
+                             [(other_user_id,) for other_user_id in affected_users])
+            conn.execute("DELETE FROM words WHERE word_id = ?", (word_id,))
+        elif added_by is None and result:
+            # Общее базовое слово не удаляется, а скрывается для пользователя
+            conn.execute("INSERT OR IGNORE INTO user_hidden_words (user_id, word_id) VALUES (?, ?)",
+                         (user_id, word_id))
+
+        conn.execute(REFRESH_WORD_COUNT_SQL, {'user_id': user_id})
+        return affected_users, added_by == user_id
+
+    @staticmethod
+    def _refresh_word_count(conn, user_id):
+        conn.execute(REFRESH_WORD_COUNT_SQL, {'user_id': user_id})
+        return conn.execute("SELECT word_count FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    @timed(DB_LATENCY)
+    def get_word_count(self, user_id):
+        count = self._word_counts.get(user_id)
+        if count is not None:
+            return count
+        try:
+            result = self._reader().execute("SELECT word_count FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if not result:
+                return 0
+            count = result[0]
+            if count is None:
+                count = self._write(self._refresh_word_count, user_id)
+            self._word_counts.set(user_id, count)
+            return count
+        except Exception as e:
+            logger.error("Ошибка при получении количества слов: %s", e)
+            return 0
+
+    @timed(DB_LATENCY)
+    def get_stats(self, user_id):
+        try:
+            result = self._reader().execute('''
+                SELECT u.word_count, COALESCE(a.answers, 0), COALESCE(a.correct, 0), u.streak_days,
+                       u.best_streak_days, u.last_studied_on,
+                       (SELECT COUNT(*) FROM user_words uw WHERE uw.user_id = u.user_id AND uw.due_at <= ?),
+                       a.latency_ms_total / NULLIF(a.latency_count, 0)
+                FROM users u
+                LEFT JOIN user_answer_stats a ON a.user_id = u.user_id
+                WHERE u.user_id = ?
+            ''', (time.time(), user_id)).fetchone()
+            if not result:
+                return None
+
+            (word_count, answers_total, answers_correct, streak_days, best_streak_days, last_studied_on, due_count,
+             avg_latency_ms) = result
+            if word_count is None:
+                word_count = self._write(self._refresh_word_count, user_id)
+            self._word_counts.set(user_id, word_count)
+
+            last_studied_on = date.fromisoformat(last_studied_on) if last_studied_on else None
+            return {
+                'word_count': word_count,
+                'answers_total': answers_total,
+                'answers_correct': answers_correct,
+                'accuracy': answers_correct / answers_total if answers_total else None,
+                'streak_days': visible_streak(last_studied_on, streak_days, date.today()),
+                'best_streak_days': best_streak_days,
+                'due_count': due_count,
+                'avg_latency_ms': avg_latency_ms,
+            }
+        except Exception as e:
+            logger.error("Ошибка при получении статистики: %s", e)
+            return None
+
+    @timed(DB_LATENCY)
+    def set_user_state(self, user_id, state):
+        return self.set_user_states({user_id: state})
+
+    @timed(DB_LATENCY)
+    def set_user_states(self, states):
+        if not states:
+            return True
+        try:
+            self._write(self._set_user_states,
+                        [(int(state.mode), state.encode_data(), user_id) for user_id, state in states.items()])
+            return True
+        except Exception as e:
+            logger.error("Ошибка при пакетной установке состояний: %s", e)
+            return False
+
+    @staticmethod
+    def _set_user_states(conn, rows):
+        # state_data = NULL - режим без полей: двоичные данные не перезаписываются
+        conn.executemany(
+            "UPDATE users SET state_mode = ?, state_data = COALESCE(?, state_data) WHERE user_id = ?", rows)
+
+    @timed(DB_LATENCY)
+    def get_user_state(self, user_id):
+        try:
+            result = self._reader().execute(
+                "SELECT state_mode, state_data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            return UserState.decode(*result) if result else UserState()
+        except Exception as e:
+            logger.error("Ошибка при получении состояния: %s", e)
+            return UserState()
+
+    @timed(DB_LATENCY)
+    def clear_user_state(self, user_id):
+        return self.set_user_state(user_id, UserState())
+
+    def pool_stats(self):
+        with self._stats_lock:
+            return {
+                'readers': len(self._readers),
+                'write_queue': self._queue.qsize(),
+                'writes': self._writes,
+                'write_batches': self._batches,
+                'write_wait_avg_ms': (self._wait_total / self._writes * 1000) if self._writes else 0.0,
+                'write_wait_max_ms': self._wait_max * 1000,
+            }
+
+    def close_pool(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
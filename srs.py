@@ -0,0 +1,70 @@
+"""Интервальное повторение по алгоритму SM-2 в векторизованном виде.
+
+Формулы совпадают с расчетом в SQL-функции record_answer (record_answer.sql),
+которая пересчитывает одно слово после каждого ответа. Здесь они применяются
+сразу ко всем словам пользователя массивами NumPy.
+"""
+import numpy as np
+
+# Параметры SM-2
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+# Оценка ответа по шкале SM-2 (0-5)
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+# Через сколько минут повторить слово после ошибки
+RELEARN_MINUTES = 10
+
+SECONDS_PER_DAY = 86400.0
+
+
+def review(ease, interval_days, repetitions, correct):
+    """Пересчитывает параметры слов после ответов.
+
+    Все аргументы - массивы одинаковой длины (или скаляры). Возвращает
+    (ease, interval_days, repetitions, due_in_seconds).
+    """
+    ease = np.asarray(ease, dtype=np.float64)
+    interval_days = np.asarray(interval_days, dtype=np.float64)
+    repetitions = np.asarray(repetitions, dtype=np.int64)
+    correct = np.asarray(correct, dtype=bool)
+
+    quality = np.where(correct, QUALITY_CORRECT, QUALITY_WRONG)
+    penalty = 5 - quality
+    new_ease = np.maximum(MIN_EASE, ease + 0.1 - penalty * (0.08 + penalty * 0.02))
+
+    new_interval = np.select(
+        [~correct, repetitions == 0, repetitions == 1],
+        [0.0, 1.0, 6.0],
+        default=interval_days * new_ease,
+    )
+    new_repetitions = np.where(correct, repetitions + 1, 0)
+    due_in = np.where(correct, new_interval * SECONDS_PER_DAY, RELEARN_MINUTES * 60.0)
+    return new_ease, new_interval, new_repetitions, due_in
+
+
+def review_one(ease, interval_days, repetitions, correct):
+    """review для одного слова: возвращает обычные числа Python."""
+    new_ease, new_interval, new_repetitions, due_in = review(ease, interval_days, repetitions, correct)
+    return float(new_ease), float(new_interval), int(new_repetitions), float(due_in)
+
+
+def spread_overdue(due_at, now, per_day):
+    """Распределяет просроченные слова по дням, не больше per_day в день.
+
+    due_at и now - время в секундах (Unix). Порядок просроченных слов
+    сохраняется: самые давние попадают в первый день. Возвращает новый
+    массив due_at.
+    """
+    due_at = np.asarray(due_at, dtype=np.float64)
+    result = due_at.copy()
+    overdue = np.flatnonzero(due_at <= now)
+    if overdue.size <= per_day:
+        return result
+
+    order = overdue[np.argsort(due_at[overdue], kind='stable')]
+    day = np.arange(order.size) // per_day
+    # Внутри дня слова идут с небольшим шагом, чтобы не совпадать по времени
+    slot = np.arange(order.size) % per_day
+    result[order] = now + day * SECONDS_PER_DAY + slot
+    return result
@@ -0,0 +1,289 @@
+import atexit
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from user_state import UserState
+
+logger = logging.getLogger(__name__)
+
+WRITE_THROUGH = 'write_through'
+WRITE_BEHIND = 'write_behind'
+
+
+class UserStateCache:
+    """LRU/TTL-кэш состояний пользователей перед таблицей users.
+
+    Чтения обслуживаются из памяти, поэтому повторные get_user_state в
+    рамках одного сообщения не ходят в БД. Режим записи задается mode:
+
+    - write_through: состояние сразу пишется в БД (как раньше), кэш
+      только экономит чтения;
+    - write_behind: состояние обновляется в памяти, а фоновый поток раз в
+      flush_interval секунд записывает все изменения одним запросом.
+      При падении процесса теряются изменения не старше flush_interval.
+      Если пакет не записался, строки пишутся по одной; состояние, которое
+      max_retries раз не записалось, хотя другие записались, отбрасывается
+      с ошибкой в логе. Если не записалась ни одна строка (БД недоступна),
+      все они ждут следующей записи.
+
+    Кэш рассчитан на один процесс бота: другие процессы, меняющие
+    users.state_mode/state_data напрямую, увидят свои изменения только после ttl.
+    """
+
+    def __init__(self, database, mode=WRITE_BEHIND, max_size=10000, ttl=600.0,
+                 flush_interval=1.0, max_batch=500, max_retries=3):
+        if mode not in (WRITE_THROUGH, WRITE_BEHIND):
+            raise ValueError(f"Неизвестный режим кэша состояний: {mode}")
+
+        self.database = database
+        self.mode = mode
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        # Сериализует записи в БД, чтобы старый пакет не перезаписал более новое состояние
+        self._flush_lock = threading.Lock()
+        self._cache = OrderedDict()  # user_id -> (время загрузки, state)
+        self._dirty = {}  # user_id -> (state, время первого изменения)
+        self._inflight = {}  # пакет, который сейчас записывается в БД
+        self._failures = {}  # user_id -> сколько раз подряд его состояние не записалось
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._stopped = False
+
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._flushes = 0
+        self._flushed_rows = 0
+        self._flush_errors = 0
+        self._dropped = 0
+        self._last_flush_lag = 0.0
+        self._max_flush_lag = 0.0
+
+    def get(self, user_id):
+        """Возвращает состояние пользователя (копию UserState)."""
+        now = time.monotonic()
+        state = self._cached(user_id, now)
+        if state is None:
+            state = self._loaded(user_id, self.database.get_user_state(user_id), now)
+        return copy.deepcopy(state)
+
+    def _cached(self, user_id, now):
+        """Состояние из памяти (несохраненное или загруженное не раньше ttl) или None."""
+        with self._lock:
+            pending = self._dirty.get(user_id) or self._inflight.get(user_id)
+            if pending is not None:
+                self._hits += 1
+                return pending[0]
+
+            entry = self._cache.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._cache.move_to_end(user_id)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+        return None
+
+    def _loaded(self, user_id, state, loaded_at):
+        with self._lock:
+            # Пока шел запрос, состояние могли изменить - не затираем его
+            if user_id not in self._dirty and user_id not in self._inflight:
+                self._store(user_id, state, loaded_at)
+        return state
+
+    def set(self, user_id, state_data):
+        """Сохраняет состояние пользователя."""
+        state = copy.deepcopy(state_data)
+        now = time.monotonic()
+
+        if self.mode == WRITE_THROUGH:
+            return self._written(user_id, state, now, self.database.set_user_state(user_id, state))
+
+        with self._lock:
+            self._writes += 1
+            self._store(user_id, state, now)
+            pending = self._dirty.get(user_id)
+            self._dirty[user_id] = (state, pending[1] if pending else now)
+            dirty_count = len(self._dirty)
+
+        self._ensure_flusher()
+        if dirty_count >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def clear(self, user_id):
+        """Очищает состояние пользователя."""
+        return self.set(user_id, UserState())
+
+    def invalidate(self, user_id):
+        """Удаляет пользователя из кэша, предварительно сохранив несохраненное состояние."""
+        self.flush_user(user_id)
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def _written(self, user_id, state, now, success):
+        """Учитывает запись write_through: в кэше остается только то, что есть в БД."""
+        with self._lock:
+            self._writes += 1
+            if success:
+                self._store(user_id, state, now)
+            else:
+                self._cache.pop(user_id, None)
+        return success
+
+    def _store(self, user_id, state, loaded_at):
+        self._cache[user_id] = (loaded_at, state)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='user-state-flusher', daemon=True)
+                self._flusher.start()
+                atexit.register(self.stop)
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush_user(self, user_id):
+        """Синхронно записывает в БД несохраненное состояние одного пользователя."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._dirty.pop(user_id, None)
+            if pending is None:
+                return True
+            self._write_batch({user_id: pending})
+        return True
+
+    def flush(self):
+        """Записывает в БД все несохраненные состояния одним пакетом."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return True
+                batch, self._dirty = self._dirty, {}
+            return self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        # Вызывается под _flush_lock
+        with self._lock:
+            self._inflight = batch
+        failed = {}
+        isolated = False
+        if not self._write_states(batch):
+            if len(batch) > 1:
+                # Одна плохая строка не должна держать весь пакет: пишем по одной
+                failed = {user_id: pending for user_id, pending in batch.items()
+                          if not self._write_states({user_id: pending})}
+                isolated = len(failed) < len(batch)
+            else:
+                failed = batch
+        now = time.monotonic()
+
+        with self._lock:
+            self._inflight = {}
+            written = [since for user_id, (_, since) in batch.items() if user_id not in failed]
+            if written:
+                lag = now - min(written)
+                self._flushes += 1
+                self._flushed_rows += len(written)
+                self._last_flush_lag = lag
+                self._max_flush_lag = max(self._max_flush_lag, lag)
+            for user_id in batch:
+                if user_id not in failed:
+                    self._failures.pop(user_id, None)
+            if failed:
+                self._flush_errors += 1
+            for user_id, pending in failed.items():
+                failures = self._failures.get(user_id, 0) + isolated
+                if failures >= self.max_retries:
+                    logger.error("Состояние пользователя не записано после %s попыток и отброшено",
+                                 failures, extra={'user_id': user_id})
+                    self._failures.pop(user_id, None)
+                    self._dropped += 1
+                    # Кэш не должен отдавать состояние, которого нет в БД
+                    if user_id not in self._dirty:
+                        self._cache.pop(user_id, None)
+                    continue
+                self._failures[user_id] = failures
+                # Возвращаем неудавшиеся записи, если их не успели заменить новыми
+                self._dirty.setdefault(user_id, pending)
+        return not failed
+
+    def _write_states(self, batch):
+        return self.database.set_user_states({user_id: state for user_id, (state, _) in batch.items()})
+
+    def stop(self):
+        """Останавливает фоновую запись и сохраняет все изменения."""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self):
+        """Возвращает метрики кэша."""
+        now = time.monotonic()
+        with self._lock:
+            lookups = self._hits + self._misses
+            oldest = min((since for _, since in self._dirty.values()), default=None)
+            return {
+                'mode': self.mode,
+                'size': len(self._cache),
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'writes': self._writes,
+                'pending': len(self._dirty),
+                'pending_age_ms': (now - oldest) * 1000 if oldest is not None else 0.0,
+                'flushes': self._flushes,
+                'flushed_rows': self._flushed_rows,
+                'flush_errors': self._flush_errors,
+                'dropped': self._dropped,
+                'last_flush_lag_ms': self._last_flush_lag * 1000,
+                'max_flush_lag_ms': self._max_flush_lag * 1000,
+            }
+
+
+class AsyncUserStateCache(UserStateCache):
+    """UserStateCache для asyncio (async_main.py): database - AsyncPostgreSQLDatabase.
+
+    Только write_through: get/set/clear - корутины, изменение ждет записи
+    в БД, но не занимает поток; чтения обслуживаются из памяти.
+    """
+
+    def __init__(self, database, max_size=10000, ttl=600.0):
+        super().__init__(database, mode=WRITE_THROUGH, max_size=max_size, ttl=ttl)
+
+    async def get(self, user_id):
+        """Возвращает состояние пользователя (копию UserState)."""
+        now = time.monotonic()
+        state = self._cached(user_id, now)
+        if state is None:
+            state = self._loaded(user_id, await self.database.get_user_state(user_id), now)
+        return copy.deepcopy(state)
+
+    async def set(self, user_id, state_data):
+        """Сохраняет состояние пользователя."""
+        state = copy.deepcopy(state_data)
+        now = time.monotonic()
+        return self._written(user_id, state, now, await self.database.set_user_state(user_id, state))
+
+    async def clear(self, user_id):
+        """Очищает состояние пользователя."""
+        return await self.set(user_id, UserState())
+
+    def stop(self):
+        """Несохраненных состояний нет: запись идет сразу в set."""
@@ -0,0 +1,250 @@
+import abc
+import itertools
+import os
+import random
+import re
+from datetime import timedelta
+
+# Файл с базовым словарем, общий для всех хранилищ
+INITIAL_DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'initial_data.sql')
+
+# Слабые слова (Storage.get_weak_words, подмешиваются в prefetch_questions):
+# не меньше WEAK_MIN_ANSWERS ответов по сводкам, доля верных ниже
+# WEAK_ACCURACY и (при выборе вопросов) последний ответ не ближе WEAK_REST
+# секунд
+WEAK_MIN_ANSWERS = 3
+WEAK_ACCURACY = 0.7
+WEAK_REST = 600
+# То же условие для строки s таблицы word_answer_stats (PostgreSQL и SQLite)
+WEAK_WORD_CONDITION = (
+    f"s.answers >= {WEAK_MIN_ANSWERS} AND s.correct < s.answers * {WEAK_ACCURACY}"
+    " AND EXISTS (SELECT 1 FROM user_deck d WHERE d.user_id = s.user_id AND d.word_id = s.word_id)"
+)
+
+# Ответы дольше этого не входят в среднее время ответа: пользователь отвлекся
+# (так же в функции rollup_answers, answer_log.sql)
+MAX_LATENCY_MS = 300_000
+
+_WORD_PAIR = re.compile(r"\(\s*'((?:[^']|'')*)'\s*,\s*'((?:[^']|'')*)'\s*\)")
+
+
+class Storage(abc.ABC):
+    """Интерфейс хранилища, которым пользуются обработчики бота.
+
+    Реализации выбираются по схеме DATABASE_URL (см. open_storage):
+    PostgreSQLDatabase, SQLiteDatabase и MemoryDatabase. Методы PostgreSQL
+    - методы класса, у остальных хранилищ - методы экземпляра; вызываются
+    они одинаково (экземпляр PostgreSQLDatabase не создается, поэтому
+    полноту его реализации abc не проверяет). Ошибки хранилища не
+    пробрасываются: методы пишут их в лог и возвращают значение "по
+    умолчанию", как указано ниже.
+
+    word_change_listeners - функции вида f(user_id), которые вызываются
+    после изменения словаря пользователя (у каждой реализации свой список).
+    """
+    word_change_listeners = []
+
+    @abc.abstractmethod
+    def check_and_init_database(self):
+        """Создает схему и базовый словарь, если их еще нет."""
+
+    @abc.abstractmethod
+    def register_user(self, user_id, username, first_name):
+        """Создает или обновляет пользователя. Возвращает True/False."""
+
+    @abc.abstractmethod
+    def prefetch_questions(self, user_id, count, exclude=()):
+        """До count следующих вопросов [(word_id, вопрос, ответ, 4 варианта)] за один запрос.
+
+        Сначала слова к повторению по порядку, затем слабые слова по сводкам
+        ответов (не больше половины), затем случайные слова словаря; word_id
+        из exclude пропускаются, если без них хватает слов.
+        """
+
+    @abc.abstractmethod
+    def get_distractors(self):
+        """Индекс похожих слов для неверных вариантов ответа (DistractorIndex)."""
+
+    @abc.abstractmethod
+    def record_answer(self, user_id, word_id, was_correct):
+        """Записывает ответ на слово: серия дней пользователя, счетчики и SM-2 слова. Возвращает True/False."""
+
+    @abc.abstractmethod
+    def log_answers(self, rows):
+        """Добавляет в журнал answers пачку [(user_id, word_id, correct, latency_ms, answered_at)].
+
+        answered_at - секунды Unix, latency_ms может быть None. Пачка
+        пишется одной операцией (COPY/executemany). Возвращает True/False.
+        """
+
+    @abc.abstractmethod
+    def rollup_answers(self, max_rows=50000):
+        """Учитывает новые строки журнала answers в сводках по пользователям и словам.
+
+        Обрабатывается не больше max_rows строк за вызов. Возвращает число
+        учтенных ответов (0 при ошибке).
+        """
+
+    @abc.abstractmethod
+    def get_weak_words(self, user_id, limit=3):
+        """Слабые слова словаря по сводкам [(english_word, russian_translation, answers, correct)]."""
+
+    @abc.abstractmethod
+    def reschedule_deck(self, user_id, per_day=50):
+        """Распределяет просроченные слова по дням. Возвращает число измененных слов."""
+
+    @abc.abstractmethod
+    def get_user_words(self, user_id):
+        """Все слова пользователя [(word_id, english_word, russian_translation)] по алфавиту."""
+
+    @abc.abstractmethod
+    def get_user_words_page(self, user_id, after_word=None, limit=10):
+        """Страница слов пользователя по алфавиту после after_word."""
+
+    @abc.abstractmethod
+    def add_word_to_db(self, user_id, english_word, russian_translation):
+        """Добавляет слово в словарь пользователя. Возвращает True/False."""
+
+    @abc.abstractmethod
+    def import_words(self, user_id, rows):
+        """Массовое добавление пар (english_word, russian_translation): (staged, inserted) или None."""
+
+    @abc.abstractmethod
+    def delete_word_from_user(self, user_id, word_id):
+        """Убирает слово из словаря пользователя. Возвращает True/False."""
+
+    @abc.abstractmethod
+    def get_word_count(self, user_id):
+        """Количество слов в словаре пользователя."""
+
+    @abc.abstractmethod
+    def get_stats(self, user_id):
+        """Словарь статистики (см. PostgreSQLDatabase.get_stats) или None."""
+
+    @abc.abstractmethod
+    def set_user_state(self, user_id, state):
+        """Записывает UserState. Режим без полей не перезаписывает state_data."""
+
+    @abc.abstractmethod
+    def set_user_states(self, states):
+        """Записывает состояния {user_id: UserState} за одну операцию."""
+
+    @abc.abstractmethod
+    def get_user_state(self, user_id):
+        """Состояние пользователя (UserState, режим IDLE если его нет)."""
+
+    @abc.abstractmethod
+    def clear_user_state(self, user_id):
+        """Очищает состояние пользователя (режим IDLE)."""
+
+    @abc.abstractmethod
+    def pool_stats(self):
+        """Метрики соединений/очередей хранилища (словарь чисел)."""
+
+    @abc.abstractmethod
+    def close_pool(self):
+        """Освобождает ресурсы хранилища при остановке бота."""
+
+
+def storage_scheme(url):
+    """Схема DATABASE_URL в нижнем регистре ('' для строки libpq "host=... dbname=...")."""
+    return url.split('://', 1)[0].lower() if '://' in url else ''
+
+
+def open_storage(url):
+    """Возвращает хранилище для DATABASE_URL.
+
+    sqlite:///path/to/file.db - SQLiteDatabase (относительный путь) или
+    sqlite:////abs/path.db; memory:// - MemoryDatabase; все остальное
+    (postgresql://..., строка "host=... dbname=...") - PostgreSQLDatabase.
+    """
+    scheme = storage_scheme(url)
+
+    if scheme == 'sqlite':
+        from sqlite_database import SQLiteDatabase
+        path = url.split('://', 1)[1]
+        return SQLiteDatabase(path[1:] if path.startswith('/') else path)
+    if scheme == 'memory':
+        from memory_database import MemoryDatabase
+        return MemoryDatabase()
+
+    from database import PostgreSQLDatabase
+    return PostgreSQLDatabase
+
+
+def load_base_words(filename=INITIAL_DATA_FILE):
+    """Читает пары (english_word, russian_translation) базового словаря из initial_data.sql."""
+    with open(filename, encoding='utf-8') as file:
+        text = file.read()
+    return [(en.replace("''", "'"), ru.replace("''", "'")) for en, ru in _WORD_PAIR.findall(text)]
+
+
+def next_streak(last_studied_on, streak_days, today):
+    """Серия дней после занятия today (как в record_answer.sql)."""
+    if last_studied_on == today:
+        return streak_days
+    if last_studied_on == today - timedelta(days=1):
+        return streak_days + 1
+    return 1
+
+
+def visible_streak(last_studied_on, streak_days, today):
+    """Серия для /stats: если вчера и сегодня занятий не было, она прервана."""
+    if last_studied_on is not None and last_studied_on >= today - timedelta(days=1):
+        return streak_days
+    return 0
+
+
+def pad_options(options):
+    """Дополняет варианты ответа заглушками до 4 и перемешивает их."""
+    options = list(options)
+    while len(options) < 4:
+        options.append(f"word_{len(options)}")
+    random.shuffle(options)
+    return options
+
+
+def choose_options(word_id, english_word, random_words, distractors=None):
+    """Четыре варианта ответа: english_word, похожие на него слова и случайные.
+
+    distractors - функция f(word_id, english_word) из DistractorIndex.chooser
+    или None; недостающие варианты берутся из random_words.
+    """
+    options = [english_word]
+    if distractors is not None:
+        options += distractors(word_id, english_word)
+    for word in random_words:
+        if len(options) >= 4:
+            break
+        if word not in options:
+            options.append(word)
+    return pad_options(options)
+
+
+def build_questions(due_rows, sampled_rows, count, exclude=(), distractors=None, weak_rows=()):
+    """Собирает вопросы для prefetch_questions из строк (word_id, english_word, russian_translation).
+
+    due_rows - слова к повторению в порядке очереди, weak_rows - слабые
+    слова (занимают не больше половины вопросов, чтобы урок не состоял
+    из одних ошибок), sampled_rows - случайные слова словаря; из них же
+    берутся неверные варианты ответа, если distractors не подобрал похожих.
+    """
+    exclude = set(exclude)
+    targets = []
+    seen = set()
+    weak_rows = list(weak_rows)[:max(1, count // 2)]
+    for row in itertools.chain(due_rows, weak_rows, sampled_rows):
+        if len(targets) < count and row[0] not in exclude and row[0] not in seen:
+            seen.add(row[0])
+            targets.append(row)
+    if not targets and exclude:
+        # Маленький словарь целиком в exclude: лучше повторить слово, чем остановить урок
+        return build_questions(due_rows, sampled_rows, count, distractors=distractors, weak_rows=weak_rows)
+
+    random_words = [row[1] for row in sampled_rows]
+    questions = []
+    for word_id, english_word, russian_translation in targets:
+        options = choose_options(word_id, english_word,
+                                 random.sample(random_words, min(4, len(random_words))), distractors)
+        questions.append((word_id, russian_translation, english_word, options))
+    return questions
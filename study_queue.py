@@ -0,0 +1,226 @@
+import asyncio
+import itertools
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class StudyQueue:
+    """Очередь следующих вопросов для каждого изучающего пользователя.
+
+    Вопросы (word_id, вопрос, ответ, варианты) загружаются пачками по size
+    штук одним запросом (loader = Storage.prefetch_questions). Когда в
+    очереди остается low_water вопросов или меньше, она пополняется в
+    фоне, так что следующий вопрос обычно берется из памяти. Очередь
+    сбрасывается при изменении словаря (invalidate); результат загрузки,
+    начатой до сброса, отбрасывается. Хранятся очереди не больше max_users
+    пользователей: давно не занимавшиеся вытесняются первыми.
+
+    Ответы записываются в том же пуле потоков (recorder =
+    Storage.record_answer), обработчик их не ждет.
+    """
+
+    def __init__(self, loader, recorder, size=5, low_water=2, max_users=1000, workers=2):
+        # loader(user_id, count, exclude) -> [(word_id, question, answer, options), ...]
+        self._loader = loader
+        # recorder(user_id, word_id, was_correct) -> True/False
+        self._recorder = recorder
+        self.size = size
+        self.low_water = low_water
+        self.max_users = max_users
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='study-prefetch') if workers else None
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> [очередь вопросов, недавно показанные word_id]
+        self._loading = {}  # user_id -> номер актуальной загрузки
+        self._seq = itertools.count()
+        self._counters = {'hits': 0, 'misses': 0, 'refills': 0, 'evictions': 0, 'record_errors': 0}
+
+    def _entry(self, user_id):
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = [deque(), deque(maxlen=self.size)]
+            while len(self._users) > self.max_users:
+                evicted, _ = self._users.popitem(last=False)
+                self._loading.pop(evicted, None)
+                self._counters['evictions'] += 1
+        else:
+            self._users.move_to_end(user_id)
+        return entry
+
+    def _start_load(self, user_id, entry):
+        """Номер загрузки и word_id, которые не нужно повторять (под self._lock)."""
+        seq = self._loading[user_id] = next(self._seq)
+        exclude = [question[0] for question in entry[0]]
+        exclude.extend(entry[1])
+        return seq, exclude
+
+    def _finish_load(self, user_id, seq, questions):
+        """Кладет загруженные вопросы в очередь, если загрузку не отменили (под self._lock)."""
+        if self._loading.get(user_id) != seq:
+            return False
+        del self._loading[user_id]
+        entry = self._users.get(user_id)
+        if entry is None:
+            return False
+        queued = {question[0] for question in entry[0]}
+        entry[0].extend(question for question in questions if question[0] not in queued)
+        return True
+
+    def _load(self, user_id, count, exclude):
+        try:
+            return self._loader(user_id, count, exclude)
+        except Exception as e:
+            logger.error("Ошибка при загрузке вопросов: %s", e)
+            return []
+
+    def pop(self, user_id):
+        """Следующий вопрос (word_id, вопрос, ответ, варианты) или None, если словарь пуст."""
+        question, load = self._take(user_id)
+        if question is None:
+            # Очередь пуста: первый вопрос нужен сейчас, остальные кладутся в очередь
+            seq, exclude = load
+            question = self._first(user_id, seq, self._load(user_id, self.size, exclude))
+            if question is None:
+                return None
+
+        refill = self._shown(user_id, question)
+        if refill is not None:
+            self._executor.submit(self._refill, user_id, *refill)
+        return question
+
+    def _take(self, user_id):
+        """Вопрос из очереди или (None, (seq, exclude)) - загрузка, которую нужно выполнить сейчас."""
+        with self._lock:
+            entry = self._entry(user_id)
+            if entry[0]:
+                self._counters['hits'] += 1
+                return entry[0].popleft(), None
+            self._counters['misses'] += 1
+            return None, self._start_load(user_id, entry)
+
+    def _first(self, user_id, seq, questions):
+        """Первый из загруженных сейчас вопросов; остальные кладутся в очередь."""
+        with self._lock:
+            if not questions:
+                if self._loading.get(user_id) == seq:
+                    del self._loading[user_id]
+                return None
+            self._finish_load(user_id, seq, questions[1:])
+        return questions[0]
+
+    def _shown(self, user_id, question):
+        """Запоминает показанный вопрос. Возвращает (seq, count, exclude), если очередь пора пополнить."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            entry[1].append(question[0])
+            if len(entry[0]) > self.low_water or user_id in self._loading:
+                return None
+            seq, exclude = self._start_load(user_id, entry)
+            self._counters['refills'] += 1
+            return seq, self.size - len(entry[0]), exclude
+
+    def _refill(self, user_id, seq, count, exclude):
+        questions = self._load(user_id, count, exclude)
+        with self._lock:
+            self._finish_load(user_id, seq, questions)
+
+    def record_answer(self, user_id, word_id, was_correct):
+        """Записывает ответ в фоне."""
+        self._executor.submit(self._record, user_id, word_id, was_correct)
+
+    def _record(self, user_id, word_id, was_correct):
+        try:
+            ok = self._recorder(user_id, word_id, was_correct)
+        except Exception as e:
+            logger.error("Ошибка при записи ответа: %s", e)
+            ok = False
+        if not ok:
+            self._record_failed()
+
+    def _record_failed(self):
+        with self._lock:
+            self._counters['record_errors'] += 1
+
+    def invalidate(self, user_id):
+        """Сбрасывает очередь пользователя и отменяет ее загрузку."""
+        with self._lock:
+            self._users.pop(user_id, None)
+            self._loading.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['users'] = len(self._users)
+            stats['queued'] = sum(len(entry[0]) for entry in self._users.values())
+        return stats
+
+    def stop(self):
+        """Дожидается фоновых загрузок и записи ответов."""
+        self._executor.shutdown(wait=True)
+
+
+class AsyncStudyQueue(StudyQueue):
+    """StudyQueue для asyncio (async_main.py).
+
+    loader и recorder - корутины (AsyncPostgreSQLDatabase); пополнение
+    очереди и запись ответов выполняются задачами цикла событий, а не в
+    пуле потоков. Учет очередей и отмена загрузок - общие со StudyQueue.
+    """
+
+    def __init__(self, loader, recorder, size=5, low_water=2, max_users=1000):
+        super().__init__(loader, recorder, size=size, low_water=low_water, max_users=max_users, workers=0)
+        self._tasks = set()  # фоновые задачи, чтобы их не собрал сборщик мусора
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, user_id, count, exclude):
+        try:
+            return await self._loader(user_id, count, exclude)
+        except Exception as e:
+            logger.error("Ошибка при загрузке вопросов: %s", e)
+            return []
+
+    async def pop(self, user_id):
+        """Следующий вопрос (word_id, вопрос, ответ, варианты) или None, если словарь пуст."""
+        question, load = self._take(user_id)
+        if question is None:
+            seq, exclude = load
+            question = self._first(user_id, seq, await self._load(user_id, self.size, exclude))
+            if question is None:
+                return None
+
+        refill = self._shown(user_id, question)
+        if refill is not None:
+            self._spawn(self._refill(user_id, *refill))
+        return question
+
+    async def _refill(self, user_id, seq, count, exclude):
+        questions = await self._load(user_id, count, exclude)
+        with self._lock:
+            self._finish_load(user_id, seq, questions)
+
+    def record_answer(self, user_id, word_id, was_correct):
+        """Записывает ответ в фоне (вызывается из цикла событий)."""
+        self._spawn(self._record(user_id, word_id, was_correct))
+
+    async def _record(self, user_id, word_id, was_correct):
+        try:
+            ok = await self._recorder(user_id, word_id, was_correct)
+        except Exception as e:
+            logger.error("Ошибка при записи ответа: %s", e)
+            ok = False
+        if not ok:
+            self._record_failed()
+
+    async def stop(self):
+        """Дожидается фоновых загрузок и записи ответов."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,160 @@
+"""Готовые тексты сообщений и клавиатуры.
+
+Статические клавиатуры собираются и сериализуются в JSON один раз при
+импорте; TeleBot передает строку reply_markup в Bot API как есть, без
+повторного построения объектов и json.dumps на каждое сообщение.
+Клавиатуры изучения и удаления собираются из кортежей прямо в JSON, без
+объектов KeyboardButton/InlineKeyboardButton. Формат совпадает с
+ReplyKeyboardMarkup.to_json()/InlineKeyboardMarkup.to_json() (проверяется
+в benchmarks/bench_keyboards.py).
+"""
+import functools
+import json
+
+import config
+
+# Сколько разных наборов вариантов ответа хранится в кэше клавиатур изучения
+STUDY_KEYBOARD_CACHE_SIZE = getattr(config, 'STUDY_KEYBOARD_CACHE_SIZE', 4096)
+
+CANCEL_STUDY_BUTTON = "❌ Отменить изучение"
+CANCEL_BUTTON = "❌ Отмена"
+
+WELCOME_TEXT = """🎓 <b>Привет! Я бот для изучения английских слов!</b>
+
+<b>Доступные команды:</b>
+/start - Начать работу с ботом
+/study - 🎯 Начать изучение слов
+/add_word - ➕ Добавить новое слово
+/delete_word - 🗑️ Удалить слово из списка
+/import - 📥 Загрузить слова из CSV/TSV файла
+/stats - 📊 Показать статистику
+
+<b>Просто выбери команду из меню или введи ее вручную!</b>"""
+
+CANCELLED_TEXT = ("✅ <b>Операция отменена</b>\n"
+                  "Выберите новую команду:")
+ADD_WORD_PROMPT_TEXT = ("📝 <b>Введите слово на английском:</b>\n"
+                        "<i>Или нажмите '❌ Отмена' для отмены</i>")
+IMPORT_PROMPT_TEXT = ("📥 <b>Отправьте файл CSV или TSV</b>\n"
+                      "Каждая строка: <code>слово,перевод</code>\n"
+                      "<i>Например:</i> <code>cat,кот</code>")
+EMPTY_DECK_TEXT = ("📭 <b>Ваш словарь пуст!</b>\n"
+                   "Добавьте слова с помощью /add_word")
+EMPTY_LIST_TEXT = "📭 <b>Ваш словарь пуст.</b>"
+EMPTY_STATS_TEXT = ("📭 <b>Ваш словарь пуст.</b>\n"
+                    "Добавьте слова с помощью /add_word")
+IMPORT_WAITING_TEXT = "📎 <b>Отправьте файл CSV/TSV документом</b> или нажмите '❌ Отмена'"
+IMPORT_NOT_STARTED_TEXT = "📎 <b>Чтобы загрузить слова из файла, сначала отправьте /import</b>"
+IMPORT_FAILED_TEXT = ("❌ <b>Не удалось импортировать файл.</b>\n"
+                      "Проверьте формат и попробуйте снова: /import")
+NOT_UNDERSTOOD_TEXT = ("🤔 <b>Не понимаю команду</b>\n"
+                       "Используйте /start для просмотра доступных команд")
+CORRECT_ANSWER_TEXT = "✅ <b>Правильно! Отлично!</b> 🎉"
+INVALID_WORD_TEXT = ("❌ <b>Слово должно содержать только буквы!</b>\n"
+                     "Попробуйте еще раз:")
+ADD_WORD_LOST_TEXT = ("❌ <b>Ошибка процесса добавления.</b>\n"
+                      "Начните заново с /add_word")
+ADD_WORD_FAILED_TEXT = ("❌ <b>Произошла ошибка при добавлении слова.</b>\n"
+                        "Возможно, такое слово уже существует.")
+DELETE_PROMPT_TEXT = "🗑️ <b>Выберите слово для удаления:</b>"
+WORD_DELETED_TEXT = "✅ <b>Слово удалено.</b>\nНажмите /delete_word для управления другими словами."
+WORD_DELETED_ALERT = "✅ Слово удалено!"
+WORD_NOT_DELETED_ALERT = "❌ Не удалось удалить слово."
+
+# Ответы, которые отменяют текущую операцию (в нижнем регистре)
+CANCEL_TEXTS = frozenset(['отмена', 'отменить', 'cancel', CANCEL_STUDY_BUTTON.lower(), CANCEL_BUTTON.lower()])
+
+
+def reply_keyboard(rows, one_time=False):
+    """JSON ReplyKeyboardMarkup(resize_keyboard=True) из строк кнопок [[текст, ...], ...]."""
+    markup = {'keyboard': [[{'text': text} for text in row] for row in rows]}
+    if one_time:
+        markup['one_time_keyboard'] = True
+    markup['resize_keyboard'] = True
+    return json.dumps(markup)
+
+
+def inline_keyboard(rows):
+    """JSON InlineKeyboardMarkup из строк кнопок [[(текст, callback_data), ...], ...]."""
+    return json.dumps({'inline_keyboard': [[{'text': text, 'callback_data': data} for text, data in row]
+                                           for row in rows]})
+
+
+MAIN_MENU_KEYBOARD = reply_keyboard([["/study", "/add_word"], ["/stats", "/delete_word"]])
+CANCEL_KEYBOARD = reply_keyboard([[CANCEL_BUTTON]])
+
+
+@functools.lru_cache(maxsize=STUDY_KEYBOARD_CACHE_SIZE)
+def study_keyboard(options):
+    """Клавиатура вопроса для кортежа вариантов: по 2 в ряд и кнопка отмены."""
+    rows = [options[i:i + 2] for i in range(0, len(options), 2)]
+    rows.append((CANCEL_STUDY_BUTTON,))
+    return reply_keyboard(rows, one_time=True)
+
+
+def question_text(question):
+    return f"<b>Как переводится слово</b> 🔤 <code>{question}</code>?"
+
+
+def wrong_answer_text(correct_answer):
+    return f"❌ <b>Неправильно.</b> Правильный ответ: <code>{correct_answer}</code>"
+
+
+def translation_prompt_text(english_word):
+    return (f"🌍 <b>Отлично! Слово:</b> <code>{english_word}</code>\n"
+            "<b>Теперь введите перевод на русский:</b>")
+
+
+def word_added_text(english_word, words_count):
+    return (f"✅ <b>Слово '{english_word}' успешно добавлено!</b>\n"
+            f"📊 <b>Теперь вы изучаете {words_count} слов.</b>")
+
+
+def import_done_text(staged, inserted, rejected, words_count):
+    return (f"✅ <b>Импорт завершен!</b>\n"
+            f"➕ Добавлено: {inserted}\n"
+            f"🔁 Дубликатов: {staged - inserted}\n"
+            f"⚠️ Отклонено строк: {rejected}\n"
+            f"📊 <b>Теперь вы изучаете {words_count} слов.</b>")
+
+
+def delete_keyboard(page, words, has_next):
+    """Клавиатура страницы слов для удаления с кнопками перехода (JSON)."""
+    rows = []
+    for word_id, en_word, ru_translation in words:
+        callback_data = f"delete_{word_id}"
+        # Ограничиваем длину текста кнопки
+        button_text = f"❌ {en_word} - {ru_translation}"
+        if len(button_text) > 40:
+            button_text = f"❌ {en_word} - {ru_translation[:15]}..."
+        rows.append([(button_text, callback_data)])
+
+    navigation = []
+    if page > 0:
+        navigation.append(("⬅️ Назад", f"delpage_{page - 1}"))
+    if has_next:
+        navigation.append(("Вперед ➡️", f"delpage_{page + 1}"))
+    if navigation:
+        rows.append(navigation)
+
+    return inline_keyboard(rows)
+
+
+def stats_text(stats, weak_words):
+    """Текст /stats по словарю Storage.get_stats и списку Storage.get_weak_words."""
+    lines = [f"📊 <b>Вы изучаете {stats['word_count']} слов.</b>"]
+    if stats['answers_total']:
+        lines.append(f"🎯 Верных ответов: {stats['answers_correct']} из {stats['answers_total']} "
+                     f"({stats['accuracy']:.0%})")
+    if stats['best_streak_days']:
+        lines.append(f"🔥 Серия: {stats['streak_days']} дн. (рекорд: {stats['best_streak_days']})")
+    if stats['due_count']:
+        lines.append(f"⏰ Пора повторить: {stats['due_count']}")
+    if stats['avg_latency_ms']:
+        lines.append(f"⏱ Среднее время ответа: {stats['avg_latency_ms'] / 1000:.1f} с")
+    if weak_words:
+        lines.append("🧩 Чаще всего ошибки в словах:")
+        lines.extend(f"• <code>{english_word}</code> - {russian_translation} ({correct} из {answers})"
+                     for english_word, russian_translation, answers, correct in weak_words)
+    lines.append("Начните изучение: /study")
+    return "\n".join(lines)
@@ -0,0 +1,206 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Ограничение частоты обновлений от одного пользователя (token bucket):
+# в среднем RATE_LIMIT_PER_SECOND обновлений в секунду, подряд не больше
+# RATE_LIMIT_BURST
+RATE_LIMIT_PER_SECOND = getattr(config, 'RATE_LIMIT_PER_SECOND', 2.0)
+RATE_LIMIT_BURST = getattr(config, 'RATE_LIMIT_BURST', 5)
+RATE_LIMIT_MAX_USERS = getattr(config, 'RATE_LIMIT_MAX_USERS', 10000)
+
+# Окно, в котором повторная доставка того же сообщения или callback
+# отбрасывается, и сколько идентификаторов в нем помнится
+DEDUP_WINDOW = getattr(config, 'DEDUP_WINDOW', 60.0)
+DEDUP_MAX_SIZE = getattr(config, 'DEDUP_MAX_SIZE', 50000)
+# Повторные нажатия одной и той же inline-кнопки (delete_*, delpage_*)
+# за это время объединяются в одно
+CALLBACK_MERGE_WINDOW = getattr(config, 'CALLBACK_MERGE_WINDOW', 2.0)
+
+
+class TokenBucketLimiter:
+    """Token bucket на каждого пользователя с ограниченным числом корзин.
+
+    Корзина пополняется на rate токенов в секунду до burst; каждое
+    обновление забирает токен. Хранится не больше max_users корзин: давно
+    не писавшие пользователи вытесняются первыми (их корзина все равно
+    была бы полной).
+    """
+
+    def __init__(self, rate=2.0, burst=5, max_users=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # user_id -> [токены, время пополнения]
+
+    def allow(self, user_id, now=None):
+        """Забирает токен пользователя; False, если корзина пуста."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = [float(self.burst), now]
+                while len(self._buckets) > self.max_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RecentKeys:
+    """Ключи, встреченные за последние window секунд (не больше max_size)."""
+
+    def __init__(self, window=60.0, max_size=50000):
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._seen = OrderedDict()  # key -> время, по возрастанию
+
+    def check_and_add(self, key, now=None):
+        """True, если key уже встречался в окне; иначе запоминает его."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Устаревшие ключи лежат в начале: время добавления только растет
+            while self._seen:
+                oldest_key, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.window:
+                    break
+                del self._seen[oldest_key]
+
+            if key in self._seen:
+                return True
+            self._seen[key] = now
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+            return False
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class UpdateFilter:
+    """Отбрасывает лишние обновления до того, как они дойдут до БД.
+
+    - повторно доставленные сообщения (тот же chat_id и message_id) и
+      callback-запросы (тот же id);
+    - повторные нажатия одной и той же inline-кнопки за
+      CALLBACK_MERGE_WINDOW секунд: удаление слова выполнится один раз;
+    - обновления сверх лимита частоты пользователя.
+
+    Отброшенные обновления считаются в stats() по причинам.
+    """
+
+    def __init__(self, limiter=None, recent_ids=None, recent_callbacks=None):
+        self.limiter = limiter or TokenBucketLimiter(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, RATE_LIMIT_MAX_USERS)
+        self.recent_ids = recent_ids or RecentKeys(DEDUP_WINDOW, DEDUP_MAX_SIZE)
+        self.recent_callbacks = recent_callbacks or RecentKeys(CALLBACK_MERGE_WINDOW, DEDUP_MAX_SIZE)
+        self._lock = threading.Lock()
+        self._counters = {'passed': 0, 'duplicate': 0, 'merged': 0, 'rate_limited': 0}
+
+    def _count(self, reason):
+        with self._lock:
+            self._counters[reason] += 1
+        if reason != 'passed':
+            logger.debug("Обновление отброшено", extra={'reason': reason})
+        return reason
+
+    def check_message(self, message):
+        """'passed' или причина, по которой сообщение нужно отбросить."""
+        if self.recent_ids.check_and_add(('message', message.chat.id, message.message_id)):
+            return self._count('duplicate')
+        if not self.limiter.allow(message.from_user.id):
+            return self._count('rate_limited')
+        return self._count('passed')
+
+    def check_callback(self, call):
+        """'passed' или причина, по которой callback нужно отбросить."""
+        if self.recent_ids.check_and_add(('callback', call.id)):
+            return self._count('duplicate')
+        if self.recent_callbacks.check_and_add((call.from_user.id, call.data)):
+            return self._count('merged')
+        if not self.limiter.allow(call.from_user.id):
+            return self._count('rate_limited')
+        return self._count('passed')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['tracked_users'] = len(self.limiter)
+        stats['tracked_ids'] = len(self.recent_ids)
+        return stats
+
+
+def _answer_dropped(outbox, call):
+    """Пустой ответ на отброшенный callback, чтобы у кнопки не висели часики."""
+    if outbox is not None:
+        outbox.answer_callback_query(call.id, chat_id=call.message.chat.id if call.message else None)
+
+
+def make_middleware(update_filter, outbox=None):
+    """Middleware для TeleBot(use_class_middlewares=True).
+
+    На отброшенные callback-запросы отвечает через outbox (OutboundSender).
+    """
+    from telebot.handler_backends import BaseMiddleware, CancelUpdate
+
+    class UpdateFilterMiddleware(BaseMiddleware):
+        update_sensitive = True
+        update_types = ['message', 'callback_query']
+
+        def pre_process_message(self, message, data):
+            if update_filter.check_message(message) != 'passed':
+                return CancelUpdate()
+
+        def post_process_message(self, message, data, exception):
+            pass
+
+        def pre_process_callback_query(self, call, data):
+            if update_filter.check_callback(call) != 'passed':
+                _answer_dropped(outbox, call)
+                return CancelUpdate()
+
+        def post_process_callback_query(self, call, data, exception):
+            pass
+
+    return UpdateFilterMiddleware()
+
+
+def make_async_middleware(update_filter, outbox=None):
+    """Middleware для AsyncTeleBot (outbox - как в make_middleware)."""
+    from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+
+    class AsyncUpdateFilterMiddleware(BaseMiddleware):
+        update_sensitive = True
+        update_types = ['message', 'callback_query']
+
+        async def pre_process_message(self, message, data):
+            if update_filter.check_message(message) != 'passed':
+                return CancelUpdate()
+
+        async def post_process_message(self, message, data, exception):
+            pass
+
+        async def pre_process_callback_query(self, call, data):
+            if update_filter.check_callback(call) != 'passed':
+                _answer_dropped(outbox, call)
+                return CancelUpdate()
+
+        async def post_process_callback_query(self, call, data, exception):
+            pass
+
+    return AsyncUpdateFilterMiddleware()
@@ -0,0 +1,118 @@
+"""Состояние диалога пользователя: режим и поля текущего шага.
+
+Режим хранится в users.state_mode (SMALLINT), поля - в users.state_data
+(BYTEA/BLOB) в компактном двоичном виде: только поля текущего режима, по
+порядку MODE_FIELDS, word_id - int32, asked_at - int64, строки - длина
+uint16 и UTF-8 (строка длиннее MAX_STRING_BYTES байт обрезается по границе
+символа). Новые поля добавляются в конец режима: в данных, записанных
+до их появления, они получают значения по умолчанию.
+Режимам без полей (IDLE, ADD_WORD_STEP1, IMPORT) двоичные данные не нужны:
+при переходе в них пишется только state_mode, а state_data не трогается и
+при чтении игнорируется.
+"""
+import enum
+import struct
+
+_INT = struct.Struct('<i')
+_LONG = struct.Struct('<q')
+_LENGTH = struct.Struct('<H')
+_NO_WORD = -1
+# Больше не помещается в длину uint16
+MAX_STRING_BYTES = 0xFFFF
+
+
+class Mode(enum.IntEnum):
+    IDLE = 0
+    STUDY = 1
+    ADD_WORD_STEP1 = 2
+    ADD_WORD_STEP2 = 3
+    IMPORT = 4
+
+
+_MODES = tuple(Mode)
+
+# Поля каждого режима в порядке записи в state_data
+MODE_FIELDS = {
+    Mode.STUDY: ('word_id', 'question', 'correct_answer', 'asked_at'),
+    Mode.ADD_WORD_STEP2: ('english_word',),
+}
+_INT_FIELDS = {'word_id': _INT, 'asked_at': _LONG}
+
+
+class UserState:
+    __slots__ = ('mode', 'word_id', 'question', 'correct_answer', 'english_word', 'asked_at')
+
+    def __init__(self, mode=Mode.IDLE, word_id=None, question='', correct_answer='', english_word='',
+                 asked_at=0):
+        self.mode = mode
+        self.word_id = word_id
+        self.question = question
+        self.correct_answer = correct_answer
+        self.english_word = english_word
+        # Время показа вопроса в миллисекундах Unix (0 - неизвестно)
+        self.asked_at = asked_at
+
+    def encode_data(self):
+        """Двоичные поля текущего режима или None, если у режима их нет."""
+        fields = MODE_FIELDS.get(self.mode)
+        if fields is None:
+            return None
+        parts = []
+        for field in fields:
+            value = getattr(self, field)
+            if field in _INT_FIELDS:
+                parts.append(_INT_FIELDS[field].pack(_NO_WORD if value is None else value))
+            else:
+                encoded = value.encode('utf-8')
+                if len(encoded) > MAX_STRING_BYTES:
+                    encoded = encoded[:MAX_STRING_BYTES].decode('utf-8', 'ignore').encode('utf-8')
+                parts.append(_LENGTH.pack(len(encoded)))
+                parts.append(encoded)
+        return b''.join(parts)
+
+    @classmethod
+    def decode(cls, mode, data):
+        """Состояние из столбцов state_mode и state_data."""
+        mode = mode or 0
+        if not 0 <= mode < len(_MODES):
+            return cls()
+        mode = _MODES[mode]
+        fields = MODE_FIELDS.get(mode)
+        if fields is None or not data:
+            return cls(mode)
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        values = {}
+        offset = 0
+        for field in fields:
+            if offset >= len(data):
+                break
+            if field in _INT_FIELDS:
+                packer = _INT_FIELDS[field]
+                value, = packer.unpack_from(data, offset)
+                offset += packer.size
+                values[field] = None if value == _NO_WORD else value
+            else:
+                length, = _LENGTH.unpack_from(data, offset)
+                offset += _LENGTH.size
+                values[field] = data[offset:offset + length].decode('utf-8')
+                offset += length
+        return cls(mode, **values)
+
+    def copy(self):
+        return UserState(self.mode, self.word_id, self.question, self.correct_answer, self.english_word,
+                         self.asked_at)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __eq__(self, other):
+        if not isinstance(other, UserState):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}={getattr(self, field)!r}' for field in MODE_FIELDS.get(self.mode, ()))
+        return f'UserState({self.mode.name}{", " if fields else ""}{fields})'
@@ -0,0 +1,19 @@
+-- Миграция 5: состояние диалога в двоичном виде (см. user_state.py).
+-- Режим - SMALLINT state_mode, поля текущего шага - BYTEA state_data.
+-- Из старого JSON переносятся режимы без полей; незаконченные изучение и
+-- добавление слова начинаются заново. Функция study_turn работала с JSON
+-- и заменена prefetch_questions/record_answer (миграция 4).
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS state_mode SMALLINT NOT NULL DEFAULT 0;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS state_data BYTEA;
+
+UPDATE users
+SET state_mode = CASE user_state::JSONB->>'mode'
+                     WHEN 'add_word_step1' THEN 2
+                     WHEN 'import' THEN 4
+                     ELSE 0
+                 END
+WHERE user_state LIKE '%"mode"%';
+
+DROP FUNCTION IF EXISTS study_turn(BIGINT, TEXT, INTEGER[]);
+ALTER TABLE users DROP COLUMN IF EXISTS user_state;
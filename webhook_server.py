@@ -0,0 +1,200 @@
+import hmac
+import json
+import logging
+import queue
+import threading
+import time
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+
+logger = logging.getLogger(__name__)
+
+# Поля обновления, в которых Telegram передает отправителя
+_USER_FIELDS = ('message', 'edited_message', 'callback_query', 'inline_query',
+                'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def get_update_user_id(update):
+    """Возвращает id отправителя из JSON обновления (0, если его нет)."""
+    for field in _USER_FIELDS:
+        payload = update.get(field)
+        if payload:
+            sender = payload.get('from') or payload.get('user') or {}
+            return sender.get('id', 0)
+    return 0
+
+
+class UpdateDispatcher:
+    """Ограниченная очередь обновлений и фиксированный пул воркеров.
+
+    У каждого воркера своя очередь, обновление попадает в очередь
+    user_id % workers, поэтому обновления одного пользователя обрабатываются
+    строго по порядку. Если очередь заполнена, submit ждет не дольше
+    put_timeout и возвращает False - вызывающий код должен ответить
+    Telegram ошибкой, чтобы тот повторил доставку позже.
+    """
+
+    def __init__(self, handler, workers=4, queue_size=1000, put_timeout=1.0):
+        self.handler = handler
+        self.put_timeout = put_timeout
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self._accepted = 0
+        self._rejected = 0
+        self._processed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._handle_total = 0.0
+        self._handle_max = 0.0
+
+    def start(self):
+        for index, update_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker, args=(update_queue,),
+                                      name=f'update-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, update):
+        """Ставит JSON обновления в очередь. Возвращает False при переполнении."""
+        update_queue = self._queues[get_update_user_id(update) % len(self._queues)]
+        try:
+            update_queue.put((time.monotonic(), update), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._accepted += 1
+        return True
+
+    def _worker(self, update_queue):
+        while True:
+            item = update_queue.get()
+            if item is None:
+                update_queue.task_done()
+                return
+
+            enqueued_at, update = item
+            started = time.monotonic()
+            failed = False
+            try:
+                self.handler(update)
+            except Exception as e:
+                failed = True
+                logger.exception("Ошибка при обработке обновления %s: %s", update.get('update_id'), e)
+            finished = time.monotonic()
+            update_queue.task_done()
+
+            with self._lock:
+                self._processed += 1
+                self._failed += failed
+                wait_time = started - enqueued_at
+                handle_time = finished - started
+                self._wait_total += wait_time
+                self._wait_max = max(self._wait_max, wait_time)
+                self._handle_total += handle_time
+                self._handle_max = max(self._handle_max, handle_time)
+
+    def join(self):
+        """Ждет обработки всех поставленных в очередь обновлений."""
+        for update_queue in self._queues:
+            update_queue.join()
+
+    def stop(self):
+        for update_queue in self._queues:
+            update_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        """Возвращает глубину очередей и задержки обработки."""
+        depths = [update_queue.qsize() for update_queue in self._queues]
+        with self._lock:
+            processed = self._processed
+            return {
+                'workers': len(self._queues),
+                'queue_depth': sum(depths),
+                'queue_depth_max': max(depths),
+                'accepted': self._accepted,
+                'rejected': self._rejected,
+                'processed': processed,
+                'failed': self._failed,
+                'wait_avg_ms': (self._wait_total / processed * 1000) if processed else 0.0,
+                'wait_max_ms': self._wait_max * 1000,
+                'handle_avg_ms': (self._handle_total / processed * 1000) if processed else 0.0,
+                'handle_max_ms': self._handle_max * 1000,
+            }
+
+
+def make_webhook_app(dispatcher, path='/webhook', secret_token=None):
+    """Создает WSGI-приложение, принимающее обновления от Telegram.
+
+    POST {path} - обновление в JSON; GET /stats - метрики диспетчера.
+    """
+
+    def app(environ, start_response):
+        method = environ['REQUEST_METHOD']
+        request_path = environ.get('PATH_INFO', '')
+
+        if method == 'GET' and request_path == '/stats':
+            body = json.dumps(dispatcher.stats()).encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'application/json'),
+                                      ('Content-Length', str(len(body)))])
+            return [body]
+
+        if method != 'POST' or request_path != path:
+            start_response('404 Not Found', [('Content-Length', '0')])
+            return [b'']
+
+        if secret_token is not None:
+            received = environ.get('HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN', '')
+            if not hmac.compare_digest(received, secret_token):
+                start_response('403 Forbidden', [('Content-Length', '0')])
+                return [b'']
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            update = json.loads(environ['wsgi.input'].read(length))
+        except ValueError:
+            start_response('400 Bad Request', [('Content-Length', '0')])
+            return [b'']
+
+        if not dispatcher.submit(update):
+            # Telegram повторит доставку обновления позже
+            start_response('503 Service Unavailable', [('Retry-After', '1'), ('Content-Length', '0')])
+            return [b'']
+
+        start_response('200 OK', [('Content-Length', '0')])
+        return [b'']
+
+    return app
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def make_webhook_server(app, host='0.0.0.0', port=8443):
+    return make_server(host, port, app, server_class=_ThreadingWSGIServer, handler_class=_QuietRequestHandler)
+
+
+def telebot_update_handler(bot):
+    """Возвращает обработчик, передающий JSON обновления в зарегистрированные обработчики бота."""
+    from telebot.types import Update
+
+    # Параллелизм и порядок обеспечивает UpdateDispatcher
+    bot.threaded = False
+
+    def handle(update):
+        bot.process_new_updates([Update.de_json(update)])
+
+    return handle
@@ -0,0 +1,99 @@
+import csv
+import io
+
+# Заголовки первой колонки, которые не считаются словами
+HEADER_WORDS = {'english', 'english_word', 'слово', 'английский'}
+
+
+def is_valid_english_word(word):
+    """Слово должно содержать только буквы и пробелы (как при /add_word)."""
+    return bool(word) and all(c.isalpha() or c.isspace() for c in word)
+
+
+def detect_delimiter(first_line, filename=''):
+    if filename.lower().endswith('.tsv') or '\t' in first_line:
+        return '\t'
+    if ';' in first_line and ',' not in first_line:
+        return ';'
+    return ','
+
+
+class ImportStats:
+    def __init__(self):
+        self.parsed = 0
+        self.rejected = 0
+
+
+def iter_word_rows(text_stream, stats, filename=''):
+    """Построчно разбирает CSV/TSV с парами "английское слово, перевод".
+
+    Файл не загружается в память целиком. Некорректные строки
+    пропускаются и учитываются в stats.rejected.
+    """
+    first_line = text_stream.readline()
+    if not first_line:
+        return
+
+    delimiter = detect_delimiter(first_line, filename)
+    lines = _chain_first_line(first_line, text_stream)
+
+    for line_number, row in enumerate(csv.reader(lines, delimiter=delimiter)):
+        if not row or not any(cell.strip() for cell in row):
+            continue  # пустые строки не считаются ошибкой
+
+        if line_number == 0 and row[0].strip().lower() in HEADER_WORDS:
+            continue
+
+        if len(row) < 2:
+            stats.rejected += 1
+            continue
+
+        english_word = row[0].strip().lower()
+        russian_translation = row[1].strip()
+        if not is_valid_english_word(english_word) or not russian_translation:
+            stats.rejected += 1
+            continue
+
+        stats.parsed += 1
+        yield english_word, russian_translation
+
+
+def _chain_first_line(first_line, text_stream):
+    yield first_line
+    yield from text_stream
+
+
+def _copy_escape(value):
+    if value is None:
+        return '\\N'
+    if not isinstance(value, str):
+        return str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class CopyRowStream(io.RawIOBase):
+    """Файлоподобный объект для COPY ... FROM STDIN из итератора строк.
+
+    Строки кодируются в текстовый формат COPY по мере чтения, поэтому
+    весь файл импорта никогда не находится в памяти.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            row = next(self._rows, None)
+            if row is None:
+                return 0
+            self._buffer = ('\t'.join(_copy_escape(value) for value in row) + '\n').encode('utf-8')
+
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
@@ -0,0 +1,84 @@
+import itertools
+import threading
+from collections import OrderedDict
+
+
+class WordPageCache:
+    """Кэш страниц словаря пользователя для клавиатуры /delete_word.
+
+    Страницы загружаются по ключу (keyset): следующая страница начинается
+    после последнего слова предыдущей, поэтому в кэше хранятся только
+    страницы, которые пользователь уже открывал, подряд начиная с первой.
+    При изменении словаря страницы пользователя сбрасываются (invalidate);
+    страница, загрузка которой началась до сброса, в кэш не попадает.
+    """
+
+    def __init__(self, loader, page_size=10, max_users=1000):
+        # loader(user_id, after_word, limit) -> [(word_id, english_word, russian_translation), ...]
+        self._loader = loader
+        self.page_size = page_size
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()  # user_id -> [(words, has_next), ...]
+        self._loading = {}  # user_id -> номер актуальной загрузки
+        self._seq = itertools.count()
+
+    def get_page(self, user_id, page):
+        """Возвращает (page, words, has_next).
+
+        Если страница недоступна (словарь изменился или номер слишком
+        большой), возвращается первая страница.
+        """
+        cached, page, after_word, seq = self._lookup(user_id, page)
+        if cached is not None:
+            return cached
+        return self._store(user_id, page, seq, self._loader(user_id, after_word, self.page_size + 1))
+
+    def _lookup(self, user_id, page):
+        """(страница из кэша или None, номер страницы, after_word, номер загрузки)."""
+        with self._lock:
+            pages = self._pages.get(user_id, [])
+            if user_id in self._pages:
+                self._pages.move_to_end(user_id)
+            if 0 <= page < len(pages):
+                words, has_next = pages[page]
+                return (page, words, has_next), page, None, None
+            if page <= 0 or page != len(pages) or not pages[-1][1]:
+                page = 0
+                pages = []
+            after_word = pages[-1][0][-1][1] if pages else None
+            seq = self._loading[user_id] = next(self._seq)
+        return None, page, after_word, seq
+
+    def _store(self, user_id, page, seq, rows):
+        """Кладет загруженную страницу в кэш. Возвращает (page, words, has_next)."""
+        words, has_next = rows[:self.page_size], len(rows) > self.page_size
+
+        with self._lock:
+            # Пока шел запрос, кэш могли сбросить (словарь изменился) или заполнить
+            if self._loading.get(user_id) != seq:
+                return page, words, has_next
+            del self._loading[user_id]
+            cached = self._pages.setdefault(user_id, [])
+            if len(cached) == page:
+                cached.append((words, has_next))
+            self._pages.move_to_end(user_id)
+            while len(self._pages) > self.max_users:
+                self._pages.popitem(last=False)
+        return page, words, has_next
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._pages.pop(user_id, None)
+            self._loading.pop(user_id, None)
+
+
+class AsyncWordPageCache(WordPageCache):
+    """WordPageCache для asyncio: loader - корутина (AsyncPostgreSQLDatabase.get_user_words_page)."""
+
+    async def get_page(self, user_id, page):
+        """Возвращает (page, words, has_next), см. WordPageCache.get_page."""
+        cached, page, after_word, seq = self._lookup(user_id, page)
+        if cached is not None:
+            return cached
+        return self._store(user_id, page, seq, await self._loader(user_id, after_word, self.page_size + 1))
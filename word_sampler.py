@@ -0,0 +1,109 @@
+import itertools
+import random
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class WordSampler:
+    """Выбирает случайные слова пользователя без ORDER BY RANDOM().
+
+    Для каждого активного пользователя в памяти хранится компактный массив
+    word_id его словаря. Массив загружается из БД один раз (loader) и
+    сбрасывается при изменении словаря, поэтому выбор k случайных слов
+    стоит O(k) и не зависит от размера словаря. Множество тех же word_id
+    для проверки принадлежности (get_word_set) строится при первом запросе
+    и сбрасывается вместе с массивом. Загрузка, во время которой словарь
+    сбросили (invalidate), возвращает результат, но в кэш его не кладет.
+
+    Без loader словарь загружает вызывающий (AsyncPostgreSQLDatabase):
+    peek, затем begin_load и finish_load с результатом запроса.
+    """
+
+    def __init__(self, loader, max_users=1000, ttl=300.0):
+        self._loader = loader
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # user_id -> [время загрузки, array, frozenset или None]
+        self._loading = {}  # user_id -> номер актуальной загрузки
+        self._seq = itertools.count()
+
+    def get_word_ids(self, user_id):
+        """Возвращает массив word_id пользователя, загружая его при необходимости."""
+        word_ids = self.peek(user_id)
+        if word_ids is not None:
+            return word_ids
+        seq = self.begin_load(user_id)
+        return self.finish_load(user_id, seq, self._loader(user_id))
+
+    def begin_load(self, user_id):
+        """Отмечает начало загрузки словаря; номер загрузки передается в finish_load."""
+        with self._lock:
+            seq = self._loading[user_id] = next(self._seq)
+        return seq
+
+    def finish_load(self, user_id, seq, word_ids):
+        """Кладет загруженный словарь в кэш, если его не сбросили во время загрузки. Возвращает массив."""
+        word_ids = array('i', word_ids)
+        with self._lock:
+            if self._loading.get(user_id) == seq:
+                del self._loading[user_id]
+                self._store(user_id, word_ids)
+        return word_ids
+
+    def peek(self, user_id):
+        """Возвращает закэшированный массив word_id или None, не обращаясь к БД."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._cache.move_to_end(user_id)
+                return entry[1]
+        return None
+
+    def get_word_set(self, user_id, word_ids=None):
+        """Возвращает множество word_id пользователя; строится один раз на загрузку словаря.
+
+        word_ids - уже полученный массив словаря (без обращения к loader).
+        """
+        if word_ids is None:
+            word_ids = self.get_word_ids(user_id)
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None and entry[1] is word_ids and entry[2] is not None:
+                return entry[2]
+        word_set = frozenset(word_ids)
+        with self._lock:
+            entry = self._cache.get(user_id)
+            # Пока строилось множество, словарь могли сбросить или загрузить заново
+            if entry is not None and entry[1] is word_ids:
+                entry[2] = word_set
+        return word_set
+
+    def _store(self, user_id, word_ids):
+        # Вызывается под self._lock
+        self._cache[user_id] = [time.monotonic(), word_ids, None]
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_users:
+            self._cache.popitem(last=False)
+
+    def sample(self, user_id, k):
+        """Возвращает до k различных случайных word_id из словаря пользователя."""
+        return self.sample_from(self.get_word_ids(user_id), k)
+
+    @staticmethod
+    def sample_from(word_ids, k):
+        return random.sample(word_ids, min(k, len(word_ids)))
+
+    def invalidate(self, user_id):
+        """Сбрасывает закэшированный словарь пользователя и отменяет его текущую загрузку."""
+        with self._lock:
+            self._cache.pop(user_id, None)
+            self._loading.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._loading.clear()